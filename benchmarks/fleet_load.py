@@ -0,0 +1,190 @@
+"""
+Load test of the client stack against a simulated fleet (mecom/sim.py) with fault injection.
+Devices are served from a separate process, half on TCP loopback (one endpoint per device) and half on pty serial
+buses. Worker threads read a parameter from the devices round robin at increasing concurrency, reporting
+throughput, latency percentiles, errors and the time from a failed query until the repeated query is answered.
+Run from the repository root:
+python benchmarks/fleet_load.py [--devices 200] [--concurrency 1,4,16,64] [--drop 0.01] [--bad-crc 0.01]
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mecom.mecom import MeComSerial, MeComTcp  # noqa: E402
+from mecom.sim import Faults, PtyEndpoint, SimulatedDevice, TcpEndpoint, lognormal_latency  # noqa: E402
+
+
+def serve_fleet(args, connection):
+    """
+    Child process: start the endpoints, send their description and serve until told to stop.
+    """
+    faults = Faults(latency=lognormal_latency(args.latency / 1000., args.sigma) if args.latency else None,
+                    drop=args.drop, bad_crc=args.bad_crc, wrong_sequence=args.wrong_sequence,
+                    device_busy=args.busy)
+    devices = [SimulatedDevice(address=1 + i % 254, faults=faults, seed=i, values={1000: 20. + i % 10})
+               for i in range(args.devices)]
+    tcp_devices = devices[:int(len(devices) * args.tcp)]
+    serial_devices = devices[len(tcp_devices):]
+
+    endpoints, description = [], []
+    for device in tcp_devices:
+        endpoint = TcpEndpoint(device)
+        endpoints.append(endpoint)
+        description.append(("tcp", endpoint.port, [device.address]))
+    for start in range(0, len(serial_devices), args.bus_size):
+        bus = serial_devices[start:start + args.bus_size]
+        endpoint = PtyEndpoint(bus)
+        endpoints.append(endpoint)
+        description.append(("pty", endpoint.port, [device.address for device in bus]))
+    connection.send(description)
+
+    connection.recv()
+    statistics = {}
+    for device in devices:
+        for key, value in device.statistics().items():
+            statistics[key] = statistics.get(key, 0) + value
+    connection.send(statistics)
+    for endpoint in endpoints:
+        endpoint.close()
+
+
+class Stats(object):
+    """
+    Results of one concurrency level, updated by all worker threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = {}
+        # seconds from the start of the first failed query until the device answered
+        self.recoveries = []
+        # devices which did not answer within the retries
+        self.lost = 0
+
+    def success(self, latency, recovery=None):
+        with self.lock:
+            self.latencies.append(latency)
+            if recovery is not None:
+                self.recoveries.append(recovery)
+
+    def failure(self, error):
+        with self.lock:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_level(targets, threads, duration, retries=3):
+    """
+    :param targets: [(mc, address)]
+    :param threads: int
+    :param duration: float: seconds
+    :param retries: int: repetitions of a failed query
+    :return: (Stats, float): results and the elapsed time
+    """
+    stats = Stats()
+    cycle = itertools.cycle(targets)
+    cycle_lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def worker():
+        while time.monotonic() < stop:
+            with cycle_lock:
+                mc, address = next(cycle)
+            failed = None
+            # a failed query is repeated right away like a client would, until the device answers again
+            for _ in range(retries + 1):
+                start = time.perf_counter()
+                try:
+                    mc.get_parameter(parameter_id=1000, address=address)
+                except Exception as ex:
+                    stats.failure(type(ex).__name__)
+                    failed = start if failed is None else failed
+                    continue
+                now = time.perf_counter()
+                stats.success(now - start, None if failed is None else now - failed)
+                break
+            else:
+                with stats.lock:
+                    stats.lost += 1
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.monotonic()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return stats, time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--tcp", type=float, default=0.5, help="fraction of devices on TCP, the rest on pty buses")
+    parser.add_argument("--bus-size", type=int, default=10, help="devices per pty bus")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32,64", help="comma separated thread counts")
+    parser.add_argument("--duration", type=float, default=5., help="seconds per concurrency level")
+    parser.add_argument("--timeout", type=float, default=0.2, help="client timeout in seconds")
+    parser.add_argument("--retries", type=int, default=3, help="repetitions of a failed query")
+    parser.add_argument("--latency", type=float, default=1., help="median device latency in ms, 0 for none")
+    parser.add_argument("--sigma", type=float, default=0.5, help="spread of the lognormal latency")
+    parser.add_argument("--drop", type=float, default=0.)
+    parser.add_argument("--bad-crc", type=float, default=0.)
+    parser.add_argument("--wrong-sequence", type=float, default=0.)
+    parser.add_argument("--busy", type=float, default=0., help="probability of device error 2 (device busy)")
+    args = parser.parse_args()
+
+    parent, child = multiprocessing.Pipe()
+    simulator = multiprocessing.Process(target=serve_fleet, args=(args, child), daemon=True)
+    simulator.start()
+    description = parent.recv()
+
+    clients, targets = [], []
+    for kind, port, addresses in description:
+        if kind == "tcp":
+            mc = MeComTcp("127.0.0.1", port, timeout=args.timeout)
+        else:
+            mc = MeComSerial(port, timeout=args.timeout)
+        clients.append(mc)
+        targets.extend((mc, address) for address in addresses)
+    tcp_endpoints = sum(kind == "tcp" for kind, _, _ in description)
+    print("{} devices on {} TCP endpoints and {} pty buses, faults: drop {} crc {} sequence {} busy {}".format(
+        len(targets), tcp_endpoints, len(description) - tcp_endpoints, args.drop, args.bad_crc, args.wrong_sequence,
+        args.busy))
+
+    print("{:>7} {:>9} {:>8} {:>8} {:>8} {:>8} {:>8} {:>10} {:>10}".format(
+        "threads", "queries/s", "p50 ms", "p99 ms", "p99.9 ms", "max ms", "errors", "recov p50", "recov max"))
+    for threads in [int(t) for t in args.concurrency.split(",")]:
+        stats, elapsed = run_level(targets, threads, args.duration, args.retries)
+        latencies = sorted(stats.latencies)
+        recoveries = sorted(stats.recoveries)
+        print("{:>7} {:>9.0f} {:>8.2f} {:>8.2f} {:>8.2f} {:>8.2f} {:>8} {:>10.1f} {:>10.1f}".format(
+            threads, len(latencies) / elapsed, percentile(latencies, .5) * 1e3, percentile(latencies, .99) * 1e3,
+            percentile(latencies, .999) * 1e3, (latencies[-1] if latencies else float("nan")) * 1e3,
+            sum(stats.errors.values()), percentile(recoveries, .5) * 1e3,
+            (recoveries[-1] if recoveries else float("nan")) * 1e3))
+        if stats.errors:
+            print("        " + ", ".join("{}: {}".format(k, v) for k, v in sorted(stats.errors.items())))
+        if stats.lost:
+            print("        {} queries failed after {} retries".format(stats.lost, args.retries))
+
+    for mc in clients:
+        mc.stop()
+    parent.send("stop")
+    print("injected by the devices: {}".format(parent.recv()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Measures the startup cost of pyMeCom: importing the package and creating the parameter catalog.
+Every measurement runs in a fresh interpreter, run from the repository root:
+python benchmarks/import_time.py [-n 20]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+SNIPPETS = {
+    "python": "pass",
+    "import mecom": "import mecom",
+    "from mecom import MeComTcp": "from mecom import MeComTcp",
+    "first ParameterList": "from mecom.mecom import ParameterList; ParameterList('TEC').get_by_name('Object Temperature')",
+}
+
+TIMER = """
+import time, sys
+t0 = time.perf_counter()
+{snippet}
+t1 = time.perf_counter()
+print(t1 - t0, int('serial' in sys.modules))
+"""
+
+
+def measure(snippet, repeat):
+    """
+    Run the snippet in a fresh interpreter repeat times.
+    :param snippet: str
+    :param repeat: int
+    :return: ([float], bool): durations in seconds and whether pySerial got imported
+    """
+    durations = []
+    serial_loaded = False
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, "-c", TIMER.format(snippet=snippet)]).decode().split()
+        durations.append(float(out[0]))
+        serial_loaded |= out[1] == "1"
+    return durations, serial_loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print("{:<30} {:>10} {:>10} {:>8}".format("", "median ms", "max ms", "serial"))
+    for name, snippet in SNIPPETS.items():
+        durations, serial_loaded = measure(snippet, args.repeat)
+        print("{:<30} {:>10.3f} {:>10.3f} {:>8}".format(name, statistics.median(durations) * 1e3,
+                                                     max(durations) * 1e3, "yes" if serial_loaded else "no"))
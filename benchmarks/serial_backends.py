@@ -0,0 +1,100 @@
+"""
+Compares the serial backends on simulated devices behind ptys (mecom/sim.py, POSIX only): pySerial and termios with
+one thread per port, and termios with all ports served by SerialMultiplexer from one thread. Reports queries per
+second and the CPU time of the client process per query. Devices are served from a separate process.
+Run from the repository root:
+python benchmarks/serial_backends.py [--ports 1,8,32] [--duration 3]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mecom.mecom import MeComSerial  # noqa: E402
+from mecom.rawserial import SerialMultiplexer  # noqa: E402
+from mecom.sim import Faults, PtyEndpoint, SimulatedDevice  # noqa: E402
+
+PARAMETERS = ["Object Temperature", "Actual Output Current"]
+
+
+def serve(ports, latency, connection):
+    faults = Faults(latency=latency) if latency else None
+    endpoints = [PtyEndpoint(SimulatedDevice(address=1, faults=faults, seed=i)) for i in range(ports)]
+    connection.send([endpoint.port for endpoint in endpoints])
+    connection.recv()
+    for endpoint in endpoints:
+        endpoint.close()
+
+
+def threaded(buses, duration):
+    counts = [0] * len(buses)
+    stop = time.monotonic() + duration
+
+    def worker(i):
+        mc = buses[i]
+        while time.monotonic() < stop:
+            mc.get_parameters(PARAMETERS, address=1)
+            counts[i] += len(PARAMETERS)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(buses))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts)
+
+
+def multiplexed(buses, duration):
+    mux = SerialMultiplexer(buses)
+    targets = [(mc, 1) for mc in buses]
+    count = 0
+    stop = time.monotonic() + duration
+    while time.monotonic() < stop:
+        mux.get_parameters(targets, PARAMETERS)
+        count += len(targets) * len(PARAMETERS)
+    return count
+
+
+def measure(ports, backend, multiplex, duration, latency):
+    parent, child = multiprocessing.Pipe()
+    simulator = multiprocessing.Process(target=serve, args=(ports, latency, child), daemon=True)
+    simulator.start()
+    buses = [MeComSerial(port, timeout=1, backend=backend) for port in parent.recv()]
+    try:
+        # warm up, parses the parameter catalogs
+        for mc in buses:
+            mc.get_parameters(PARAMETERS, address=1)
+        wall, cpu = time.perf_counter(), time.process_time()
+        count = (multiplexed if multiplex else threaded)(buses, duration)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    finally:
+        for mc in buses:
+            mc.stop()
+        parent.send("stop")
+        simulator.join()
+    return count / wall, cpu / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ports", default="1,8,32", help="comma separated numbers of ports")
+    parser.add_argument("--duration", type=float, default=3., help="seconds per measurement")
+    parser.add_argument("--latency", type=float, default=0., help="device latency in ms")
+    args = parser.parse_args()
+
+    print("{:>6} {:<28} {:>10} {:>14}".format("ports", "backend", "queries/s", "cpu us/query"))
+    for ports in [int(p) for p in args.ports.split(",")]:
+        for name, backend, multiplex in (("pyserial, thread per port", "pyserial", False),
+                                         ("termios, thread per port", "termios", False),
+                                         ("termios, multiplexer", "termios", True)):
+            rate, cpu = measure(ports, backend, multiplex, args.duration, args.latency / 1000.)
+            print("{:>6} {:<28} {:>10.0f} {:>14.1f}".format(ports, name, rate, cpu))
+
+
+if __name__ == "__main__":
+    main()
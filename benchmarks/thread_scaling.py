@@ -0,0 +1,103 @@
+"""
+Query throughput of many threads sharing MeComTcp connections to simulated devices (mecom/sim.py), for 1 to 32
+threads and several numbers of connections. Thread i uses connection i % connections, threads of one connection
+take turns on its bus lock. Devices are served from a separate process. On a free-threaded CPython build the
+threads of different connections run in parallel.
+Run from the repository root:
+python benchmarks/thread_scaling.py [--threads 1,2,4,8,16,32] [--connections 1,8,32] [--latency 1]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mecom.mecom import MeComTcp  # noqa: E402
+from mecom.sim import Faults, SimulatedDevice, TcpEndpoint  # noqa: E402
+
+
+def serve(devices, latency, connection):
+    faults = Faults(latency=latency) if latency else None
+    endpoints = [TcpEndpoint(SimulatedDevice(address=1, faults=faults, values={1000: float(i)}))
+                 for i in range(devices)]
+    connection.send([endpoint.port for endpoint in endpoints])
+    connection.recv()
+    for endpoint in endpoints:
+        endpoint.close()
+
+
+def run(clients, threads, duration):
+    """
+    :return: (int, int): number of queries and of wrong values or errors
+    """
+    counts = [0] * threads
+    errors = [0] * threads
+    stop = time.monotonic() + duration
+
+    def worker(i):
+        index = i % len(clients)
+        mc = clients[index]
+        while time.monotonic() < stop:
+            try:
+                # every device answers with its own index, a mixed up response would show here
+                if mc.get_parameter(parameter_id=1000, address=1) != index:
+                    errors[i] += 1
+            except Exception:
+                errors[i] += 1
+            counts[i] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return sum(counts), sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", default="1,2,4,8,16,32", help="comma separated thread counts")
+    parser.add_argument("--connections", default="1,8,32", help="comma separated connection counts")
+    parser.add_argument("--duration", type=float, default=3., help="seconds per measurement")
+    parser.add_argument("--latency", type=float, default=1., help="device latency in ms")
+    args = parser.parse_args()
+    thread_counts = [int(t) for t in args.threads.split(",")]
+    connection_counts = [int(c) for c in args.connections.split(",")]
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print("Python {}, GIL {}, {} CPUs, device latency {} ms".format(
+        sys.version.split()[0], "enabled" if gil else "disabled", os.cpu_count(), args.latency))
+
+    parent, child = multiprocessing.Pipe()
+    simulator = multiprocessing.Process(target=serve, args=(max(connection_counts), args.latency / 1000., child),
+                                        daemon=True)
+    simulator.start()
+    ports = parent.recv()
+    clients = [MeComTcp("127.0.0.1", port, timeout=1) for port in ports]
+    for mc in clients:
+        mc.get_parameter(parameter_id=1000, address=1)
+
+    print("{:>11} ".format("connections") + " ".join("{:>9}".format("{} thr".format(t)) for t in thread_counts)
+          + "   queries/s")
+    try:
+        for connections in connection_counts:
+            rates, failed = [], 0
+            for threads in thread_counts:
+                start = time.perf_counter()
+                count, errors = run(clients[:connections], threads, args.duration)
+                rates.append(count / (time.perf_counter() - start))
+                failed += errors
+            print("{:>11} ".format(connections) + " ".join("{:>9.0f}".format(r) for r in rates)
+                  + ("   {} errors".format(failed) if failed else ""))
+    finally:
+        for mc in clients:
+            mc.stop()
+        parent.send("stop")
+
+
+if __name__ == "__main__":
+    main()
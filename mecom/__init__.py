@@ -1,11 +1,85 @@
 """
-The package consists of 3 files.
+The package consists of the following files.
 
 commands.py contains a dictionary parameters which can be get/set
+catalog.py loads additional parameter definitions from JSON/CSV files
 exceptions.py defines the error thrown by this pockage
 mecom.py contains the communication logic
+priority.py contains the priority aware bus lock
+timing.py learns read timeouts per device address
+negotiate.py negotiates faster serial link settings
+polling.py polls telemetry with intervals adapted to its rate of change
+waveform.py streams setpoint waveforms on a fixed schedule
+shm.py contains shared memory structures for passing samples between processes
+fleet.py polls large device fleets with a pool of processes
+cli.py contains the mecom console tool
+bulk.py decodes buffers of recorded response frames with numpy
+profile.py detects device capabilities and caches them per serial number
+ratelimit.py paces the traffic on a bus with a token bucket
+rules.py evaluates stability and alarm rules incrementally over polled values
+archive.py writes and reads compressed archives of polled values
+rollup.py aggregates polled values into min/max/mean/count rollups
+recorder.py keeps the last hours of samples of a device in a memory mapped circular file
+handle.py contains device handles with one attribute per parameter
+scan.py finds parameters not listed in commands.py by sweeping id ranges
+sim.py simulates devices on TCP loopback and ptys with fault injection
+coalesce.py coalesces parameter writes, the newest pending value wins
+rawserial.py contains the termios serial backend and a single thread multiplexer for many ports
+gpio.py detects edges on the digital inputs of a device
 
+Names exported here are imported on first access, "import mecom" does not load any transport backend.
 """
 
-from .mecom import MeCom, MeComSerial, MeComTcp, VR, VS, Parameter
-from .exceptions import ResponseException, WrongChecksum
+import importlib
+
+# name: submodule which defines it
+_LAZY = {
+    "MeCom": ".mecom",
+    "MeComSerial": ".mecom",
+    "MeComTcp": ".mecom",
+    "VR": ".mecom",
+    "VS": ".mecom",
+    "Parameter": ".mecom",
+    "ResponseException": ".exceptions",
+    "WrongChecksum": ".exceptions",
+    "PriorityLock": ".priority",
+    "PRIORITY_HIGH": ".priority",
+    "PRIORITY_NORMAL": ".priority",
+    "PRIORITY_LOW": ".priority",
+    "decode_vr_frames": ".bulk",
+    "AdaptiveTimeout": ".timing",
+    "AdaptivePoller": ".polling",
+    "WaveformStreamer": ".waveform",
+    "FleetSupervisor": ".fleet",
+    "ValueTablePublisher": ".shm",
+    "ValueTableReader": ".shm",
+    "load_catalog": ".catalog",
+    "DeviceProfile": ".profile",
+    "ProfileCache": ".profile",
+    "RateLimiter": ".ratelimit",
+    "RuleEngine": ".rules",
+    "ArchiveWriter": ".archive",
+    "ArchiveReader": ".archive",
+    "RollupAggregator": ".rollup",
+    "FlightRecorder": ".recorder",
+    "FlightRecorderReader": ".recorder",
+    "scan_parameters": ".scan",
+    "CoalescingWriter": ".coalesce",
+    "SerialMultiplexer": ".rawserial",
+    "GpioMonitor": ".gpio",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    # cache, __getattr__ is only called for missing names
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,385 @@
+"""
+Compressed archive of polled values. Requires numpy.
+
+Samples are stored per series (device, parameter) in blocks of a fixed number of samples, compressed like
+Facebook's Gorilla: timestamps as delta-of-delta of integer ticks, values as XOR with the previous value, both
+with variable length bit codes. A regular 10 Hz temperature reading costs a few bits per sample instead of the
+~20 bytes of a CSV line.
+
+File layout: a header, then records of either a series definition or a block (header + bit stream), and on close
+a block index followed by a footer pointing to it. A file which was not closed is read by scanning the records.
+"""
+
+import json
+import struct
+import time
+
+import numpy as np
+
+from .shm import SAMPLE_OK
+
+_MAGIC = b"MCA1"
+_INDEX_MAGIC = b"MCAX"
+# magic, time resolution in seconds, samples per block
+_HEADER = struct.Struct("<4sdI")
+_RECORD_SERIES = 1
+_RECORD_BLOCK = 2
+# record type, series id, sample count, first tick, last tick, payload bytes
+_BLOCK = struct.Struct("<BIIqqI")
+# record type, series id, label bytes
+_SERIES = struct.Struct("<BII")
+# index offset, magic
+_FOOTER = struct.Struct("<Q4s")
+
+BLOCK_DTYPE = np.dtype([("series", "<u4"), ("count", "<u4"), ("first", "<i8"), ("last", "<i8"),
+                        ("offset", "<u8"), ("size", "<u4")])
+
+_DOUBLE = struct.Struct("<d")
+_UINT64 = struct.Struct("<Q")
+_MASK64 = (1 << 64) - 1
+
+# delta-of-delta buckets: prefix, prefix bits, value bits, smallest value
+_DOD_BUCKETS = ((0b10, 2, 7, -63), (0b110, 3, 9, -255), (0b1110, 4, 12, -2047))
+
+
+class _BitWriter(object):
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value, bits):
+        self._acc = (self._acc << bits) | value
+        self._bits += bits
+        while self._bits >= 8:
+            self._bits -= 8
+            self.buffer.append(self._acc >> self._bits)
+            self._acc &= (1 << self._bits) - 1
+
+    def getvalue(self):
+        if self._bits:
+            return bytes(self.buffer) + bytes([self._acc << (8 - self._bits)])
+        return bytes(self.buffer)
+
+
+class _BitReader(object):
+
+    def __init__(self, data):
+        # padding, reads never run past the end
+        self.data = bytes(data) + bytes(9)
+        self.position = 0
+
+    def bit(self):
+        position = self.position
+        self.position += 1
+        return (self.data[position >> 3] >> (7 - (position & 7))) & 1
+
+    def read(self, bits):
+        position = self.position
+        self.position += bits
+        start = position >> 3
+        end = (position + bits + 7) >> 3
+        chunk = int.from_bytes(self.data[start:end], "big")
+        return (chunk >> ((end << 3) - position - bits)) & ((1 << bits) - 1)
+
+
+class _SeriesEncoder(object):
+    """
+    Compression state of the open block of one series.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def append(self, tick, bits):
+        if self.count == 0:
+            self.writer = _BitWriter()
+            self.first = tick
+            self.writer.write(bits, 64)
+            self._delta = 0
+            self._value = bits
+            self._leading = -1
+            self._trailing = 0
+        else:
+            self._append_tick(tick)
+            self._append_value(bits)
+        self.last = tick
+        self.count += 1
+
+    def _append_tick(self, tick):
+        delta = tick - self.last
+        dod = delta - self._delta
+        self._delta = delta
+        writer = self.writer
+        if dod == 0:
+            writer.write(0, 1)
+            return
+        for prefix, prefix_bits, value_bits, smallest in _DOD_BUCKETS:
+            if smallest <= dod <= smallest + (1 << value_bits) - 1:
+                writer.write(prefix, prefix_bits)
+                writer.write(dod - smallest, value_bits)
+                return
+        writer.write(0b1111, 4)
+        writer.write(dod & _MASK64, 64)
+
+    def _append_value(self, bits):
+        xor = bits ^ self._value
+        self._value = bits
+        writer = self.writer
+        if xor == 0:
+            writer.write(0, 1)
+            return
+        leading = min(64 - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        if self._leading >= 0 and leading >= self._leading and trailing >= self._trailing:
+            # fits into the window of the previous value
+            writer.write(0b10, 2)
+            writer.write(xor >> self._trailing, 64 - self._leading - self._trailing)
+        else:
+            length = 64 - leading - trailing
+            writer.write(0b11, 2)
+            writer.write(leading, 5)
+            writer.write(length - 1, 6)
+            writer.write(xor >> trailing, length)
+            self._leading = leading
+            self._trailing = trailing
+
+
+def _decode_block(payload, count, first):
+    """
+    Decode a block into integer ticks and float values.
+    :return: (np.ndarray of int64, np.ndarray of float64)
+    """
+    ticks = np.empty(count, dtype=np.int64)
+    bits = np.empty(count, dtype=np.uint64)
+    reader = _BitReader(payload)
+    read, bit = reader.read, reader.bit
+
+    tick = first
+    value = read(64)
+    ticks[0] = tick
+    bits[0] = value
+    delta = 0
+    leading, trailing = 0, 0
+    for i in range(1, count):
+        # timestamp
+        if bit():
+            if not bit():
+                dod = read(7) - 63
+            elif not bit():
+                dod = read(9) - 255
+            elif not bit():
+                dod = read(12) - 2047
+            else:
+                dod = read(64)
+                if dod >> 63:
+                    dod -= 1 << 64
+            delta += dod
+        tick += delta
+        ticks[i] = tick
+        # value
+        if bit():
+            if bit():
+                leading = read(5)
+                length = read(6) + 1
+                trailing = 64 - leading - length
+            value ^= read(64 - leading - trailing) << trailing
+        bits[i] = value
+    return ticks, bits.view(np.float64)
+
+
+class ArchiveWriter(object):
+    """
+    Writes polled values into a compressed archive file, e.g.
+    writer.append("ttyUSB0:1", "Object Temperature", mc.get_parameter("Object Temperature", address=1)).
+    Values are stored as float64, INT32 and FLOAT32 parameter values are preserved exactly.
+    """
+
+    def __init__(self, path, block_samples=1024, time_resolution=1e-3):
+        """
+        :param path: str: the file is overwritten
+        :param block_samples: int: samples per block, smaller blocks make time range queries finer
+        :param time_resolution: float: seconds, timestamps are rounded to multiples of it
+        """
+        self.path = path
+        self.block_samples = block_samples
+        self.time_resolution = time_resolution
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(_MAGIC, time_resolution, block_samples))
+        self._series = {}
+        self._encoders = []
+        self._blocks = []
+
+    def _series_id(self, device, parameter):
+        key = (str(device), str(parameter))
+        series_id = self._series.get(key)
+        if series_id is None:
+            series_id = len(self._encoders)
+            self._series[key] = series_id
+            self._encoders.append(_SeriesEncoder())
+            label = json.dumps(key).encode()
+            self._file.write(_SERIES.pack(_RECORD_SERIES, series_id, len(label)) + label)
+        return series_id
+
+    def _write_block(self, series_id):
+        encoder = self._encoders[series_id]
+        payload = encoder.writer.getvalue()
+        offset = self._file.tell()
+        self._file.write(_BLOCK.pack(_RECORD_BLOCK, series_id, encoder.count, encoder.first, encoder.last,
+                                     len(payload)))
+        self._file.write(payload)
+        self._blocks.append((series_id, encoder.count, encoder.first, encoder.last, offset + _BLOCK.size,
+                             len(payload)))
+        encoder.count = 0
+
+    def append(self, device, parameter, value, timestamp=None):
+        """
+        Append one value, timestamps of a series should not decrease.
+        :param device: str or int: device label
+        :param parameter: str: parameter name
+        :param value: int or float, None is stored as nan
+        :param timestamp: float: unix time, defaults to now
+        :return:
+        """
+        series_id = self._series_id(device, parameter)
+        tick = int(round((time.time() if timestamp is None else timestamp) / self.time_resolution))
+        bits, = _UINT64.unpack(_DOUBLE.pack(float("nan") if value is None else value))
+        encoder = self._encoders[series_id]
+        encoder.append(tick, bits)
+        if encoder.count >= self.block_samples:
+            self._write_block(series_id)
+
+    def append_samples(self, samples, devices, parameters):
+        """
+        Append samples as returned by FleetSupervisor.read(), samples which are not ok are stored as nan.
+        :param samples: np.ndarray of SAMPLE_DTYPE
+        :param devices: [str]: labels of the sample device indices
+        :param parameters: [str]: names of the sample parameter indices
+        :return:
+        """
+        values = np.where(samples["status"] == SAMPLE_OK, samples["value"], np.nan)
+        for sample, value in zip(samples, values):
+            self.append(devices[sample["device"]], parameters[sample["parameter"]], float(value),
+                        float(sample["time"]))
+
+    def flush(self):
+        """
+        Write the open blocks of all series, e.g. before another process reads the file.
+        :return:
+        """
+        for series_id, encoder in enumerate(self._encoders):
+            if encoder.count:
+                self._write_block(series_id)
+        self._file.flush()
+
+    def close(self):
+        """
+        Write the open blocks and the block index.
+        :return:
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        offset = self._file.tell()
+        labels = json.dumps([list(key) for key in sorted(self._series, key=self._series.get)]).encode()
+        blocks = np.array(self._blocks, dtype=BLOCK_DTYPE)
+        self._file.write(struct.pack("<I", len(labels)) + labels + blocks.tobytes())
+        self._file.write(_FOOTER.pack(offset, _INDEX_MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ArchiveReader(object):
+    """
+    Reads an archive written by ArchiveWriter, time range queries only decode the blocks overlapping the range.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: str
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._data = f.read()
+        magic, self.time_resolution, self.block_samples = _HEADER.unpack_from(self._data)
+        if magic != _MAGIC:
+            raise ValueError("{} is no mecom archive".format(path))
+
+        offset, magic = _FOOTER.unpack_from(self._data, len(self._data) - _FOOTER.size) \
+            if len(self._data) >= _HEADER.size + _FOOTER.size else (0, None)
+        if magic == _INDEX_MAGIC:
+            length, = struct.unpack_from("<I", self._data, offset)
+            labels = json.loads(self._data[offset + 4:offset + 4 + length].decode())
+            self.series = [tuple(label) for label in labels]
+            end = len(self._data) - _FOOTER.size
+            self.blocks = np.frombuffer(self._data[offset + 4 + length:end], dtype=BLOCK_DTYPE)
+        else:
+            self._scan()
+        self._series_index = {key: i for i, key in enumerate(self.series)}
+
+    def _scan(self):
+        """
+        Rebuild the index of a file which was not closed, a truncated last record is ignored.
+        """
+        series, blocks = {}, []
+        data = self._data
+        offset = _HEADER.size
+        while offset < len(data):
+            record = data[offset]
+            if record == _RECORD_SERIES and offset + _SERIES.size <= len(data):
+                _, series_id, length = _SERIES.unpack_from(data, offset)
+                end = offset + _SERIES.size + length
+                if end > len(data):
+                    break
+                series[series_id] = tuple(json.loads(data[offset + _SERIES.size:end].decode()))
+            elif record == _RECORD_BLOCK and offset + _BLOCK.size <= len(data):
+                _, series_id, count, first, last, size = _BLOCK.unpack_from(data, offset)
+                end = offset + _BLOCK.size + size
+                if end > len(data):
+                    break
+                blocks.append((series_id, count, first, last, offset + _BLOCK.size, size))
+            else:
+                break
+            offset = end
+        self.series = [series[i] for i in range(len(series))]
+        self.blocks = np.array(blocks, dtype=BLOCK_DTYPE)
+
+    def query(self, device, parameter, start=None, end=None):
+        """
+        Returns the samples of a series within [start, end].
+        :param device: str or int: device label
+        :param parameter: str: parameter name
+        :param start: float: unix time, from the first sample if None
+        :param end: float: unix time, up to the last sample if None
+        :return: (np.ndarray, np.ndarray): unix times and values as float64
+        """
+        series_id = self._series_index.get((str(device), str(parameter)))
+        if series_id is None:
+            return np.empty(0), np.empty(0)
+        # the blocks are selected by ticks with some slack, the samples by their decoded times
+        first = -(1 << 62) if start is None else int(np.floor(start / self.time_resolution))
+        last = 1 << 62 if end is None else int(np.ceil(end / self.time_resolution))
+        blocks = self.blocks[(self.blocks["series"] == series_id) & (self.blocks["last"] >= first) &
+                             (self.blocks["first"] <= last)]
+
+        ticks, values = [], []
+        for block in blocks:
+            offset, size = int(block["offset"]), int(block["size"])
+            t, v = _decode_block(self._data[offset:offset + size], int(block["count"]), int(block["first"]))
+            ticks.append(t)
+            values.append(v)
+        if not ticks:
+            return np.empty(0), np.empty(0)
+        times, values = np.concatenate(ticks) * self.time_resolution, np.concatenate(values)
+        selected = np.ones(len(times), dtype=bool)
+        if start is not None:
+            selected &= times >= start
+        if end is not None:
+            selected &= times <= end
+        return times[selected], values[selected]
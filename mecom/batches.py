@@ -0,0 +1,22 @@
+"""
+Vectorized processing of sample batches in which the same cell (device or device and parameter) occurs more than
+once, e.g. the batches read from a SharedSampleRing. Requires numpy.
+"""
+
+import numpy as np
+
+
+def sample_rounds(keys):
+    """
+    Split a batch of samples into rounds in which every key occurs at most once, keeping the order of samples
+    with the same key. Used to feed batches into per cell state with vectorized operations.
+    :param keys: np.ndarray of int: e.g. device indices or device * parameters + parameter
+    :return: [np.ndarray of bool]: one mask per round
+    """
+    if len(keys) == 0:
+        return []
+    order = np.argsort(keys, kind="stable")
+    first = np.searchsorted(keys[order], keys[order])
+    rank = np.empty(len(keys), dtype=np.intp)
+    rank[order] = np.arange(len(keys)) - first
+    return [rank == r for r in range(int(rank.max()) + 1)]
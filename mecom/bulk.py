@@ -0,0 +1,117 @@
+"""
+Vectorized decoding of recorded VR response frames with NumPy.
+
+VRResponse.decompose() handles one frame at a time, this module decodes a whole buffer of frames of the same layout
+at once, e.g. for offline analysis of recorded traffic. Requires numpy (pip install mecom[numpy]).
+"""
+
+import numpy as np
+
+from .mecom import MeFrame, _crc_table
+
+# hex digit -> nibble, 0xFF marks characters which are no hex digits
+_HEX = np.full(256, 0xFF, dtype=np.uint8)
+for _i, _c in enumerate(b"0123456789ABCDEF"):
+    _HEX[_c] = _i
+for _i, _c in enumerate(b"abcdef"):
+    _HEX[_c] = 10 + _i
+
+
+_CRC_TABLE = np.array(_crc_table(), dtype=np.uint16)
+
+_VALUE_TYPES = {"INT32": (">i4", np.int32), "FLOAT32": (">f4", np.float32)}
+
+# !AASSSSVVVVVVVVCCCC\r
+VR_FRAME_LENGTH = 20
+
+
+class DecodedFrames(object):
+    """
+    The result of decode_vr_frames(), every attribute is an array with one entry per decoded frame.
+    """
+
+    def __init__(self, address, sequence, value, crc_valid, frame_index):
+        """
+        :param address: np.ndarray: uint8
+        :param sequence: np.ndarray: uint16
+        :param value: np.ndarray: float32 or int32
+        :param crc_valid: np.ndarray: bool, False for wrong checksums and malformed frames
+        :param frame_index: np.ndarray: position of the frame within all frames of the buffer
+        """
+        self.address = address
+        self.sequence = sequence
+        self.value = value
+        self.crc_valid = crc_valid
+        self.frame_index = frame_index
+
+    def __len__(self):
+        return len(self.value)
+
+
+def _hex_columns(frames, start, stop):
+    """
+    Parse the hex digits frames[:, start:stop] into an unsigned integer per row.
+    :return: (np.ndarray, np.ndarray): values and a bool array which is False for rows with non hex characters
+    """
+    nibbles = _HEX[frames[:, start:stop]]
+    ok = np.all(nibbles != 0xFF, axis=1)
+    result = np.zeros(len(frames), dtype=np.uint32)
+    for column in range(stop - start):
+        result = (result << 4) | (nibbles[:, column] & 0x0F)
+    return result, ok
+
+
+def crc_ccitt(frames):
+    """
+    CRC-CCITT of every row of a 2d uint8 array, equal to MeFrame.CalcCRC_CCITT() of each row.
+    :param frames: np.ndarray: shape (n, length)
+    :return: np.ndarray: uint16
+    """
+    crc = np.zeros(len(frames), dtype=np.uint16)
+    for column in range(frames.shape[1]):
+        crc = (crc << 8) ^ _CRC_TABLE[(crc >> 8) ^ frames[:, column]]
+    return crc
+
+
+def split_frames(buffer, frame_length=VR_FRAME_LENGTH):
+    """
+    Cut a buffer of carriage return terminated frames into a 2d array, frames of a different length (e.g. device
+    errors or ACKs) are skipped.
+    :param buffer: bytes, bytearray, memoryview or np.ndarray of uint8
+    :param frame_length: int: length of a frame including the source byte and the carriage return
+    :return: (np.ndarray, np.ndarray): frames of shape (n, frame_length - 1) without carriage return and the
+    position of every returned frame within all frames of the buffer
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8) if not isinstance(buffer, np.ndarray) else buffer
+    ends = np.flatnonzero(data == ord(MeFrame._EOL))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    frame_index = np.flatnonzero(ends - starts == frame_length - 1)
+    rows = starts[frame_index, np.newaxis] + np.arange(frame_length - 1)
+    return data[rows], frame_index
+
+
+def decode_vr_frames(buffer, response_format, frame_length=VR_FRAME_LENGTH):
+    """
+    Decode a buffer of VR response frames, e.g. b"!0100014194000093A2\\r!010002...", at once.
+    Frames which are not VR responses (other length) are skipped, see DecodedFrames.frame_index.
+    :param buffer: bytes, bytearray, memoryview or np.ndarray of uint8
+    :param response_format: str: 'INT32' or 'FLOAT32', the format of the queried parameter
+    :param frame_length: int: length of a frame including the source byte and the carriage return
+    :return: DecodedFrames
+    """
+    wire_type, native_type = _VALUE_TYPES[response_format]
+    frames, frame_index = split_frames(buffer, frame_length)
+
+    address, address_ok = _hex_columns(frames, 1, 3)
+    sequence, sequence_ok = _hex_columns(frames, 3, 7)
+    raw_value, value_ok = _hex_columns(frames, 7, 15)
+    in_crc, crc_ok = _hex_columns(frames, 15, 19)
+
+    # the value is transmitted as big endian bytes of the int or float
+    value = raw_value.astype(">u4").view(wire_type).astype(native_type)
+
+    crc_valid = (crc_ccitt(frames[:, :15]) == in_crc) & (frames[:, 0] == ord(b"!"))
+    crc_valid &= address_ok & sequence_ok & value_ok & crc_ok
+
+    return DecodedFrames(address=address.astype(np.uint8), sequence=sequence.astype(np.uint16), value=value,
+                         crc_valid=crc_valid, frame_index=frame_index)
@@ -0,0 +1,208 @@
+"""
+Loadable parameter catalogs.
+
+commands.py only holds a selection of the parameters listed in the protocol documents. Additional definitions can
+be loaded from JSON or CSV files and are merged over the built-in parameters of a device family:
+
+JSON: [{"id": 1010, "name": "Target Object Temperature (Ramp)", "format": "FLOAT32"}, ...]
+      or {"parameters": [...]}
+CSV:  a header line "id,name,format" followed by one parameter per line
+
+A definition with the id of a built-in parameter replaces it. The merged catalog is cached in a compact binary
+file, later loads of the same files only unpack the cache.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import struct
+
+from .exceptions import CatalogError
+from .mecom import Parameter, ParameterList
+
+FORMATS = ("INT32", "FLOAT32")
+
+_CACHE_MAGIC = b"MCC1"
+_CACHE_VERSION = 1
+# id, format index, length of the utf-8 encoded name
+_RECORD = struct.Struct("<IBH")
+
+
+def load_definitions(path):
+    """
+    Read parameter definitions from a JSON or CSV file.
+    :param path: str
+    :return: [dict]
+    """
+    with open(path, newline="") as f:
+        if path.lower().endswith(".csv"):
+            definitions = [{"id": row["id"], "name": row["name"], "format": row["format"]}
+                           for row in csv.DictReader(f, skipinitialspace=True)]
+        else:
+            definitions = json.load(f)
+            if isinstance(definitions, dict):
+                definitions = definitions["parameters"]
+
+    result = []
+    for definition in definitions:
+        try:
+            parameter_id = int(definition["id"], 0) if isinstance(definition["id"], str) else int(definition["id"])
+            parameter_format = definition["format"].strip().upper()
+            name = definition["name"]
+        except (KeyError, ValueError, AttributeError) as ex:
+            raise CatalogError("{}: invalid definition {!r}: {}".format(path, definition, ex))
+        if parameter_format not in FORMATS:
+            raise CatalogError("{}: parameter {} has unsupported format {}".format(path, parameter_id,
+                                                                                 parameter_format))
+        if not 0 <= parameter_id <= 0xFFFF:
+            raise CatalogError("{}: parameter id {} out of range".format(path, parameter_id))
+        result.append({"id": parameter_id, "name": name, "format": parameter_format})
+    return result
+
+
+def find_catalog_files(directory, metype, firmware=None):
+    """
+    Returns the catalog files of a device family in a directory, family wide files first:
+    <metype>.json / .csv, then <metype>-<firmware>.json / .csv, e.g. "TEC.json" and "TEC-6.00.csv".
+    :param directory: str
+    :param metype: str
+    :param firmware: str
+    :return: [str]
+    """
+    names = [metype]
+    if firmware is not None:
+        names.append("{}-{}".format(metype, firmware))
+    paths = []
+    for name in names:
+        for extension in (".json", ".csv"):
+            path = os.path.join(directory, name + extension)
+            if os.path.isfile(path):
+                paths.append(path)
+    return paths
+
+
+def merge(base, extra):
+    """
+    Merge parameter definitions, definitions of extra replace those of base with the same id.
+    :param base: [dict]
+    :param extra: [dict]
+    :return: [dict]
+    """
+    merged = {}
+    for definition in base:
+        merged.setdefault(definition["id"], definition)
+    for definition in extra:
+        merged[definition["id"]] = definition
+    return list(merged.values())
+
+
+# metype -> hash of the built-in parameters of commands.py
+_BUILTIN_DIGESTS = {}
+
+
+def _builtin_digest(metype):
+    """
+    Hash of the built-in parameters of a device family, they may change with a new version of this package.
+    """
+    digest = _BUILTIN_DIGESTS.get(metype)
+    if digest is None:
+        key = hashlib.sha1()
+        for parameter in ParameterList(metype):
+            key.update("{}\0{}\0{}\0".format(parameter.id, parameter.name, parameter.format).encode())
+        digest = _BUILTIN_DIGESTS[metype] = key.hexdigest()
+    return digest
+
+
+def _cache_key(metype, paths):
+    """
+    Hash of everything the merged catalog depends on.
+    """
+    key = hashlib.sha1("{}\0{}\0{}".format(_CACHE_VERSION, metype, _builtin_digest(metype)).encode())
+    for path in paths:
+        stat = os.stat(path)
+        key.update("\0{}\0{}\0{}".format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns).encode())
+    return key.hexdigest()[:16]
+
+
+def dump_cache(parameters, path):
+    """
+    Write parameters in the compact binary cache format.
+    :param parameters: [Parameter]
+    :param path: str
+    :return:
+    """
+    chunks = [_CACHE_MAGIC, struct.pack("<I", len(parameters))]
+    for parameter in parameters:
+        name = (parameter.name or "").encode()
+        chunks.append(_RECORD.pack(parameter.id, FORMATS.index(parameter.format), len(name)))
+        chunks.append(name)
+    # write atomically, other processes may load the cache at the same time
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(b"".join(chunks))
+    os.replace(tmp, path)
+
+
+def load_cache(path):
+    """
+    Read parameters from the compact binary cache format.
+    :param path: str
+    :return: [Parameter]
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != _CACHE_MAGIC:
+        raise CatalogError("{} is no parameter catalog cache".format(path))
+    count, = struct.unpack_from("<I", data, 4)
+    offset = 8
+    parameters = []
+    unpack_record = _RECORD.unpack_from
+    record_size = _RECORD.size
+    for _ in range(count):
+        parameter_id, format_index, name_length = unpack_record(data, offset)
+        offset += record_size
+        parameter = Parameter.__new__(Parameter)
+        parameter.id = parameter_id
+        parameter.name = data[offset:offset + name_length].decode()
+        parameter.format = FORMATS[format_index]
+        offset += name_length
+        parameters.append(parameter)
+    return parameters
+
+
+def load_catalog(metype="TEC", paths=(), directory=None, firmware=None, cache_dir=None):
+    """
+    Returns a ParameterList with the built-in parameters of metype merged with the definitions of the given files.
+    Assign it to a connection to use the additional parameters by name: mc.PARAMETERS = load_catalog(...)
+    :param metype: str: device family, see ParameterList
+    :param paths: [str]: JSON or CSV files, later files replace definitions of earlier ones
+    :param directory: str: additionally load the files found by find_catalog_files(directory, metype, firmware)
+    :param firmware: str: firmware version used to find firmware specific files in directory
+    :param cache_dir: str: directory of the binary cache, no caching if None
+    :return: ParameterList
+    """
+    paths = list(paths)
+    if directory is not None:
+        paths = find_catalog_files(directory, metype, firmware) + paths
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_dir = os.path.expanduser(cache_dir)
+        cache_path = os.path.join(cache_dir, "{}-{}.mcc".format(metype, _cache_key(metype, paths)))
+        if os.path.isfile(cache_path):
+            try:
+                return ParameterList(metype, load_cache(cache_path))
+            except (CatalogError, struct.error, IndexError, UnicodeDecodeError):
+                # broken cache, rebuild below
+                pass
+
+    definitions = [{"id": p.id, "name": p.name, "format": p.format} for p in ParameterList(metype)]
+    for path in paths:
+        definitions = merge(definitions, load_definitions(path))
+    catalog = ParameterList(metype, definitions)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        dump_cache(list(catalog), cache_path)
+    return catalog
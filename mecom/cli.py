@@ -0,0 +1,355 @@
+"""
+The mecom console tool, installed as "mecom" and also available as "python -m mecom".
+
+Examples:
+mecom --port /dev/ttyUSB0 get "Object Temperature,Target Object Temperature"
+mecom --host 192.168.1.20 -a 1,2 set "Target Object Temperature=23"
+mecom --port /dev/ttyUSB0 --metype LDD-112x dump
+mecom --host 192.168.1.20 -a 1,2 monitor "Object Temperature,Actual Output Current" --rate 10 --format jsonl -o log_{address}.jsonl
+mecom --port /dev/ttyUSB0 -a 1 scan --ids 0-65535 --max-instance 4 -o found.json
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from .exceptions import UnknownParameter
+
+OUTPUT_FORMATS = ("text", "csv", "jsonl")
+
+
+def _split(names):
+    """
+    Split a comma separated list of parameter names.
+    :param names: str
+    :return: [str]
+    """
+    return [name.strip() for name in names.split(",") if name.strip()]
+
+
+def _parse_value(parameter, value):
+    """
+    Cast a value given on the command line to the format of the parameter.
+    :param parameter: Parameter
+    :param value: str
+    :return: int or float
+    """
+    if parameter.format == "FLOAT32":
+        return float(value)
+    try:
+        return int(value, 0)
+    except ValueError:
+        # e.g. "23.0" or "08"
+        number = float(value)
+    if not number.is_integer():
+        raise ValueError("{} takes an integer, got {}".format(parameter.name, value))
+    return int(number)
+
+
+class RecordWriter(object):
+    """
+    Writes records as text, csv or jsonl to stdout or to files. Files are block buffered and flushed every
+    flush_interval seconds so high rate monitoring does not issue a write per sample.
+    """
+
+    def __init__(self, output="-", output_format="text", columns=None, flush_interval=1., buffer_size=1 << 16):
+        """
+        :param output: str: '-' for stdout or a file name, "{address}" in the file name opens one file per address
+        :param output_format: str: one of 'text', 'csv' or 'jsonl'
+        :param columns: [str]: value columns, written as csv header
+        :param flush_interval: float: seconds
+        :param buffer_size: int: bytes
+        """
+        assert output_format in OUTPUT_FORMATS
+        self.output = output
+        self.output_format = output_format
+        self.columns = columns or []
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self._files = {}
+        # file key -> columns of the last csv header written
+        self._headers = {}
+        self._last_flush = time.monotonic()
+
+    def _file(self, address, columns):
+        key = address if "{address}" in self.output else None
+        if key not in self._files:
+            if self.output == "-":
+                f = sys.stdout
+            else:
+                f = open(self.output.format(address=address), "w", buffering=self.buffer_size)
+            self._files[key] = f
+        f = self._files[key]
+        if self.output_format == "csv" and self._headers.get(key) != columns:
+            f.write(",".join(["time", "address", "instance"] + ['"{}"'.format(c) for c in columns]) + "\n")
+            self._headers[key] = columns
+        return f
+
+    def write(self, timestamp, address, instance, values, columns=None):
+        """
+        Write one record.
+        :param timestamp: float: unix time
+        :param address: int
+        :param instance: int
+        :param values: [int or float or None]: one value per column, None if the value could not be read
+        :param columns: [str]: columns of this record if they differ from the ones passed to the constructor, e.g.
+            for devices of another family, csv files get a new header line
+        :return:
+        """
+        columns = self.columns if columns is None else columns
+        f = self._file(address, columns)
+        if self.output_format == "csv":
+            f.write("{:.6f},{},{},{}\n".format(timestamp, address, instance,
+                                                ",".join("" if v is None else repr(v) for v in values)))
+        elif self.output_format == "jsonl":
+            f.write(json.dumps({"time": round(timestamp, 6), "address": address, "instance": instance,
+                                "values": dict(zip(columns, values))}) + "\n")
+        else:
+            for column, value in zip(columns, values):
+                f.write("{}:{} {} = {}\n".format(address, instance, column, value))
+
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self.flush()
+            self._last_flush = now
+
+    def flush(self):
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            if f is not sys.stdout:
+                f.close()
+        self._files = {}
+        self._headers = {}
+
+
+def connect(args):
+    """
+    Open the connection described by the command line arguments.
+    :param args: argparse.Namespace
+    :return: MeComSerial or MeComTcp
+    """
+    if args.host is not None:
+        from .mecom import MeComTcp
+        return MeComTcp(args.host, ipport=args.tcp_port, timeout=args.timeout or 10, metype=args.metype)
+    from .mecom import MeComSerial
+    return MeComSerial(serialport=args.port, timeout=args.timeout or 1, baudrate=args.baudrate, metype=args.metype)
+
+
+def cmd_get(mc, args):
+    names = _split(args.parameters)
+    writer = RecordWriter(args.output, args.format, names)
+    try:
+        for address in args.address:
+            values = []
+            for name in names:
+                try:
+                    values.append(mc.get_parameter(parameter_name=name, address=address,
+                                                   parameter_instance=args.instance))
+                except UnknownParameter:
+                    sys.stderr.write('UnknownParameter: "{}"\n'.format(name))
+                    values.append(None)
+            writer.write(time.time(), address, args.instance, values)
+    finally:
+        writer.close()
+    return 0
+
+
+def cmd_set(mc, args):
+    status = 0
+    for assignment in args.assignments:
+        name, value = [part.strip() for part in assignment.split("=", 1)]
+        for address in args.address:
+            parameter = mc.catalog(address).get_by_name(name)
+            try:
+                parsed = _parse_value(parameter, value)
+            except ValueError as ex:
+                sys.stderr.write("{}: {}\n".format(address, ex))
+                status = 1
+                continue
+            if not mc.set_parameter(value=parsed, parameter_name=name, address=address,
+                                    parameter_instance=args.instance):
+                sys.stderr.write("{}: setting {} failed\n".format(address, name))
+                status = 1
+    return status
+
+
+def _report(address, name, error):
+    # WrongChecksum carries no message
+    sys.stderr.write("{}: {}: {}\n".format(address, name, str(error) or type(error).__name__))
+
+
+def cmd_dump(mc, args):
+    writer = RecordWriter(args.output, args.format, [parameter.name for parameter in mc.PARAMETERS])
+    try:
+        for address in args.address:
+            parameters = list(mc.catalog(address))
+            names = [parameter.name for parameter in parameters]
+            values = mc.get_parameters([parameter.id for parameter in parameters], address=address,
+                                       parameter_instance=args.instance, return_errors=True)
+            for index, (parameter, value) in enumerate(zip(parameters, values)):
+                if isinstance(value, Exception):
+                    _report(address, "{} ({})".format(parameter.name, parameter.id), value)
+                    values[index] = None
+            writer.write(time.time(), address, args.instance, values, names)
+    finally:
+        writer.close()
+    return 0
+
+
+def cmd_monitor(mc, args):
+    names = _split(args.parameters)
+    # resolve names before polling, unknown names fail here instead of on every cycle
+    for address in args.address:
+        for name in names:
+            mc.catalog(address).get_by_name(name)
+
+    writer = RecordWriter(args.output, args.format, names, flush_interval=args.flush_interval)
+    period = 1. / args.rate
+    overruns = 0
+    cycles = 0
+    start = time.monotonic()
+    next_cycle = start
+    try:
+        while args.count is None or cycles < args.count:
+            if args.duration is not None and time.monotonic() - start >= args.duration:
+                break
+            for address in args.address:
+                timestamp = time.time()
+                values = mc.get_parameters(names, address=address, parameter_instance=args.instance,
+                                           return_errors=True)
+                for index, (name, value) in enumerate(zip(names, values)):
+                    if isinstance(value, Exception):
+                        _report(address, name, value)
+                        values[index] = None
+                writer.write(timestamp, address, args.instance, values)
+            cycles += 1
+
+            next_cycle += period
+            delay = next_cycle - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -period:
+                # we fell behind by more than a cycle, skip instead of bursting to catch up
+                overruns += 1
+                next_cycle = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+
+    elapsed = time.monotonic() - start
+    sys.stderr.write("{} cycles in {:.1f}s ({:.1f} Hz), {} overruns\n".format(
+        cycles, elapsed, cycles / elapsed if elapsed > 0 else 0., overruns))
+    return 0
+
+
+def _id_ranges(ranges):
+    """
+    Parse comma separated ids and ranges, e.g. "1000-1999,50000".
+    :param ranges: str
+    :return: [int]
+    """
+    ids = []
+    for part in _split(ranges):
+        first, _, last = part.partition("-")
+        ids.extend(range(int(first, 0), int(last or first, 0) + 1))
+    return ids
+
+
+def cmd_scan(mc, args):
+    from .scan import scan_parameters, write_catalog
+
+    def progress(done, total):
+        sys.stderr.write("\r{}/{}".format(done, total))
+
+    for address in args.address:
+        start = time.monotonic()
+        results = scan_parameters(mc, address=address, ids=_id_ranges(args.ids), instances=(args.instance,),
+                                  max_instance=args.max_instance, progress=progress)
+        output = args.output.replace("{address}", str(address))
+        definitions = write_catalog(results, output, metype=args.metype, known=not args.unknown_only)
+        sys.stderr.write("\r{}: {} queries in {:.1f}s, {} parameters written to {}\n".format(
+            address, len(results), time.monotonic() - start, len(definitions), output))
+    return 0
+
+
+def cmd_status(mc, args):
+    for address in args.address:
+        sys.stdout.write("connected to device: {}, status: {}\n".format(mc.identify(address=address),
+                                                                      mc.status(address=address)))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="mecom", description="Get, set and monitor parameters of MeCom devices.")
+    connection = parser.add_mutually_exclusive_group()
+    connection.add_argument("--port", default="/dev/ttyUSB0", help="serial port (default: %(default)s)")
+    connection.add_argument("--host", help="ip address of a TCP device or gateway")
+    parser.add_argument("--tcp-port", type=int, default=50000)
+    parser.add_argument("--baudrate", type=int, default=57600)
+    parser.add_argument("--timeout", type=float, help="seconds (default: 1 for serial, 10 for TCP)")
+    parser.add_argument("--metype", default="TEC", help="'TEC', 'LDD-112x', 'LDD-130x' or 'LDD-1321'")
+    parser.add_argument("-a", "--address", default="0",
+                        help="comma separated device addresses (default: %(default)s)")
+    parser.add_argument("-i", "--instance", type=int, default=1, help="parameter instance / channel")
+
+    def add_output_arguments(command, default_format="text"):
+        command.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default=default_format)
+        command.add_argument("-o", "--output", default="-",
+                             help="'-' for stdout or a file name, '{address}' is replaced by the device address")
+
+    commands = parser.add_subparsers(dest="command")
+    get = commands.add_parser("get", help="get parameters")
+    add_output_arguments(get)
+    get.add_argument("parameters", help='comma separated names, e.g. "Object Temperature,Sink Temperature"')
+    get.set_defaults(func=cmd_get)
+
+    set_ = commands.add_parser("set", help="set parameters")
+    set_.add_argument("assignments", nargs="+", help='e.g. "Target Object Temperature=23"')
+    set_.set_defaults(func=cmd_set)
+
+    dump = commands.add_parser("dump", help="get all known parameters")
+    add_output_arguments(dump)
+    dump.set_defaults(func=cmd_dump)
+
+    monitor = commands.add_parser("monitor", help="poll parameters at a fixed rate")
+    add_output_arguments(monitor, default_format="csv")
+    monitor.add_argument("parameters", help="comma separated names")
+    monitor.add_argument("-r", "--rate", type=float, default=1., help="poll cycles per second")
+    monitor.add_argument("-d", "--duration", type=float, help="seconds, default: until interrupted")
+    monitor.add_argument("-n", "--count", type=int, help="number of poll cycles")
+    monitor.add_argument("--flush-interval", type=float, default=1., help="seconds between file flushes")
+    monitor.set_defaults(func=cmd_monitor)
+
+    scan = commands.add_parser("scan", help="find parameters by querying id ranges, writes a catalog file")
+    scan.add_argument("--ids", default="0-65535", help="comma separated ids and ranges (default: %(default)s)")
+    scan.add_argument("--max-instance", type=int, help="probe found parameters up to this instance")
+    scan.add_argument("--unknown-only", action="store_true", help="skip parameters listed in commands.py")
+    scan.add_argument("-o", "--output", default="scan_{address}.json",
+                      help="*.json or *.csv, '{address}' is replaced by the device address (default: %(default)s)")
+    scan.set_defaults(func=cmd_scan)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.address = [int(a, 0) for a in _split(args.address)]
+
+    with connect(args) as mc:
+        try:
+            if args.command is None:
+                return cmd_status(mc, args)
+            return args.func(mc, args)
+        except UnknownParameter:
+            sys.stderr.write("unknown parameter, see mecom/commands.py\n")
+            return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
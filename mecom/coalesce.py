@@ -0,0 +1,167 @@
+"""
+Last-writer-wins coalescing of parameter writes, e.g. setpoints from GUI sliders or outer control loops:
+
+    writer = CoalescingWriter(mc)
+    writer.set_parameter(23.5, "Target Object Temperature", address=1)  # APPLIED or SUPERSEDED
+
+Only the newest pending value per (address, parameter, instance) is sent once the bus is free, older pending values
+are dropped instead of queueing up on the bus lock. There is no background thread: the first caller of a key
+waits for the bus and sends whatever value is newest at that moment, callers arriving meanwhile wait for the
+outcome of their value.
+"""
+
+import threading
+
+from .exceptions import DeadlineExceeded, ResponseException
+from .mecom import ACK, VS
+
+APPLIED = "applied"
+SUPERSEDED = "superseded"
+
+
+class _Write(object):
+    """
+    One call of set_parameter(), done once result or error is set.
+    """
+    __slots__ = ("value", "result", "error", "turn", "event")
+
+    def __init__(self, value):
+        self.value = value
+        self.result = None
+        self.error = None
+        # the caller has to send the pending value of its slot, even if its own value gets superseded meanwhile
+        self.turn = False
+        self.event = threading.Event()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.event.set()
+
+
+class _Slot(object):
+    """
+    State of one (address, parameter id, instance).
+    """
+    __slots__ = ("pending", "busy")
+
+    def __init__(self):
+        # newest value not sent yet
+        self.pending = None
+        # a caller is waiting for the bus or sending on behalf of this slot
+        self.busy = False
+
+
+class CoalescingWriter(object):
+    """
+    Writes parameters of a connection, keeping only the newest pending value per address, parameter and instance.
+    Writes through this object and other queries of the connection share the bus lock as usual.
+    """
+
+    def __init__(self, mc):
+        """
+        :param mc: MeComSerial or MeComTcp
+        """
+        self.mc = mc
+        self._lock = threading.Lock()
+        self._slots = {}
+        self.applied = 0
+        self.superseded = 0
+
+    def set_parameter(self, value, parameter_name=None, parameter_id=None, address=0, parameter_instance=1,
+                      priority=None, deadline=None):
+        """
+        Set a parameter, the value may be replaced by a newer one of another call before it is sent.
+        Device errors and timeouts are raised to the caller whose value was sent.
+        :param value: int or float
+        :param parameter_name: str
+        :param parameter_id: int
+        :param address: int
+        :param parameter_instance: int
+        :param priority: int: used for the query if this call sends it and the connection uses a priority queue
+        :param deadline: float: time.monotonic() value, bounds the wait for the bus and the response if this call sends
+            the query
+        :return: str: APPLIED if the device acknowledged the value, SUPERSEDED if a newer value replaced it
+        """
+        parameter = self.mc._find_parameter(parameter_name, parameter_id, address)
+        key = (address, parameter.id, parameter_instance)
+        write = _Write(value)
+
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = _Slot()
+            if slot.pending is not None:
+                slot.pending.finish(SUPERSEDED)
+                self.superseded += 1
+            slot.pending = write
+            write.turn = not slot.busy
+            slot.busy = True
+
+        if not write.turn:
+            # done, or handed over by the previous sender
+            write.event.wait()
+        if write.turn:
+            self._send(slot, write, parameter, address, parameter_instance, priority, deadline)
+
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _send(self, slot, own, parameter, address, parameter_instance, priority, deadline):
+        """
+        Acquire the bus and send the newest pending value of slot, then hand the slot over to the caller of a value
+        which arrived meanwhile.
+        :param own: _Write: the value of the calling thread
+        """
+        mc = self.mc
+        # (write, query) once the bus is locked
+        sent = []
+
+        def newest():
+            # consumed with the bus locked, so the value is picked as late as possible
+            with self._lock:
+                write, slot.pending = slot.pending, None
+            query = VS(value=write.value, parameter=parameter, address=address, parameter_instance=parameter_instance)
+            sent.append((write, query))
+            yield query
+
+        try:
+            frames = mc._transact_many(newest(), priority, deadline)
+            if not sent:
+                # the bus was not free before the deadline: only our own value fails, a newer one is handed over
+                # to its caller below
+                with self._lock:
+                    if slot.pending is own:
+                        slot.pending = None
+                if own.result is None:
+                    own.finish(error=DeadlineExceeded("deadline passed while waiting for the bus"))
+                return
+            write, query = sent[0]
+            if not frames:
+                raise DeadlineExceeded("deadline passed while waiting for the response")
+            mc._set_response(query, frames[0])
+            mc._raise(query)
+        except Exception as ex:
+            (sent[0][0] if sent else own).finish(error=ex)
+        else:
+            if type(query.RESPONSE) is ACK:
+                with self._lock:
+                    self.applied += 1
+                write.finish(APPLIED)
+            else:
+                write.finish(error=ResponseException("no ACK for setting {}".format(parameter.name)))
+        finally:
+            with self._lock:
+                if slot.pending is not None:
+                    slot.pending.turn = True
+                    slot.pending.event.set()
+                else:
+                    slot.busy = False
+
+    def statistics(self):
+        """
+        :return: dict: number of applied and superseded values
+        """
+        with self._lock:
+            return {"applied": self.applied, "superseded": self.superseded}
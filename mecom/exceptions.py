@@ -11,6 +11,22 @@ class ResponseTimeout(ResponseException):
     pass
 
 
+class DeviceUnresponsive(ResponseTimeout):
+    pass
+
+
+class DeadlineExceeded(ResponseTimeout):
+    """
+    The time budget of a call was exhausted. completed holds the results which were obtained, incomplete the
+    parameters or queries which were skipped or interrupted.
+    """
+
+    def __init__(self, message, completed=None, incomplete=None):
+        super().__init__(message)
+        self.completed = completed if completed is not None else []
+        self.incomplete = incomplete if incomplete is not None else []
+
+
 class WrongResponseSequence(ResponseException):
     pass
 
@@ -24,3 +40,7 @@ class UnknownParameter(Exception):
     
 class UnknownMeComType(Exception):
     pass
+
+
+class CatalogError(Exception):
+    pass
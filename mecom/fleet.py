@@ -0,0 +1,208 @@
+"""
+Polling of large device fleets with a pool of processes, one shard of ports / gateways per process.
+Samples are passed to the parent through a SharedSampleRing per process instead of pickled queues.
+Requires numpy.
+"""
+
+import logging
+import multiprocessing
+import threading
+import time
+
+import numpy as np
+
+from .exceptions import ResponseException, WrongChecksum
+from .shm import SharedSampleRing, SAMPLE_DTYPE, SAMPLE_OK, SAMPLE_DEVICE_ERROR, SAMPLE_COMMUNICATION_ERROR
+
+logger = logging.getLogger(__name__)
+
+
+def _connection_key(device):
+    """
+    Devices sharing a serial port or a TCP gateway share a connection.
+    :param device: dict
+    :return: tuple
+    """
+    if "host" in device:
+        return ("tcp", device["host"], device.get("ipport", 50000))
+    return ("serial", device["port"], device.get("baudrate", 57600))
+
+
+def _open(key, metype, timeout):
+    from .mecom import MeComSerial, MeComTcp
+    if key[0] == "tcp":
+        return MeComTcp(key[1], ipport=key[2], timeout=timeout or 10, metype=metype, adaptive_timeout=True)
+    return MeComSerial(serialport=key[1], baudrate=key[2], timeout=timeout or 1, metype=metype,
+                       adaptive_timeout=True)
+
+
+def _poll_connection(key, devices, parameters, metype, timeout, period, ring, ring_lock, stop):
+    """
+    Poll all devices of one connection until stop is set. Runs in a thread of a shard process.
+    """
+    from .mecom import VR, DeviceError
+
+    mc = None
+    next_cycle = time.monotonic()
+    while not stop.is_set():
+        if mc is None:
+            try:
+                mc = _open(key, metype, timeout)
+                catalog = [mc.PARAMETERS.get_by_name(name) for name in parameters]
+            except Exception as ex:
+                logger.warning("{}: {}".format(key, ex))
+                stop.wait(1.)
+                continue
+
+        for index, device in devices:
+            queries = [VR(parameter=parameter, address=device["address"],
+                          parameter_instance=device.get("instance", 1)) for parameter in catalog]
+            try:
+                mc._execute_many(queries)
+            except (ResponseException, WrongChecksum):
+                timestamp = time.time()
+                with ring_lock:
+                    for p in range(len(parameters)):
+                        ring.write(timestamp, index, p, np.nan, SAMPLE_COMMUNICATION_ERROR)
+                continue
+            except OSError as ex:
+                logger.warning("{}: {}".format(key, ex))
+                mc.stop()
+                mc = None
+                break
+
+            timestamp = time.time()
+            with ring_lock:
+                for p, vr in enumerate(queries):
+                    if type(vr.RESPONSE) is DeviceError:
+                        ring.write(timestamp, index, p, np.nan, SAMPLE_DEVICE_ERROR)
+                    else:
+                        ring.write(timestamp, index, p, vr.RESPONSE.PAYLOAD[0], SAMPLE_OK)
+
+        next_cycle += period
+        delay = next_cycle - time.monotonic()
+        if delay > 0:
+            stop.wait(delay)
+        else:
+            next_cycle = time.monotonic()
+
+    if mc is not None:
+        mc.stop()
+
+
+def _shard_main(connections, parameters, metype, timeout, period, ring_name, stop):
+    """
+    Entry point of a shard process: one polling thread per connection, all writing into the ring of the shard.
+    """
+    ring = SharedSampleRing(ring_name)
+    ring_lock = threading.Lock()
+    local_stop = threading.Event()
+    threads = [threading.Thread(target=_poll_connection, daemon=True,
+                                args=(key, devices, parameters, metype, timeout, period, ring, ring_lock,
+                                      local_stop))
+               for key, devices in connections]
+    for thread in threads:
+        thread.start()
+    stop.wait()
+    local_stop.set()
+    for thread in threads:
+        thread.join()
+    ring.close()
+
+
+class FleetSupervisor(object):
+    """
+    Polls the same parameters on many devices with a pool of processes.
+
+    Devices are described as dicts, either {"port": "/dev/ttyUSB0", "address": 1} for serial or
+    {"host": "192.168.1.20", "address": 1} for TCP, optionally with "instance", "baudrate" or "ipport".
+    Devices on the same port or gateway form one connection, connections are distributed round robin over the
+    processes. Every sample read by read() refers to a device and parameter by its index in the lists passed here.
+    """
+
+    def __init__(self, devices, parameters, rate=1., processes=None, metype="TEC", timeout=None,
+                 ring_capacity=1 << 16):
+        """
+        :param devices: [dict]
+        :param parameters: [str]: parameter names
+        :param rate: float: poll cycles per second
+        :param processes: int: defaults to the number of CPUs, never more than the number of connections
+        :param metype: str
+        :param timeout: float: transport timeout, defaults to the transport default
+        :param ring_capacity: int: samples buffered per process
+        """
+        self.devices = list(devices)
+        self.parameters = list(parameters)
+        self.rate = rate
+        self.metype = metype
+        self.timeout = timeout
+        self.ring_capacity = ring_capacity
+
+        connections = {}
+        for index, device in enumerate(self.devices):
+            connections.setdefault(_connection_key(device), []).append((index, device))
+        connections = sorted(connections.items())
+
+        processes = min(processes or multiprocessing.cpu_count(), len(connections)) or 1
+        self.shards = [connections[i::processes] for i in range(processes)]
+
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = None
+        self._processes = []
+        self._rings = []
+
+    def start(self):
+        """
+        Create the shared memory rings and start one process per shard.
+        :return:
+        """
+        self._stop = self._context.Event()
+        for shard in self.shards:
+            ring = SharedSampleRing(capacity=self.ring_capacity)
+            process = self._context.Process(target=_shard_main, daemon=True,
+                                            args=(shard, self.parameters, self.metype, self.timeout,
+                                                  1. / self.rate, ring.name, self._stop))
+            process.start()
+            self._rings.append(ring)
+            self._processes.append(process)
+
+    def read(self):
+        """
+        Returns all samples written by the shard processes since the last call.
+        :return: np.ndarray of SAMPLE_DTYPE
+        """
+        if not self._rings:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        return np.concatenate([ring.read() for ring in self._rings])
+
+    @property
+    def dropped(self):
+        """
+        Number of samples lost because read() was not called often enough.
+        :return: int
+        """
+        return sum(ring.dropped for ring in self._rings)
+
+    def stop(self, timeout=5.):
+        """
+        Stop all processes and release the shared memory.
+        :param timeout: float: seconds to wait for each process
+        :return:
+        """
+        if self._stop is not None:
+            self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        for ring in self._rings:
+            ring.close()
+        self._processes = []
+        self._rings = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
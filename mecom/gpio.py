@@ -0,0 +1,195 @@
+"""
+Edge detection on the digital inputs of a device, e.g. the GPIOs of a LDD-112x ("Read Input States", 52103):
+
+    monitor = GpioMonitor(mc, address=1, rate=500., callback=print, names={0: "interlock", 1: "trigger"})
+    monitor.start()
+
+Every poll reads the input states through the pre-encoded frame of a device handle (see handle.py) and compares
+them with the previous poll by XOR, only changed bits create events. An edge happened between the previous and the
+current poll, both times are part of the event.
+"""
+
+import logging
+import time
+from queue import Full
+from threading import Event, Thread
+
+from .exceptions import ResponseException, WrongChecksum
+
+logger = logging.getLogger(__name__)
+
+READ_INPUT_STATES = 52103
+
+
+class GpioEdge(object):
+    """
+    A change of one input bit.
+    """
+    __slots__ = ("address", "bit", "name", "rising", "timestamp", "previous", "states")
+
+    def __init__(self, address, bit, name, rising, timestamp, previous, states):
+        """
+        :param address: int
+        :param bit: int: bit number, 0 for the first input
+        :param name: str: from the names passed to GpioMonitor, else None
+        :param rising: bool: True for 0 -> 1, False for 1 -> 0
+        :param timestamp: float: unix time of the poll which saw the new state
+        :param previous: float: unix time of the poll before, which saw the old state
+        :param states: int: all input states of that poll
+        """
+        self.address = address
+        self.bit = bit
+        self.name = name
+        self.rising = rising
+        self.timestamp = timestamp
+        self.previous = previous
+        self.states = states
+
+    def __repr__(self):
+        return "<GpioEdge device {} bit {}{} {} at {:.6f}>".format(
+            self.address, self.bit, " ({})".format(self.name) if self.name else "",
+            "rising" if self.rising else "falling", self.timestamp)
+
+
+class GpioMonitor(object):
+    """
+    Polls the input states of one device at a fixed rate and reports rising and falling edges of every bit to a
+    callback and / or a queue. The schedule is kept on the monotonic clock; if a read takes longer than the poll
+    period the next read follows right away.
+    """
+
+    def __init__(self, mc, address=0, rate=200., callback=None, queue=None, mask=0xFFFFFFFF, names=None,
+                 parameter=READ_INPUT_STATES, parameter_instance=1, priority=None):
+        """
+        :param mc: MeComSerial or MeComTcp
+        :param address: int
+        :param rate: float: polls per second, None to poll back to back
+        :param callback: callable(GpioEdge)
+        :param queue: queue.Queue or anything with put_nowait(), receives GpioEdge, events which do not fit into a
+            full queue are dropped and counted as errors
+        :param mask: int: bits to watch
+        :param names: {int: str}: names of bits, passed on with the events
+        :param parameter: str or int: name or id of the input states parameter
+        :param parameter_instance: int
+        :param priority: int: used for the reads if the connection uses a priority queue
+        """
+        self.mc = mc
+        self.address = address
+        self.period = 1. / rate if rate else 0.
+        self.callback = callback
+        self.queue = queue
+        self.mask = mask
+        self.names = dict(names or {})
+
+        self._handle = mc.device(address, parameter_instance, priority)
+        self._bound = self._handle._lookup(parameter)
+
+        self.states = None
+        self.timestamp = None
+        self.polls = 0
+        self.edges = 0
+        self.errors = 0
+        # longest time between two successful polls, the worst case detection delay
+        self.max_gap = 0.
+        self._stop = Event()
+        self._thread = None
+
+    def poll_once(self):
+        """
+        Read the input states and report the edges since the previous poll. The first poll only stores the states.
+        :return: [GpioEdge]
+        """
+        try:
+            states = self._handle._get(self._bound)
+        except (ResponseException, WrongChecksum) as ex:
+            self.errors += 1
+            logger.warning("device {}: {}".format(self.address, ex))
+            return []
+        timestamp = time.time()
+        self.polls += 1
+
+        previous, self.states = self.states, states
+        previous_timestamp, self.timestamp = self.timestamp, timestamp
+        if previous is None:
+            return []
+        gap = timestamp - previous_timestamp
+        if gap > self.max_gap:
+            self.max_gap = gap
+
+        changed = (states ^ previous) & self.mask
+        if not changed:
+            return []
+
+        edges = []
+        bit = 0
+        while changed:
+            if changed & 1:
+                edges.append(GpioEdge(self.address, bit, self.names.get(bit), bool((states >> bit) & 1), timestamp,
+                                      previous_timestamp, states))
+            changed >>= 1
+            bit += 1
+        self.edges += len(edges)
+        for edge in edges:
+            self._dispatch(edge)
+        return edges
+
+    def _dispatch(self, edge):
+        # a failing consumer must not stop the monitoring thread
+        if self.callback is not None:
+            try:
+                self.callback(edge)
+            except Exception:
+                self.errors += 1
+                logger.exception("device {}: callback failed for {!r}".format(self.address, edge))
+        if self.queue is not None:
+            try:
+                # a full queue must not block the polling
+                self.queue.put_nowait(edge)
+            except Full:
+                self.errors += 1
+                logger.warning("device {}: queue full, dropped {!r}".format(self.address, edge))
+            except Exception:
+                self.errors += 1
+                logger.exception("device {}: queue rejected {!r}".format(self.address, edge))
+
+    def run(self, duration=None):
+        """
+        Poll until stop() is called or for duration seconds.
+        :param duration: float
+        :return:
+        """
+        next_poll = time.monotonic()
+        end = None if duration is None else next_poll + duration
+        while not self._stop.is_set():
+            self.poll_once()
+            next_poll += self.period
+            now = time.monotonic()
+            if end is not None and now >= end:
+                break
+            if next_poll > now:
+                self._stop.wait(next_poll - now)
+            else:
+                # behind schedule, do not burst to catch up
+                next_poll = now
+
+    def start(self):
+        """
+        Poll in a background thread.
+        :return:
+        """
+        self._stop.clear()
+        self._thread = Thread(target=self.run, name="mecom-gpio-{}".format(self.address), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def statistics(self):
+        """
+        :return: dict: polls, edges, errors (failed reads, failed and dropped deliveries) and the longest gap between two successful
+            polls in seconds
+        """
+        return {"polls": self.polls, "edges": self.edges, "errors": self.errors, "max_gap": self.max_gap}
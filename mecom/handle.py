@@ -0,0 +1,240 @@
+"""
+Device handles bound to an address and channel, with one attribute per catalog parameter:
+
+    dev = mc.device(address=1, channel=1)
+    dev.object_temperature
+    dev.target_object_temperature = 25.0
+
+Attribute names are the parameter names in lower case with every run of other characters than letters and digits
+replaced by "_". Every parameter has a pre-encoded frame template (header and payload bytes and the checksum
+state after the constant prefix) and a type codec, so an access only fills in the sequence number and value.
+"""
+
+import re
+import struct
+import threading
+import weakref
+
+from .exceptions import DeadlineExceeded, ResponseException
+from .mecom import ACK, VR, VS, FrameTemplate, RawQuery, _crc
+
+_BROADCAST_READ = "devices do not answer queries to the broadcast address"
+
+
+def attribute_name(parameter_name):
+    """
+    Returns the attribute name of a parameter, e.g. "object_temperature" for "Object Temperature".
+    :param parameter_name: str
+    :return: str
+    """
+    name = re.sub(r"[^0-9a-z]+", "_", parameter_name.lower()).strip("_")
+    return "_" + name if name[:1].isdigit() else name
+
+
+class _Codec(object):
+    """
+    Conversion between values and the 8 hex digits of a frame.
+    """
+
+    def __init__(self, parameter_format):
+        self.format = parameter_format
+        self._struct = struct.Struct(">f" if parameter_format == "FLOAT32" else ">i")
+
+    def encode(self, value):
+        if self.format == "FLOAT32":
+            return self._struct.pack(float(value)).hex().upper().encode()
+        return "{:08X}".format(int(value) & 0xFFFFFFFF).encode()
+
+    def decode(self, digits):
+        return self._struct.unpack(bytes.fromhex(digits.decode()))[0]
+
+
+class _BoundParameter(object):
+    """
+    Templates and codec of one parameter of a handle.
+    """
+
+    def __init__(self, parameter, address, channel):
+        self.parameter = parameter
+        self.codec = _Codec(parameter.format)
+        instance = "{:04X}{:02X}".format(parameter.id, channel).encode()
+        self.get_template = FrameTemplate(address, b"?VR" + instance)
+        self.set_template = FrameTemplate(address, b"VS" + instance)
+
+
+class DeviceHandle(object):
+    """
+    A device on a connection, bound to an address and channel (parameter instance). Subclasses generated per
+    catalog add one property per parameter, see MeComCommon.device().
+    """
+
+    # attribute name -> Parameter, set on the generated subclasses
+    _ATTRIBUTES = {}
+    # instance attributes, parameters with these attribute names are only available through get() and set()
+    _RESERVED = ("mc", "address", "channel", "priority")
+
+    def __init__(self, mc, address=0, channel=1, priority=None):
+        """
+        :param mc: MeComSerial or MeComTcp
+        :param address: int
+        :param channel: int: parameter instance, e.g. 2 for the second channel of a TEC-1122
+        :param priority: int: used for all queries if the connection uses a priority queue
+        """
+        self.mc = mc
+        self.address = address
+        self.channel = channel
+        self.priority = priority
+        self._bound = {}
+
+    def _bind(self, parameter):
+        bound = self._bound.get(parameter.id)
+        if bound is None:
+            bound = self._bound[parameter.id] = _BoundParameter(parameter, self.address, self.channel)
+        return bound
+
+    def _lookup(self, parameter):
+        """
+        :param parameter: str or int: name, attribute name or id
+        :return: _BoundParameter
+        """
+        if isinstance(parameter, int):
+            return self._bind(self.mc._find_parameter(None, parameter, self.address))
+        found = self._ATTRIBUTES.get(parameter)
+        if found is None:
+            found = self.mc._find_parameter(parameter, None, self.address)
+        return self._bind(found)
+
+    def _exchange(self, transaction, deadline):
+        mc = self.mc
+        mc._acquire(self.priority, deadline)
+        try:
+            return mc._transact(transaction, deadline)
+        finally:
+            mc.lock.release()
+
+    def _get(self, bound, deadline=None):
+        if self.address == 255:
+            raise ResponseException(_BROADCAST_READ)
+        transaction = RawQuery(bound.get_template)
+        frame = self._exchange(transaction, deadline)
+        # fast path: !AASSSSVVVVVVVVCCCC
+        if len(frame) == 19 and frame[7:8] != b"+" and _crc(frame[:15]) == int(frame[15:19], 16) \
+                and int(frame[3:7], 16) == transaction.SEQUENCE:
+            return bound.codec.decode(frame[7:15])
+        return self._slow_path(VR(bound.parameter, self.address, self.channel), transaction, frame).PAYLOAD[0]
+
+    def _set(self, bound, value, deadline=None):
+        transaction = RawQuery(bound.set_template, bound.codec.encode(value))
+        frame = self._exchange(transaction, deadline)
+        if frame is None:
+            # broadcast, executed but not acknowledged
+            return False
+        # fast path: the ACK !AASSSSCCCC repeats the checksum of the query
+        if len(frame) == 11 and int(frame[3:7], 16) == transaction.SEQUENCE \
+                and int(frame[7:11], 16) == transaction.CRC:
+            return True
+        response = self._slow_path(VS(value, bound.parameter, self.address, self.channel), transaction, frame)
+        return type(response) is ACK
+
+    def _slow_path(self, query, transaction, frame):
+        """
+        Parse anything else than a regular response with the query classes, raising the same exceptions.
+        :return: the response frame object
+        """
+        query.set_sequence(transaction.SEQUENCE)
+        self.mc._set_response(query, frame)
+        self.mc._raise(query)
+        return query.RESPONSE
+
+    def get(self, parameter, deadline=None):
+        """
+        Get a parameter value.
+        :param parameter: str or int: name, attribute name or id
+        :param deadline: float: time.monotonic() value
+        :return: int or float
+        """
+        return self._get(self._lookup(parameter), deadline)
+
+    def set(self, parameter, value, deadline=None):
+        """
+        Set a parameter value.
+        :param parameter: str or int: name, attribute name or id
+        :param value: int or float
+        :param deadline: float: time.monotonic() value
+        :return: bool
+        """
+        return self._set(self._lookup(parameter), value, deadline)
+
+    def get_many(self, parameters, deadline=None):
+        """
+        Get several parameter values with a single bus lock. Parameters which could not be read before deadline
+        are skipped and DeadlineExceeded is raised with the values read so far (completed) and the skipped
+        parameters (incomplete), like MeComCommon.get_parameters().
+        :param parameters: [str or int]
+        :param deadline: float: time.monotonic() value
+        :return: [int or float]
+        """
+        if self.address == 255:
+            raise ResponseException(_BROADCAST_READ)
+        parameters = list(parameters)
+        bound = [self._lookup(parameter) for parameter in parameters]
+        transactions = [RawQuery(b.get_template) for b in bound]
+        frames = self.mc._transact_many(transactions, self.priority, deadline)
+
+        values = []
+        for b, transaction, frame in zip(bound, transactions, frames):
+            if len(frame) == 19 and frame[7:8] != b"+" and _crc(frame[:15]) == int(frame[15:19], 16) \
+                    and int(frame[3:7], 16) == transaction.SEQUENCE:
+                values.append(b.codec.decode(frame[7:15]))
+            else:
+                values.append(self._slow_path(VR(b.parameter, self.address, self.channel), transaction,
+                                              frame).PAYLOAD[0])
+        if len(frames) < len(transactions):
+            raise DeadlineExceeded("deadline passed after {} of {} parameters".format(len(frames), len(transactions)),
+                                   completed=values, incomplete=parameters[len(frames):])
+        return values
+
+    def __repr__(self):
+        return "<{} address {} channel {}>".format(type(self).__name__, self.address, self.channel)
+
+
+def _accessor(parameter):
+    def fget(self):
+        return self._get(self._bind(parameter))
+
+    def fset(self, value):
+        self._set(self._bind(parameter), value)
+
+    return property(fget, fset, doc="{} ({}, id {})".format(parameter.name, parameter.format, parameter.id))
+
+
+# ParameterList -> generated DeviceHandle subclass
+_HANDLE_CLASSES = weakref.WeakKeyDictionary()
+_HANDLE_CLASSES_LOCK = threading.Lock()
+
+
+def handle_class(catalog):
+    """
+    Returns the DeviceHandle subclass with one property per parameter of catalog, generated once per catalog.
+    :param catalog: ParameterList
+    :return: type
+    """
+    cls = _HANDLE_CLASSES.get(catalog)
+    if cls is not None:
+        return cls
+    with _HANDLE_CLASSES_LOCK:
+        cls = _HANDLE_CLASSES.get(catalog)
+        if cls is None:
+            namespace = {"_ATTRIBUTES": {}}
+            for parameter in catalog:
+                if not parameter.name:
+                    continue
+                name = attribute_name(parameter.name)
+                # the first parameter of a name wins, like ParameterList.get_by_name()
+                if name in namespace["_ATTRIBUTES"] or hasattr(DeviceHandle, name) or name in DeviceHandle._RESERVED:
+                    continue
+                namespace["_ATTRIBUTES"][name] = parameter
+                namespace[name] = _accessor(parameter)
+            cls = type("DeviceHandle_" + attribute_name(catalog.metype), (DeviceHandle,), namespace)
+            _HANDLE_CLASSES[catalog] = cls
+    return cls
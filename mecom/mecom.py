@@ -6,15 +6,13 @@ from struct import pack, unpack
 from functools import partialmethod
 import time
 from threading import Lock
-import socket
-import select
-
-# more special pip packages
-from serial import Serial
 
 # from this package
-from .exceptions import ResponseException, WrongResponseSequence, WrongChecksum, ResponseTimeout, UnknownParameter, UnknownMeComType
+from .exceptions import ResponseException, WrongResponseSequence, WrongChecksum, ResponseTimeout, UnknownParameter, UnknownMeComType, \
+    DeadlineExceeded
 from .commands import TEC_PARAMETERS, LDD_PARAMETERS, LDD_112x_PARAMETERS, LDD_130x_PARAMETERS, LDD_1321_PARAMETERS, ERRORS
+from .priority import PriorityLock
+from .timing import AdaptiveTimeout
 
 
 class Parameter(object):
@@ -64,13 +62,20 @@ class ParameterList(object):
     The deprecated metype = 'LDD' is equal to passing metype = 'LDD-112x'.
     :param error_dict: dict
     """
+    METYPES = ('TEC', 'LDD-112x', 'LDD', 'LDD-130x', 'LDD-1321')
 
-    def __init__(self,metype='TEC'):
+    def __init__(self, metype='TEC', parameters=None):
         """
         Reads the parameter dicts from commands.py.
+        :param metype: str
+        :param parameters: [dict] or [Parameter]: use these instead of the built-in parameters of metype,
+        see catalog.py
         """
         self._PARAMETERS = []
-        if metype == 'TEC':
+        if parameters is not None:
+            for parameter in parameters:
+                self._PARAMETERS.append(parameter if isinstance(parameter, Parameter) else Parameter(parameter))
+        elif metype == 'TEC':
             for parameter in TEC_PARAMETERS:
                 self._PARAMETERS.append(Parameter(parameter))
         elif metype =='LDD-112x' or metype =='LDD':
@@ -84,6 +89,20 @@ class ParameterList(object):
                 self._PARAMETERS.append(Parameter(parameter))
         else:
             raise UnknownMeComType
+        self.metype = metype
+
+        # index for searching, the first parameter of a duplicate name or id wins
+        self._BY_ID = {}
+        self._BY_NAME = {}
+        for parameter in self._PARAMETERS:
+            self._BY_ID.setdefault(parameter.id, parameter)
+            self._BY_NAME.setdefault(parameter.name, parameter)
+
+    def __iter__(self):
+        return iter(self._PARAMETERS)
+
+    def __len__(self):
+        return len(self._PARAMETERS)
 
     def get_by_id(self, id):
         """
@@ -91,10 +110,10 @@ class ParameterList(object):
         :param id: int
         :return: Parameter()
         """
-        for parameter in self._PARAMETERS:
-            if parameter.id == id:
-                return parameter
-        raise UnknownParameter
+        try:
+            return self._BY_ID[id]
+        except KeyError:
+            raise UnknownParameter from None
 
     def get_by_name(self, name):
         """
@@ -102,10 +121,84 @@ class ParameterList(object):
         :param name: str
         :return: Parameter()
         """
-        for parameter in self._PARAMETERS:
-            if parameter.name == name:
-                return parameter
-        raise UnknownParameter
+        try:
+            return self._BY_NAME[name]
+        except KeyError:
+            raise UnknownParameter from None
+
+
+def _crc_table():
+    """
+    Byte wise lookup table of the CRC-CCITT used by MeFrame.CalcCRC_CCITT().
+    :return: [int]
+    """
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        table.append(crc & 0xFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def _crc(data, crc=0):
+    table = _CRC_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+class FrameTemplate(object):
+    """
+    Pre-encoded frame of one query to one parameter of one device, only the sequence number and the value of a
+    VS query change between calls.
+    """
+
+    def __init__(self, address, body):
+        """
+        :param address: int
+        :param body: bytes: payload following the sequence number, e.g. b"?VR03E801"
+        """
+        self.address = address
+        self.prefix = "#{:02X}".format(address).encode()
+        self.body = body
+        # checksum register after the prefix, continued over sequence number and payload
+        self.prefix_crc = _crc(self.prefix)
+
+    def frame(self, sequence, value=b""):
+        """
+        :param sequence: int
+        :param value: bytes: encoded value of a VS query
+        :return: (bytes, int): frame and its checksum
+        """
+        head = self.prefix + "{:04X}".format(sequence).encode() + self.body + value
+        crc = _crc(head[3:], self.prefix_crc)
+        return head + "{:04X}\r".format(crc).encode(), crc
+
+
+class RawQuery(object):
+    """
+    Minimal query object built from a FrameTemplate, accepted by the transaction methods of MeComCommon in place
+    of a Query. The response frame is not parsed.
+    """
+    __slots__ = ("ADDRESS", "SEQUENCE", "CRC", "_template", "_value")
+
+    def __init__(self, template, value=b""):
+        self.ADDRESS = template.address
+        self.SEQUENCE = 0
+        self.CRC = None
+        self._template = template
+        self._value = value
+
+    def set_sequence(self, sequence):
+        self.SEQUENCE = sequence
+
+    def compose(self):
+        frame, self.CRC = self._template.frame(self.SEQUENCE, self._value)
+        return frame
 
 
 class MeFrame(object):
@@ -194,7 +287,7 @@ class MeFrame(object):
         """
         frame = frame_bytes.decode()
 
-        self._SOURCE = frame[0]
+        # the source byte is a constant of the frame class, it is not stored per instance
         self.ADDRESS = int(frame[1:3], 16)
         self.SEQUENCE = int(frame[3:7], 16)
 
@@ -532,36 +625,169 @@ class DeviceError(MeFrame):
 
 class MeComCommon:
     """
-    Shared communication class
+    Shared communication class.
+
+    All state of a connection lives on the instance. The sequence counter, the transport and its timeout are only
+    touched while holding the bus lock (self.lock), which is the only lock taken per query.
     """
-    SEQUENCE_COUNTER = 1
 
-    def __init__(self, metype='TEC'):
+    def __init__(self, metype='TEC', priority_queue=False, adaptive_timeout=False, timeout=None, rate_limit=None,
+                 profile_cache=None):
         """
         Initialize communication.
         :param metype: str: either 'TEC', 'LDD-112x', 'LDD-130x' or 'LDD-1321'
+        :param priority_queue: bool or PriorityLock: serve waiting queries by priority instead of arbitrary order
+        :param adaptive_timeout: bool or AdaptiveTimeout: learn the read timeout per device address
+        :param timeout: float: timeout of the transport, initial and maximum value of adaptive timeouts
+        :param rate_limit: RateLimiter: pace the traffic on the bus, see ratelimit.py
+        :param profile_cache: ProfileCache: used by detect_profile() and save_to_flash() unless another cache is given
+        """
+        if isinstance(priority_queue, PriorityLock):
+            self.lock = priority_queue
+        elif priority_queue:
+            self.lock = PriorityLock()
+        else:
+            self.lock = Lock()
+
+        if isinstance(adaptive_timeout, AdaptiveTimeout):
+            self.timing = adaptive_timeout
+        elif adaptive_timeout:
+            self.timing = AdaptiveTimeout(initial=timeout)
+        else:
+            self.timing = None
+        self._timeout = timeout
+        # timeout currently set on the transport, changed by adaptive timeouts and deadlines
+        self._current_timeout = timeout
+        # a response was given up, see _interrupted()
+        self._abandoned = False
+        self.rate_limit = rate_limit
+        # sequence number of the next query, incremented with the bus lock held
+        self.SEQUENCE_COUNTER = 1
+
+        # parameters are parsed on first use, see PARAMETERS
+        if metype not in ParameterList.METYPES:
+            raise UnknownMeComType
+        self.metype = metype
+        self._parameters = None
+        self._parameters_lock = Lock()
+
+        # per address, see detect_profile()
+        self.profile_cache = profile_cache
+        self.profiles = {}
+        self.catalogs = {}
+
+    @property
+    def PARAMETERS(self):
+        """
+        The ParameterList of this connection, created on first access.
+        :return: ParameterList
+        """
+        parameters = self._parameters
+        if parameters is None:
+            # threads racing for the first access must get the same catalog
+            with self._parameters_lock:
+                if self._parameters is None:
+                    self._parameters = ParameterList(self.metype)
+                parameters = self._parameters
+        return parameters
+
+    @PARAMETERS.setter
+    def PARAMETERS(self, parameters):
+        self._parameters = parameters
+
+    def catalog(self, address=None):
         """
-        self.lock = Lock()
+        Returns the ParameterList of a device, the catalog of its detected profile or the one of this connection.
+        :param address: int
+        :return: ParameterList
+        """
+        catalog = self.catalogs.get(address)
+        return catalog if catalog is not None else self.PARAMETERS
 
-        # initialize parameters
-        self.PARAMETERS = ParameterList(metype)
+    # used throughout the package
+    _catalog = catalog
 
-    def _find_parameter(self, parameter_name, parameter_id):
+    def _find_parameter(self, parameter_name, parameter_id, address=None):
         """
         Return Parameter() with either name or id given.
         :param parameter_name: str
         :param parameter_id: int
+        :param address: int: search the catalog of this device, see detect_profile()
         :return: Parameter
         """
         assert parameter_name is not None or parameter_id is not None
 
-        return self.PARAMETERS.get_by_name(parameter_name) if parameter_name is not None\
-            else self.PARAMETERS.get_by_id(parameter_id)
+        catalog = self._catalog(address)
+        return catalog.get_by_name(parameter_name) if parameter_name is not None\
+            else catalog.get_by_id(parameter_id)
+
+    def device(self, address=0, channel=1, priority=None):
+        """
+        Returns a handle bound to a device and channel with one attribute per parameter of its catalog,
+        e.g. dev = mc.device(1); dev.target_object_temperature = 25.0; dev.object_temperature
+        :param address: int
+        :param channel: int: parameter instance
+        :param priority: int: used for all queries if the connection uses a priority queue
+        :return: DeviceHandle
+        """
+        from .handle import handle_class
+        return handle_class(self._catalog(address))(self, address, channel, priority)
+
+    def detect_profile(self, address=0, cache=None, catalog_directory=None, cache_dir=None):
+        """
+        Detect the capabilities of a device and use the parameter catalog of its family for all later queries to
+        this address, so devices of different families can share a bus.
+        :param address: int
+        :param cache: ProfileCache: skip detection of known devices, see profile.py, defaults to self.profile_cache
+        :param catalog_directory: str: load additional parameter definitions, see catalog.load_catalog()
+        :param cache_dir: str: binary cache directory of the loaded catalog
+        :return: DeviceProfile
+        """
+        from .profile import detect_profile
+
+        profile = detect_profile(self, address, cache=cache if cache is not None else self.profile_cache)
+        self.profiles[address] = profile
+        if profile.family is not None and catalog_directory is not None:
+            from .catalog import load_catalog
+            firmware = "{}.{:02d}".format(*profile.firmware_version) if profile.firmware_version else None
+            self.catalogs[address] = load_catalog(profile.family, directory=catalog_directory,
+                                                  firmware=firmware, cache_dir=cache_dir)
+        elif profile.family is not None and profile.family != self.metype:
+            self.catalogs[address] = ParameterList(profile.family)
+        else:
+            # e.g. the device at this address was replaced by one of the family of the connection
+            self.catalogs.pop(address, None)
+        return profile
+
+    def _acquire(self, priority=None, deadline=None):
+        """
+        Acquire the bus, priority is only taken into account if the connection uses a priority queue.
+        :param priority: int
+        :param deadline: float: time.monotonic() value, raises DeadlineExceeded if the bus is not free before
+        :return:
+        """
+        timeout = -1
+        if deadline is not None:
+            timeout = max(deadline - time.monotonic(), 0.)
+        if priority is not None and isinstance(self.lock, PriorityLock):
+            acquired = self.lock.acquire(timeout=timeout, priority=priority)
+        else:
+            acquired = self.lock.acquire(timeout=timeout)
+        if not acquired:
+            raise DeadlineExceeded("deadline passed while waiting for the bus")
+
+    def queue_statistics(self):
+        """
+        Returns the queueing delay statistics per priority, empty if the connection does not use a priority queue.
+        :return: {int: dict}
+        """
+        if isinstance(self.lock, PriorityLock):
+            return self.lock.statistics()
+        return {}
 
     def _inc(self):
-        self.SEQUENCE_COUNTER += 1
-        # sequence in controller is int16 and overflows 
-        self.SEQUENCE_COUNTER = self.SEQUENCE_COUNTER % (2**16)
+        # sequence in controller is int16 and overflows, the bus lock is held by the caller
+        self.SEQUENCE_COUNTER = (self.SEQUENCE_COUNTER + 1) % (2**16)
 
     @staticmethod
     def _raise(query):
@@ -585,11 +811,14 @@ class MeComCommon:
         :return:
         """
 
+        priority = kwargs.pop("priority", None)
+        deadline = kwargs.pop("deadline", None)
+
         # search in DataFrame returns a dict
-        parameter = self._find_parameter(parameter_name, parameter_id)
+        parameter = self._find_parameter(parameter_name, parameter_id, kwargs.get("address", args[0] if args else 0))
 
         # execute query
-        vr = self._execute(VR(parameter=parameter, *args, **kwargs))
+        vr = self._execute(VR(parameter=parameter, *args, **kwargs), priority=priority, deadline=deadline)
 
         # print(vr.PAYLOAD)
         # print(vr.RESPONSE.PAYLOAD)
@@ -605,11 +834,14 @@ class MeComCommon:
         :return:
         """
 
+        priority = kwargs.pop("priority", None)
+        deadline = kwargs.pop("deadline", None)
+
         # construct from raw id and format specifier
         parameter = Parameter({"id": parameter_id, "name": None, "format": parameter_format})
 
         # execute query
-        vr = self._execute(VR(parameter=parameter, *args, **kwargs))
+        vr = self._execute(VR(parameter=parameter, *args, **kwargs), priority=priority, deadline=deadline)
 
         # print(vr.PAYLOAD)
         # print(vr.RESPONSE.PAYLOAD)
@@ -627,11 +859,14 @@ class MeComCommon:
         :return:
         """
 
+        priority = kwargs.pop("priority", None)
+        deadline = kwargs.pop("deadline", None)
+
         # search in DataFrame returns a dict
-        parameter = self._find_parameter(parameter_name, parameter_id)
+        parameter = self._find_parameter(parameter_name, parameter_id, kwargs.get("address", args[0] if args else 0))
 
         # execute query
-        vs = self._execute(VS(value=value, parameter=parameter, *args, **kwargs))
+        vs = self._execute(VS(value=value, parameter=parameter, *args, **kwargs), priority=priority, deadline=deadline)
 
         # return the query with response
         return vs
@@ -646,11 +881,14 @@ class MeComCommon:
         :return:
         """
 
+        priority = kwargs.pop("priority", None)
+        deadline = kwargs.pop("deadline", None)
+
         # construct from raw id and format specifier
         parameter = Parameter({"id": parameter_id, "name": None, "format": parameter_format})
 
         # execute query
-        vs = self._execute(VS(value=value, parameter=parameter, *args, **kwargs))
+        vs = self._execute(VS(value=value, parameter=parameter, *args, **kwargs), priority=priority, deadline=deadline)
 
         # return the query with response
         return vs
@@ -685,6 +923,51 @@ class MeComCommon:
 
         return vr.RESPONSE.PAYLOAD[0]
 
+    def get_parameters(self, parameters, *args, **kwargs):
+        """
+        Get the values of several parameters given by name or id, the bus is locked only once for all of them.
+        Raises on the first parameter answered with a device error.
+        With deadline=time.monotonic() + budget, parameters which could not be read within the budget are skipped
+        and DeadlineExceeded is raised with the values read so far (completed) and the skipped
+        parameters (incomplete).
+        With return_errors=True nothing is raised for a single parameter: device errors, timeouts, corrupted
+        responses and skipped parameters are returned as exception in place of the value.
+        :param parameters: [str or int]
+        :param args:
+        :param kwargs:
+        :return: [int or float], with return_errors [int or float or Exception]
+        """
+        priority = kwargs.pop("priority", None)
+        deadline = kwargs.pop("deadline", None)
+        return_errors = kwargs.pop("return_errors", False)
+
+        catalog = self._catalog(kwargs.get("address", args[0] if args else 0))
+        queries = [VR(parameter=catalog.get_by_name(p) if isinstance(p, str) else catalog.get_by_id(p),
+                      *args, **kwargs) for p in parameters]
+        if return_errors:
+            values = []
+            for result in self._execute_many(queries, priority=priority, deadline=deadline, collect_errors=True):
+                if isinstance(result, Exception):
+                    values.append(result)
+                    continue
+                try:
+                    self._raise(result)
+                    values.append(result.RESPONSE.PAYLOAD[0])
+                except ResponseException as ex:
+                    values.append(ex)
+            return values
+
+        self._execute_many(queries, priority=priority, deadline=deadline)
+
+        completed = [vr for vr in queries if vr.RESPONSE is not None]
+        for vr in completed:
+            self._raise(vr)
+        if len(completed) < len(queries):
+            raise DeadlineExceeded("deadline passed after {} of {} parameters".format(len(completed), len(queries)),
+                                   completed=[vr.RESPONSE.PAYLOAD[0] for vr in completed],
+                                   incomplete=[p for p, vr in zip(parameters, queries) if vr.RESPONSE is None])
+        return [vr.RESPONSE.PAYLOAD[0] for vr in queries]
+
     def set_parameter(self, value, parameter_name=None, parameter_id=None, *args, **kwargs):
         """
         Set the new value of a parameter given by name or id.
@@ -739,14 +1022,18 @@ class MeComCommon:
         """
         Resets the device after an error has occured
         """
-        rs = self._execute(RS(*args, **kwargs))
+        priority = kwargs.pop("priority", None)
+        deadline = kwargs.pop("deadline", None)
+        rs = self._execute(RS(*args, **kwargs), priority=priority, deadline=deadline)
         return type(rs.RESPONSE) == ACK
     
     def info(self,*args, **kwargs):
         """
         Resets the device after an error has occured
         """
-        info = self._execute(IF(*args, **kwargs))
+        priority = kwargs.pop("priority", None)
+        deadline = kwargs.pop("deadline", None)
+        info = self._execute(IF(*args, **kwargs), priority=priority, deadline=deadline)
         return info.RESPONSE.PAYLOAD
 
 
@@ -800,20 +1087,20 @@ class MeComCommon:
         and check whether the old automatic flash saving mechanism
         is used on your device
         :param args:
-        :param kwargs:
+        :param kwargs: e.g. address, priority
         :return: bool
         """
-        self.enable_autosave()
+        self.enable_autosave(**kwargs)
         timer_start = time.time()
 
         # value 0 means "All Parameters are saved to Flash"
-        while self.get_parameter(parameter_name="Flash Status") != 0:
+        while self.get_parameter(parameter_name="Flash Status", **kwargs) != 0:
             # check for timeout
             if time.time() - timer_start > 10:
                 raise ResponseTimeout("writing to flash timed out!")
             time.sleep(0.5)
 
-        self.disable_autosave()
+        self.disable_autosave(**kwargs)
 
         return True
 
@@ -828,17 +1115,301 @@ class MeComCommon:
         and check whether the new explicit flash saving mechanism
         is used on your device
         """
-        rs = self._execute(SP(*args, **kwargs))
+        priority = kwargs.pop("priority", None)
+        deadline = kwargs.pop("deadline", None)
+        rs = self._execute(SP(*args, **kwargs), priority=priority, deadline=deadline)
         return type(rs.RESPONSE) == ACK
 
+    def save_to_flash(self, address=0, **kwargs):
+        """
+        Writes all parameter values to the flash of the device with the mechanism it supports,
+        trigger_save_to_flash() or write_to_flash(). The profile is detected first if needed, through
+        self.profile_cache if the connection has one.
+        :param address: int
+        :param kwargs: e.g. priority
+        :return: bool
+        """
+        from .profile import FLASH_SAVE_PARAMETER
+
+        profile = self.profiles.get(address)
+        if profile is None:
+            profile = self.detect_profile(address)
+        if profile.flash_mechanism == FLASH_SAVE_PARAMETER:
+            return self.trigger_save_to_flash(address=address, **kwargs)
+        return self.write_to_flash(address=address, **kwargs)
+
+    def _read_frame(self, deadline=None):
+        """
+        Read a response frame up to the carriage return, the carriage return itself is not returned.
+        :param deadline: float: time.monotonic() value, the transport timeout is shortened as it approaches
+        :return: bytes
+        """
+        # initialize response and carriage return
+        cr = "\r".encode()
+        response_frame = b''
+        response_byte = self._read(size=1)  # read one byte at a time, timeout is set on instance level
+
+        # read until stop byte
+        while response_byte != cr:
+            response_frame += response_byte
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded("deadline passed while reading the response")
+                # shorten the timeout only when it matters, setting it may reconfigure the port
+                if self._current_timeout is None or remaining < self._current_timeout / 2:
+                    self._apply_timeout(remaining)
+            response_byte = self._read(size=1)
+        return response_frame
+
+    def _interrupted(self):
+        """
+        Called when waiting for a response is given up. The response may still arrive, it is skipped by the next
+        _receive() instead of being taken as response to the next query.
+        :return:
+        """
+        self._abandoned = True
+
+    def _apply_timeout(self, timeout):
+        """
+        Set the transport timeout if it differs from the current one.
+        :param timeout: float
+        :return:
+        """
+        if timeout != self._current_timeout:
+            self._set_timeout(timeout)
+            self._current_timeout = timeout
+
+    @staticmethod
+    def _budget(timeout, deadline):
+        """
+        Returns the timeout of a transaction, limited by the time left until deadline.
+        :param timeout: float
+        :param deadline: float: time.monotonic() value or None
+        :return: float
+        """
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("deadline passed before sending the query")
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def _send(self, frame):
+        """
+        Write a composed frame, paced by the rate limiter if there is one.
+        :param frame: bytes
+        :return:
+        """
+        if self.rate_limit is not None:
+            self.rate_limit.acquire(len(frame))
+        self._write(frame)
+
+    def _receive(self, deadline=None, sequence=None):
+        """
+        Read a response frame and account it with the rate limiter if there is one.
+        :param deadline: float: time.monotonic() value
+        :param sequence: int: sequence number of the query, late responses to given up queries are skipped
+        :return: bytes
+        """
+        response_frame = self._read_frame(deadline)
+        if self._abandoned and sequence is not None:
+            expected = "{:04X}".format(sequence).encode()
+            while response_frame[3:7] != expected:
+                response_frame = self._read_frame(deadline)
+            self._abandoned = False
+        if self.rate_limit is not None:
+            # including the carriage return
+            self.rate_limit.charge(len(response_frame) + 1)
+        return response_frame
+
+    def _transact(self, query, deadline=None):
+        """
+        Send a query and read the response frame, the bus must be locked by the caller.
+        :param query: Query
+        :param deadline: float: time.monotonic() value, raises DeadlineExceeded if the response is not read before
+        :return: bytes or None for broadcast queries
+        """
+        if self.timing is not None and query.ADDRESS != 255:
+            return self._transact_timed(query, deadline)
+
+        self._apply_timeout(self._budget(self._timeout, deadline))
+        try:
+            query.set_sequence(self.SEQUENCE_COUNTER)
+            # send query
+            self._send(query.compose())
+            # print(query.compose())
+
+            if query.ADDRESS != 255:
+                return self._receive(deadline, query.SEQUENCE)
+            return None
+        except ResponseTimeout:
+            self._interrupted()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded("deadline passed while waiting for the response") from None
+            raise
+        finally:
+            # increment sequence counter
+            self._inc()
+
+    def _transact_timed(self, query, deadline=None):
+        """
+        _transact() with the timeout learned for the address of the query, the round trip time is recorded. The
+        learned timeout bounds the whole response, not only the wait for each byte.
+        :param query: Query
+        :param deadline: float: time.monotonic() value
+        :return: bytes
+        """
+        # raises DeviceUnresponsive without touching the bus if the device is marked as down, else this query may be
+        # the one let through to probe it
+        timeout = self.timing.timeout(query.ADDRESS)
+        budget = self._budget(timeout, deadline)
+        self._apply_timeout(budget)
+
+        try:
+            query.set_sequence(self.SEQUENCE_COUNTER)
+            frame = query.compose()
+            # waiting for the rate limiter is not part of the round trip time
+            if self.rate_limit is not None:
+                self.rate_limit.acquire(len(frame))
+            start = time.perf_counter()
+            self._write(frame)
+            response_deadline = time.monotonic() + budget
+            if deadline is not None:
+                response_deadline = min(response_deadline, deadline)
+            response_frame = self._receive(response_deadline, query.SEQUENCE)
+            self.timing.success(query.ADDRESS, time.perf_counter() - start)
+            return response_frame
+        except ResponseTimeout as ex:
+            self._interrupted()
+            # a read cut short by the deadline says nothing about the device
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded("deadline passed while waiting for the response") from None
+            self.timing.failure(query.ADDRESS)
+            if isinstance(ex, DeadlineExceeded):
+                # the learned timeout passed while the response was still arriving
+                raise ResponseTimeout("no complete response from device {} within {:.3f} s".format(
+                    query.ADDRESS, budget)) from None
+            raise
+        finally:
+            self._inc()
+
+    @staticmethod
+    def _set_response(query, response_frame):
+        """
+        Parse the response frame received by _transact() into the query.
+        :param query: Query
+        :param response_frame: bytes or None
+        :return:
+        """
+        if query.ADDRESS != 255:
+            # strip source byte (! or #, but for a response always !)
+            response_frame = response_frame[1:]
+
+            # print(response_frame)
+            query.set_response(response_frame)
+        else:
+            query.RESPONSE = EmptyResponse()
+
+    def _execute(self, query, priority=None, deadline=None):
+        """
+        Send a query to the device and set its response, the bus is locked for the whole transaction.
+        :param query: Query
+        :param priority: int: only used if the connection uses a priority queue
+        :param deadline: float: time.monotonic() value, raises DeadlineExceeded if the query is not done before
+        :return: Query
+        """
+        try:
+            self._acquire(priority, deadline)
+            try:
+                response_frame = self._transact(query, deadline)
+            finally:
+                self.lock.release()
+        except DeadlineExceeded as ex:
+            ex.incomplete = [query]
+            raise
+
+        self._set_response(query, response_frame)
+
+        # did we encounter an error?
+        self._raise(query)
+
+        return query
+
+    def _transact_many(self, queries, priority=None, deadline=None, collect_errors=False):
+        """
+        Send several queries back to back while locking the bus only once and return their response frames
+        (None for broadcast queries). queries is consumed while the bus is locked, a generator may decide what to
+        send at that moment. Queries which are not done before deadline are skipped, then fewer frames than
+        queries are returned.
+        :param queries: iterable of Query or RawQuery
+        :param priority: int: only used if the connection uses a priority queue
+        :param deadline: float: time.monotonic() value
+        :param collect_errors: bool: return a ResponseException of a query (e.g. a timeout) in place of its frame
+            and continue with the next query instead of raising it
+        :return: [bytes or None or ResponseException]
+        """
+        response_frames = []
+        try:
+            self._acquire(priority, deadline)
+        except DeadlineExceeded:
+            return response_frames
+        try:
+            for query in queries:
+                try:
+                    response_frames.append(self._transact(query, deadline))
+                except DeadlineExceeded:
+                    raise
+                except ResponseException as ex:
+                    if not collect_errors:
+                        raise
+                    response_frames.append(ex)
+        except DeadlineExceeded:
+            pass
+        finally:
+            self.lock.release()
+        return response_frames
+
+    def _execute_many(self, queries, priority=None, deadline=None, collect_errors=False):
+        """
+        Send several queries back to back while locking the bus only once. Device errors are not raised, check the
+        type of each query.RESPONSE instead.
+        Queries which are not done before deadline are skipped, their RESPONSE stays None.
+        :param queries: [Query]
+        :param priority: int: only used if the connection uses a priority queue
+        :param deadline: float: time.monotonic() value
+        :param collect_errors: bool: return timeouts and corrupted responses as exception in place of their query
+            instead of raising the first one, skipped queries are returned as DeadlineExceeded
+        :return: [Query] or with collect_errors [Query or Exception]
+        """
+        response_frames = self._transact_many(queries, priority, deadline, collect_errors)
+        if not collect_errors:
+            for query, response_frame in zip(queries, response_frames):
+                self._set_response(query, response_frame)
+            return queries
+
+        results = []
+        for query, response_frame in zip(queries, response_frames):
+            if isinstance(response_frame, Exception):
+                results.append(response_frame)
+                continue
+            try:
+                self._set_response(query, response_frame)
+                results.append(query)
+            except (ResponseException, WrongChecksum) as ex:
+                results.append(ex)
+        skipped = len(queries) - len(results)
+        results.extend(DeadlineExceeded("deadline passed before the query was done") for _ in range(skipped))
+        return results
+
 
 class MeComTcp(MeComCommon):
     """
     Main class (TCP).
     """
-    SEQUENCE_COUNTER = 1
 
-    def __init__(self, ipaddress, ipport=50000, timeout=10, discardwait=None, metype='TEC'):
+    def __init__(self, ipaddress, ipport=50000, timeout=10, discardwait=None, metype='TEC', priority_queue=False,
+                 adaptive_timeout=False, rate_limit=None, profile_cache=None):
         """
         Initialize a TCP connection. Use the discardwait parameter for devices which send a message on connect, like the LTR-1200.
         :param ipaddress: str
@@ -846,23 +1417,25 @@ class MeComTcp(MeComCommon):
         :param timeout: int
         :param discardwait: int: waits at most for the specified amount of seconds for initial data to arrive, then discards it
         :param metype: str: either 'TEC', 'LDD-112x', 'LDD-130x' or 'LDD-1321'
+        :param priority_queue: bool or PriorityLock: serve waiting queries by priority instead of arbitrary order
+        :param adaptive_timeout: bool or AdaptiveTimeout: learn the timeout per device address, starting at timeout
+        :param rate_limit: RateLimiter: pace the traffic on the bus, see ratelimit.py
+        :param profile_cache: ProfileCache: profiles of known devices, see detect_profile()
         """
+        # imported on first use like pySerial for serial connections
+        import socket
+
         # initialize network connection
         self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.tcp.settimeout(timeout)
         self.tcp.connect((ipaddress, ipport))
+        self._stale = False
 
         # if configured, discard any data received right after connecting
         if discardwait is not None:
-            # wait for data to arrive
-            readable, _, _ = select.select([self.tcp], [], [], discardwait)
+            self._discard(discardwait)
 
-            # read from the socket until the buffer is empty
-            while self.tcp in readable:
-                self.tcp.recv(1024)
-                readable, _, _ = select.select([self.tcp], [], [], 0)
-
-        super().__init__(metype)
+        super().__init__(metype, priority_queue, adaptive_timeout, timeout, rate_limit, profile_cache)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.tcp.__exit__(exc_type, exc_val, exc_tb)
@@ -878,50 +1451,55 @@ class MeComTcp(MeComCommon):
         Read n=size bytes from TCP, if <n bytes are received, raise a timeout.
         """
         recv = b""
-        while (size - len(recv)) > 0:
-            recv += self.tcp.recv(size - len(recv))
-        if len(recv) < size:
+        try:
+            while (size - len(recv)) > 0:
+                chunk = self.tcp.recv(size - len(recv))
+                if not chunk:
+                    raise ResponseException("connection closed by the device")
+                recv += chunk
+        except OSError as ex:
+            import socket
+            if not isinstance(ex, socket.timeout):
+                raise
+            # a late response would be read as answer to the next query, discard it before sending again
+            self._stale = True
             raise ResponseTimeout("timeout while communication via network")
-        else:
-            return recv
+        return recv
 
-    def _execute(self, query):
-        self.lock.acquire()
-
-        try:
-            query.set_sequence(self.SEQUENCE_COUNTER)
-            # send query
-            self.tcp.sendall(query.compose())
-            # print(query.compose())
+    def _write(self, frame):
+        """
+        Send a composed frame via TCP.
+        :param frame: bytes
+        :return:
+        """
+        if self._stale:
+            self._discard(0)
+            self._stale = False
+        self.tcp.sendall(frame)
 
-            if query.ADDRESS != 255:
-                # initialize response and carriage return
-                cr = "\r".encode()
-                response_frame = b''
-                response_byte = self._read(size=1)  # read one byte at a time, timeout is set on instance level
-
-                # read until stop byte
-                while response_byte != cr:
-                    response_frame += response_byte
-                    response_byte = self._read(size=1)
-        finally:
-            # increment sequence counter
-            self._inc()
-            self.lock.release()
+    def _interrupted(self):
+        super()._interrupted()
+        self._stale = True
 
-        if query.ADDRESS != 255:
-            # strip source byte (! or #, but for a response always !)
-            response_frame = response_frame[1:]
+    def _discard(self, wait):
+        """
+        Discard all data received within wait seconds.
+        :param wait: float
+        :return:
+        """
+        import select
 
-            # print(response_frame)
-            query.set_response(response_frame)
-        else:
-            query.RESPONSE = EmptyResponse()
+        # wait for data to arrive
+        readable, _, _ = select.select([self.tcp], [], [], wait)
 
-        # did we encounter an error?
-        self._raise(query)
+        # read from the socket until the buffer is empty
+        while self.tcp in readable:
+            if not self.tcp.recv(1024):
+                break
+            readable, _, _ = select.select([self.tcp], [], [], 0)
 
-        return query
+    def _set_timeout(self, timeout):
+        self.tcp.settimeout(timeout)
 
 
 class MeComSerial(MeComCommon):
@@ -931,15 +1509,28 @@ class MeComSerial(MeComCommon):
 
     For a usage example see __main__
     """
-    SEQUENCE_COUNTER = 1
 
-    def __init__(self, serialport="/dev/ttyUSB0", timeout=1, baudrate=57600, metype='TEC'):
+    def __init__(self, serialport="/dev/ttyUSB0", timeout=1, baudrate=57600, metype='TEC', priority_queue=False,
+                 adaptive_timeout=False, rate_limit=None, backend="pyserial", profile_cache=None):
         """
         Initialize communication with serial port.
         :param serialport: str: Linux example: '/dev/ttyUSB0', Windows example: 'COM1'
         :param timeout: int
         :param metype: str: either 'TEC', 'LDD-112x', 'LDD-130x' or 'LDD-1321'
-        """
+        :param priority_queue: bool or PriorityLock: serve waiting queries by priority instead of arbitrary order
+        :param adaptive_timeout: bool or AdaptiveTimeout: learn the timeout per device address, starting at timeout
+        :param rate_limit: RateLimiter: pace the traffic on the bus, see ratelimit.py
+        :param backend: str: 'pyserial' or 'termios' (POSIX only, see rawserial.py)
+        :param profile_cache: ProfileCache: profiles of known devices, see detect_profile()
+        """
+        if backend == "termios":
+            from .rawserial import RawSerial as Serial
+        elif backend == "pyserial":
+            # pySerial is imported on first use, TCP-only users never pay for it
+            from serial import Serial
+        else:
+            raise ValueError("unknown serial backend {!r}".format(backend))
+
         # initialize serial connection
         self.ser = Serial(port=serialport, timeout=timeout, write_timeout=timeout, baudrate=baudrate)
 
@@ -947,7 +1538,11 @@ class MeComSerial(MeComCommon):
         # self.protocol = ReaderThread(serial_instance=self.ser, protocol_factory=MePacket)
         # self.receiver = self.protocol.__enter__()
 
-        super().__init__(metype)
+        super().__init__(metype, priority_queue, adaptive_timeout, timeout, rate_limit, profile_cache)
+
+        # byte budgets given as fraction of the link capacity need the baudrate
+        if rate_limit is not None and rate_limit.baudrate is None:
+            rate_limit.set_baudrate(baudrate)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.ser.__exit__(exc_type, exc_val, exc_tb)
@@ -969,50 +1564,38 @@ class MeComSerial(MeComCommon):
         else:
             return recv
 
-    def _execute(self, query):
-        self.lock.acquire()
-
-        try:
-            # clear buffers
-            self.ser.reset_output_buffer()
-            self.ser.reset_input_buffer()
+    def _set_timeout(self, timeout):
+        self.ser.timeout = timeout
 
-            query.set_sequence(self.SEQUENCE_COUNTER)
-            # send query
-            self.ser.write(query.compose())
-            # print(query.compose())
-
-            # flush write cache
+    def set_baudrate(self, baudrate):
+        """
+        Reopen the port at another speed, e.g. after changing the baud rate of the device.
+        :param baudrate: int
+        :return:
+        """
+        with self.lock:
             self.ser.flush()
+            self.ser.close()
+            self.ser.baudrate = baudrate
+            self.ser.open()
+            if self.rate_limit is not None:
+                self.rate_limit.set_baudrate(baudrate)
 
-            if query.ADDRESS != 255:
-                # initialize response and carriage return
-                cr = "\r".encode()
-                response_frame = b''
-                response_byte = self._read(size=1)  # read one byte at a time, timeout is set on instance level
-
-                # read until stop byte
-                while response_byte != cr:
-                    response_frame += response_byte
-                    response_byte = self._read(size=1)
-        finally:
-            # increment sequence counter
-            self._inc()
-            self.lock.release()
-
-        if query.ADDRESS != 255:
-            # strip source byte (! or #, but for a response always !)
-            response_frame = response_frame[1:]
-
-            # print(response_frame)
-            query.set_response(response_frame)
-        else:
-            query.RESPONSE = EmptyResponse()
+    def _write(self, frame):
+        """
+        Send a composed frame via serial.
+        :param frame: bytes
+        :return:
+        """
+        # clear buffers
+        self.ser.reset_output_buffer()
+        self.ser.reset_input_buffer()
 
-        # did we encounter an error?
-        self._raise(query)
+        # send query
+        self.ser.write(frame)
 
-        return query
+        # flush write cache
+        self.ser.flush()
 
 
 class MeCom(MeComSerial):
@@ -1023,79 +1606,6 @@ class MeCom(MeComSerial):
 
 
 if __name__ == "__main__":
-    import argparse
-
-    def setParamStr(mc, paramStr):
-        m=paramStr.split('=', 1)
-        varStr=m[0].strip()
-        valStr=m[1].strip()
-        pl=ParameterList()
-        var=pl.get_by_name(varStr)
-        if var.format=="FLOAT32":
-            val=float(valStr)
-        elif var.format=="INT32":
-            val=int(valStr)
-        mc.set_parameter(value=val, parameter_name=varStr)
-
-    def getParamStr(mc, varStr):
-        for vs in varStr.split(','):
-            try:
-                val=mc.get_parameter(parameter_name=vs)
-                print(f'{vs} = {val}')
-            except UnknownParameter as inst:
-                print(f'UnknownParameter: "{vs}"')
-
-
-    with MeComSerial("/dev/ttyUSB0") as mc:
-        # # which device are we talking to?
-        address = mc.identify()
-        status = mc.status()
-        print("connected to device: {}, status: {}".format(address, status))
-
-        parser=argparse.ArgumentParser(prog='mecom command line example interface')
-        parser.add_argument('-s', '--set', help='set parameter. Example: --set "Target Object Temperature=23" (don\'t forget the quotes)')
-        parser.add_argument('-g', '--get', help='get parameter. Example: --get "Object Temperature"')
-
-        args=parser.parse_args()
-        if args.set is not None:
-            setParamStr(mc, args.set)
-        elif args.get is not None:
-            getParamStr(mc, args.get)
-        else:
-            # get object temperature
-            temp = mc.get_parameter(parameter_name="Object Temperature", address=address)
-            print("query for object temperature, measured temperature {}C".format(temp))
-
-            # is the loop stable?
-            stable_id = mc.get_parameter(parameter_name="Temperature is Stable", address=address)
-            if stable_id == 0:
-                stable = "temperature regulation is not active"
-            elif stable_id == 1:
-                stable = "is not stable"
-            elif stable_id == 2:
-                stable = "is stable"
-            else:
-                stable = "state is unknown"
-            print("query for loop stability, loop {}".format(stable))
-
-            # # setting a new device address and get again
-            # new_address = 6
-            # value_set = mc.set_parameter(value=new_address, parameter_name="Device Address")
-            # print("setting device address to {}".format(value_set))
-            #
-            # # get device address again
-            # address = mc.identify()
-            # print("connected to device: {}".format(address))
-
-            # set target temperature to 21C
-            # success = mc.set_parameter(value=20.0, parameter_id=3000)
-            # print(success)
-
-            # save all parameter changes in the flash
-            # mc.trigger_save_to_flash()
-
-            # reset the device
-            # mc.reset_device()
-
-            print("leaving with-statement, connection will be closed")
-
+    # the command line interface moved to mecom/cli.py, run "mecom --help" or "python -m mecom --help"
+    from mecom.cli import main
+    main()
@@ -0,0 +1,187 @@
+"""
+Negotiation of a faster serial link: raises the baud rate of the device and lowers its response delay.
+
+Only devices whose catalog contains the "Baud Rate" and "Response Delay " parameters (LDD-112x) are supported,
+for other families pass the parameter ids of their protocol document.
+The new settings are not written to flash by this module, on devices with autosave enabled they persist anyway.
+"""
+
+import logging
+import time
+
+from .exceptions import ResponseException, WrongChecksum
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BAUDRATES = (921600, 460800, 230400, 115200, 57600)
+# in the unit of the device parameter, smallest first
+DEFAULT_RESPONSE_DELAYS = (0, 1, 2, 5, 10)
+
+
+class LinkReport(object):
+    """
+    Link settings and throughput before and after negotiate_serial_link().
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.baudrate_before = None
+        self.baudrate_after = None
+        self.response_delay_before = None
+        self.response_delay_after = None
+        self.throughput_before = None
+        self.throughput_after = None
+        self.rejected = []
+
+    def as_dict(self):
+        """
+        Returns a dict representation of this object.
+        :return: dict
+        """
+        return dict(self.__dict__)
+
+    def __str__(self):
+        return ("device {}: baud rate {} -> {}, response delay {} -> {}, {:.1f} -> {:.1f} queries/s".format(
+            self.address, self.baudrate_before, self.baudrate_after, self.response_delay_before,
+            self.response_delay_after, self.throughput_before or 0., self.throughput_after or 0.))
+
+
+def measure_throughput(mc, address, queries=50, parameter_name="Device Status"):
+    """
+    Measure how many queries per second a device answers.
+    :param mc: MeComSerial
+    :param address: int
+    :param queries: int
+    :param parameter_name: str
+    :return: float: queries per second
+    """
+    start = time.perf_counter()
+    for _ in range(queries):
+        mc.get_parameter(parameter_name=parameter_name, address=address)
+    return queries / (time.perf_counter() - start)
+
+
+def _verify(mc, address, queries, parameter_name):
+    """
+    Returns True if the device answers queries times without error.
+    """
+    try:
+        for _ in range(queries):
+            mc.get_parameter(parameter_name=parameter_name, address=address)
+    except (ResponseException, WrongChecksum):
+        return False
+    return True
+
+
+def _set_device_baudrate(mc, address, baudrate, baudrate_parameter):
+    """
+    Set the baud rate of the device and follow with the port. The device acknowledges at the old speed.
+    """
+    mc.set_parameter(value=baudrate, parameter_id=baudrate_parameter.id, address=address)
+    # give the device time to switch before talking at the new speed
+    time.sleep(0.05)
+    mc.set_baudrate(baudrate)
+
+
+def _restore_response_delay(mc, address, delay, previous, response_delay_parameter):
+    """
+    Set the device back to the previous response delay after a failed candidate. If that fails too the device is
+    left at the candidate, which is logged before the error is raised.
+    """
+    try:
+        mc.set_parameter(value=previous, parameter_id=response_delay_parameter.id, address=address)
+    except (ResponseException, WrongChecksum) as ex:
+        logger.error("device {}: response delay {} could not be restored after trying {}: {}".format(
+            address, previous, delay, ex))
+        raise
+
+
+def _restore_baudrate(mc, address, baudrate, previous, baudrate_parameter, verify_parameter):
+    """
+    Set the device back to the previous baud rate after a failed candidate. The device may either be at the new or
+    still at the previous speed, both are tried.
+    """
+    for speed in (baudrate, previous):
+        mc.set_baudrate(speed)
+        try:
+            mc.set_parameter(value=previous, parameter_id=baudrate_parameter.id, address=address)
+        except (ResponseException, WrongChecksum):
+            continue
+        time.sleep(0.05)
+        mc.set_baudrate(previous)
+        if _verify(mc, address, 1, verify_parameter):
+            return
+    mc.set_baudrate(previous)
+    raise ResponseException("device {} lost while negotiating {} baud".format(address, baudrate))
+
+
+def negotiate_serial_link(mc, address, baudrates=DEFAULT_BAUDRATES, response_delays=DEFAULT_RESPONSE_DELAYS,
+                          verify_queries=20, measure_queries=50, baudrate_parameter="Baud Rate",
+                          response_delay_parameter="Response Delay ", verify_parameter="Device Status"):
+    """
+    Find the fastest link settings a device reliably works with. The response delay is lowered first, then the
+    baud rate is raised, every candidate has to pass verify_queries queries without error. Failing candidates are
+    rolled back, if the device is lost at a new baud rate both speeds are tried to restore the previous setting.
+    Do not use the connection from other threads during the negotiation.
+    :param mc: MeComSerial
+    :param address: int: address of the device, the broadcast address is not allowed
+    :param baudrates: [int]: candidates, fastest are tried first
+    :param response_delays: [int]: candidates in device units, smallest are tried first
+    :param verify_queries: int
+    :param measure_queries: int: queries used to measure the throughput before and after
+    :param baudrate_parameter: str or int: name or id of the baud rate parameter
+    :param response_delay_parameter: str or int: name or id of the response delay parameter, None to skip
+    :param verify_parameter: str: parameter read for verification and throughput measurement
+    :return: LinkReport
+    """
+    assert address not in (0, 255), "negotiation needs the address of a single device"
+
+    catalog = mc._catalog(address)
+
+    def find(parameter):
+        return catalog.get_by_name(parameter) if isinstance(parameter, str) else catalog.get_by_id(parameter)
+
+    baudrate_parameter = find(baudrate_parameter)
+    report = LinkReport(address)
+    report.throughput_before = measure_throughput(mc, address, measure_queries, verify_parameter)
+    report.baudrate_before = mc.ser.baudrate
+    report.baudrate_after = report.baudrate_before
+
+    # response delay, stays at the current speed
+    if response_delay_parameter is not None:
+        response_delay_parameter = find(response_delay_parameter)
+        current = mc.get_parameter(parameter_id=response_delay_parameter.id, address=address)
+        report.response_delay_before = current
+        report.response_delay_after = current
+        for delay in sorted(d for d in response_delays if d < current):
+            try:
+                mc.set_parameter(value=delay, parameter_id=response_delay_parameter.id, address=address)
+            except (ResponseException, WrongChecksum):
+                # a missing or corrupted ACK does not mean the device kept its delay
+                report.rejected.append(("response delay", delay))
+                _restore_response_delay(mc, address, delay, current, response_delay_parameter)
+                continue
+            if _verify(mc, address, verify_queries, verify_parameter):
+                report.response_delay_after = delay
+                break
+            report.rejected.append(("response delay", delay))
+            _restore_response_delay(mc, address, delay, current, response_delay_parameter)
+
+    # baud rate, the port has to follow the device
+    previous = report.baudrate_before
+    for baudrate in sorted((b for b in baudrates if b > previous), reverse=True):
+        try:
+            _set_device_baudrate(mc, address, baudrate, baudrate_parameter)
+        except (ResponseException, WrongChecksum):
+            # a missing or corrupted ACK does not mean the device kept its speed
+            report.rejected.append(("baud rate", baudrate))
+            _restore_baudrate(mc, address, baudrate, previous, baudrate_parameter, verify_parameter)
+            continue
+        if _verify(mc, address, verify_queries, verify_parameter):
+            report.baudrate_after = baudrate
+            break
+        report.rejected.append(("baud rate", baudrate))
+        _restore_baudrate(mc, address, baudrate, previous, baudrate_parameter, verify_parameter)
+
+    report.throughput_after = measure_throughput(mc, address, measure_queries, verify_parameter)
+    return report
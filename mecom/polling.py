@@ -0,0 +1,238 @@
+"""
+Change driven adaptive polling of slow moving telemetry.
+"""
+
+import logging
+import time
+from threading import Thread, Event
+
+from .exceptions import ResponseException, WrongChecksum, UnknownParameter
+from .mecom import VR, DeviceError
+
+logger = logging.getLogger(__name__)
+
+# "Device Status" values
+STATUS_READY = 1
+STATUS_RUN = 2
+STATUS_ERROR = 3
+
+# "Temperature is Stable" value of a stable control loop
+TEMPERATURE_STABLE = 2
+
+
+class PolledParameter(object):
+    """
+    Sampling state of one parameter of an AdaptivePoller.
+    """
+
+    def __init__(self, parameter, deadband=0., min_interval=0.1, max_interval=10.):
+        """
+        :param parameter: Parameter
+        :param deadband: float: changes smaller than this are neither emitted nor count as activity
+        :param min_interval: float: seconds
+        :param max_interval: float: seconds
+        """
+        self.parameter = parameter
+        self.deadband = deadband
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+        self.interval = min_interval
+        self.next_due = 0.
+        self.value = None
+        self.timestamp = None
+        self.emitted = None
+        self.rate = 0.
+
+    def update(self, value, timestamp, growth, upper_bound):
+        """
+        Store a new sample and adapt the sampling interval to the rate of change.
+        :param value: int or float
+        :param timestamp: float: monotonic seconds
+        :param growth: float: maximum factor the interval may grow by per sample
+        :param upper_bound: float: current upper bound of the interval in seconds
+        :return: bool: True if the change is significant and has to be emitted
+        """
+        significant = self.emitted is None or abs(value - self.emitted) > self.deadband
+        if self.value is not None and timestamp > self.timestamp:
+            # exponentially weighted rate of change
+            rate = abs(value - self.value) / (timestamp - self.timestamp)
+            self.rate = 0.5 * self.rate + 0.5 * rate
+
+        if significant and self.emitted is not None:
+            # transient, sample as fast as allowed
+            self.interval = self.min_interval
+        elif self.deadband > 0 and self.rate > 0:
+            # sample often enough that the value moves about one deadband per interval, grow slowly
+            self.interval = min(self.deadband / self.rate, self.interval * growth)
+        else:
+            self.interval = self.interval * growth
+        self.interval = max(self.min_interval, min(upper_bound, self.interval))
+
+        self.value = value
+        self.timestamp = timestamp
+        self.next_due = timestamp + self.interval
+        if significant:
+            self.emitted = value
+        return significant
+
+
+class AdaptivePoller(object):
+    """
+    Polls parameters of one device channel with an interval adapted to how fast each value changes. Only changes
+    larger than the deadband of a parameter are passed to the callback.
+
+    The "Device Status" is polled every status_interval seconds and scales the intervals: in Ready the
+    intervals may grow to max_interval * ready_factor, in Error every parameter is sampled at min_interval.
+    Devices reporting a "Temperature is Stable" parameter (TEC) are limited to ramp_interval while not stable.
+    """
+
+    def __init__(self, mc, parameters, callback, address=0, parameter_instance=1, min_interval=0.1, max_interval=10.,
+                 growth=1.5, status_interval=1., ready_factor=4., ramp_interval=1.):
+        """
+        :param mc: MeComSerial or MeComTcp
+        :param parameters: {str: float}: parameter name and deadband, or [str] for a deadband of 0
+        :param callback: callable(address, parameter_instance, name, timestamp, value), timestamp is unix time
+        :param address: int
+        :param parameter_instance: int
+        :param min_interval: float: seconds
+        :param max_interval: float: seconds
+        :param growth: float: maximum factor an interval grows by per unchanged sample
+        :param status_interval: float: seconds between "Device Status" reads
+        :param ready_factor: float: interval scale while the device is in Ready
+        :param ramp_interval: float: maximum interval while the temperature is not stable
+        """
+        if not isinstance(parameters, dict):
+            parameters = {name: 0. for name in parameters}
+
+        self.mc = mc
+        self.callback = callback
+        self.address = address
+        self.parameter_instance = parameter_instance
+        self.growth = growth
+        self.ready_factor = ready_factor
+        self.ramp_interval = ramp_interval
+
+        catalog = mc._catalog(address)
+        self.parameters = [PolledParameter(catalog.get_by_name(name), deadband, min_interval, max_interval)
+                           for name, deadband in parameters.items()]
+        # status and stability are fixed rate inputs of the adaptation
+        self._status = PolledParameter(catalog.get_by_name("Device Status"), 0, status_interval,
+                                       status_interval)
+        self._inputs = [self._status]
+        self._stability = None
+        try:
+            self._stability = PolledParameter(catalog.get_by_name("Temperature is Stable"), 0,
+                                              status_interval, status_interval)
+            self._inputs.append(self._stability)
+        except UnknownParameter:
+            pass
+
+        self.queries = 0
+        # failed reads and callbacks
+        self.errors = 0
+        self._stop = Event()
+        self._thread = None
+
+    def _upper_bound(self, p):
+        """
+        Returns the current upper bound of the interval of a parameter derived from the device state.
+        :param p: PolledParameter
+        :return: float
+        """
+        if self._status.value == STATUS_ERROR:
+            return 0.
+        upper = p.max_interval
+        if self._status.value == STATUS_READY:
+            upper = p.max_interval * self.ready_factor
+        if self._stability is not None and self._stability.value is not None \
+                and self._stability.value != TEMPERATURE_STABLE:
+            upper = min(upper, self.ramp_interval)
+        return upper
+
+    def poll_once(self):
+        """
+        Read all parameters which are due with a single bus lock and emit significant changes.
+        :return: float: monotonic time at which the next parameter is due
+        """
+        now = time.monotonic()
+        due = [p for p in self._inputs + self.parameters if p.next_due <= now]
+        if due:
+            queries = [VR(parameter=p.parameter, address=self.address, parameter_instance=self.parameter_instance)
+                       for p in due]
+            try:
+                self.mc._execute_many(queries)
+            except (ResponseException, WrongChecksum) as ex:
+                self.errors += 1
+                logger.warning("device {}: {}".format(self.address, ex))
+                for p in due:
+                    p.next_due = now + p.min_interval
+                return now + min(p.min_interval for p in due)
+            self.queries += len(queries)
+
+            timestamp = time.time()
+            now = time.monotonic()
+            status_before = self._status.value
+            for p, vr in zip(due, queries):
+                if type(vr.RESPONSE) is DeviceError:
+                    logger.warning("device {}: {} raised {}".format(self.address, p.parameter.name,
+                                                                     vr.RESPONSE.error()[1]))
+                    p.next_due = now + p.max_interval
+                    continue
+                if p in self._inputs:
+                    p.update(vr.RESPONSE.PAYLOAD[0], now, 1., p.max_interval)
+
+            if self._status.value != status_before:
+                # the device changed its state, resample everything right away
+                for p in self.parameters:
+                    p.next_due = min(p.next_due, now)
+            for p, vr in zip(due, queries):
+                if p in self._inputs or type(vr.RESPONSE) is DeviceError:
+                    continue
+                if p.update(vr.RESPONSE.PAYLOAD[0], now, self.growth, self._upper_bound(p)):
+                    self._emit(p, timestamp)
+
+        return min(p.next_due for p in self._inputs + self.parameters)
+
+    def _emit(self, p, timestamp):
+        # a failing callback must not stop the polling thread
+        try:
+            self.callback(self.address, self.parameter_instance, p.parameter.name, timestamp, p.value)
+        except Exception:
+            self.errors += 1
+            logger.exception("device {}: callback failed for {}".format(self.address, p.parameter.name))
+
+    def run(self, duration=None):
+        """
+        Poll until stop() is called or for duration seconds.
+        :param duration: float
+        :return:
+        """
+        end = None if duration is None else time.monotonic() + duration
+        while not self._stop.is_set():
+            next_due = self.poll_once()
+            if end is not None and next_due >= end:
+                break
+            self._stop.wait(max(0., next_due - time.monotonic()))
+
+    def start(self):
+        """
+        Poll in a background thread.
+        :return:
+        """
+        self._stop.clear()
+        self._thread = Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def intervals(self):
+        """
+        Returns the current sampling interval of every parameter.
+        :return: {str: float}
+        """
+        return {p.parameter.name: p.interval for p in self.parameters}
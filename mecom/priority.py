@@ -0,0 +1,173 @@
+"""
+Priority aware replacement for the bus lock.
+"""
+
+import time
+from threading import Lock, Event
+
+# lower value means higher priority
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class QueueStatistics(object):
+    """
+    Queueing delay statistics of one priority level.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_delay = 0.
+        self.max_delay = 0.
+        self.promoted = 0
+
+    def add(self, delay, promoted=False):
+        """
+        Record the time a request spent waiting for the bus.
+        :param delay: float: seconds
+        :param promoted: bool: True if the request was handed the bus because of starvation protection
+        :return:
+        """
+        self.count += 1
+        self.total_delay += delay
+        if delay > self.max_delay:
+            self.max_delay = delay
+        if promoted:
+            self.promoted += 1
+
+    def as_dict(self):
+        """
+        Returns a dict representation of this object.
+        :return: dict
+        """
+        return {"count": self.count,
+                "mean_delay": self.total_delay / self.count if self.count else 0.,
+                "max_delay": self.max_delay,
+                "promoted": self.promoted}
+
+
+class _Waiter(object):
+    """
+    A thread waiting for the bus.
+    """
+    __slots__ = ("priority", "enqueued", "event")
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.event = Event()
+
+
+class PriorityLock(object):
+    """
+    Drop-in replacement for threading.Lock where waiting threads are served in order of priority instead of
+    arbitrary order. A waiting request gains one priority level per aging_interval seconds, so background
+    requests are never starved by a constant stream of high priority requests.
+    """
+
+    def __init__(self, aging_interval=0.25, default_priority=PRIORITY_NORMAL):
+        """
+        :param aging_interval: float: seconds of waiting after which a request is promoted by one priority level
+        :param default_priority: int: priority used if acquire() is called without one
+        """
+        self.aging_interval = aging_interval
+        self.default_priority = default_priority
+
+        self._mutex = Lock()
+        self._locked = False
+        self._waiters = []
+        self._statistics = {}
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def _effective_priority(self, waiter, now):
+        if self.aging_interval is None or self.aging_interval <= 0:
+            return waiter.priority
+        return waiter.priority - int((now - waiter.enqueued) / self.aging_interval)
+
+    def _record(self, priority, delay, promoted=False):
+        if priority not in self._statistics:
+            self._statistics[priority] = QueueStatistics()
+        self._statistics[priority].add(delay, promoted)
+
+    def locked(self):
+        return self._locked
+
+    def acquire(self, blocking=True, timeout=-1, priority=None):
+        """
+        Acquire the lock, waiting behind requests with a higher (numerically lower) priority.
+        :param blocking: bool
+        :param timeout: float: seconds, -1 waits forever
+        :param priority: int: see PRIORITY_HIGH, PRIORITY_NORMAL and PRIORITY_LOW
+        :return: bool
+        """
+        if priority is None:
+            priority = self.default_priority
+
+        with self._mutex:
+            if not self._locked and not self._waiters:
+                self._locked = True
+                self._record(priority, 0.)
+                return True
+            if not blocking:
+                return False
+            waiter = _Waiter(priority)
+            self._waiters.append(waiter)
+
+        if waiter.event.wait(None if timeout < 0 else timeout):
+            return True
+
+        with self._mutex:
+            # we might have been handed the lock right after the wait timed out
+            if waiter.event.is_set():
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def release(self):
+        """
+        Release the lock and hand it over to the most urgent waiting thread.
+        :return:
+        """
+        with self._mutex:
+            if not self._locked:
+                raise RuntimeError("release unlocked lock")
+            if not self._waiters:
+                self._locked = False
+                return
+
+            now = time.monotonic()
+            # waiters are few, a linear scan is cheaper than keeping a heap up to date with aging
+            best = min(self._waiters, key=lambda w: (self._effective_priority(w, now), w.enqueued))
+            self._waiters.remove(best)
+            promoted = any(w.priority < best.priority for w in self._waiters)
+            self._record(best.priority, now - best.enqueued, promoted)
+
+            # the lock stays locked and is handed over directly
+            best.event.set()
+
+    def queue_length(self):
+        """
+        Returns the number of threads waiting for the lock.
+        :return: int
+        """
+        with self._mutex:
+            return len(self._waiters)
+
+    def statistics(self):
+        """
+        Returns the queueing delay statistics per priority.
+        :return: {int: dict}
+        """
+        with self._mutex:
+            return {priority: stats.as_dict() for priority, stats in sorted(self._statistics.items())}
+
+    def reset_statistics(self):
+        with self._mutex:
+            self._statistics = {}
@@ -0,0 +1,218 @@
+"""
+Device capability detection.
+
+A DeviceProfile holds what has to be known about a device to talk to it: its family (the metype of the parameter
+catalog), model, firmware version, channel count and which flash saving mechanism it uses. Profiles are detected
+from the ?IF response and the common identification parameters and cached on disk by serial number, so a known
+device costs a single query.
+"""
+
+import json
+import os
+import re
+from threading import Lock
+
+from .exceptions import ResponseException
+
+# identification parameters common to all device families
+DEVICE_TYPE_ID = 100
+HARDWARE_VERSION_ID = 101
+SERIAL_NUMBER_ID = 102
+FIRMWARE_VERSION_ID = 103
+
+# device type (model number) -> family
+_FAMILIES = [
+    (range(1300, 1310), "LDD-130x"),
+    (range(1321, 1322), "LDD-1321"),
+    (range(1120, 1122), "LDD-112x"),
+    (range(1124, 1130), "LDD-112x"),
+    (range(1000, 1300), "TEC"),
+]
+
+# models with more than one channel, all others are assumed to have one
+_CHANNELS = {1122: 2, 1123: 2}
+
+# ?IF strings contain the model, e.g. "TEC-1091", and usually the firmware version, e.g. "05.10"
+_MODEL = re.compile(r"(TEC|LDD|LTR)-?(\d{4})")
+_VERSION = re.compile(r"(\d{1,2})\.(\d{2})")
+
+FLASH_SAVE_PARAMETER = "SP"  # trigger_save_to_flash()
+FLASH_AUTOSAVE = "autosave"  # write_to_flash()
+
+
+def family_of(device_type):
+    """
+    Returns the family (metype) of a model number, None if it is unknown.
+    :param device_type: int
+    :return: str
+    """
+    for models, family in _FAMILIES:
+        if device_type in models:
+            return family
+    return None
+
+
+class DeviceProfile(object):
+    """
+    Capabilities of one device.
+    """
+
+    def __init__(self, serial_number, device_type=None, family=None, firmware_version=None, hardware_version=None,
+                 channels=1, info=None):
+        """
+        :param serial_number: int
+        :param device_type: int: model number, e.g. 1091 for a TEC-1091
+        :param family: str: metype of the parameter catalog
+        :param firmware_version: (int, int): major and minor version
+        :param hardware_version: int
+        :param channels: int
+        :param info: str: the ?IF response
+        """
+        self.serial_number = serial_number
+        self.device_type = device_type
+        self.family = family
+        self.firmware_version = tuple(firmware_version) if firmware_version is not None else None
+        self.hardware_version = hardware_version
+        self.channels = channels
+        self.info = info
+
+    @property
+    def flash_mechanism(self):
+        """
+        Returns FLASH_SAVE_PARAMETER for devices saving to flash with the SP command (TEC >= 6.00,
+        LDD-130x >= 2.00, LDD-1321) and FLASH_AUTOSAVE for the old automatic mechanism.
+        :return: str
+        """
+        version = self.firmware_version or (0, 0)
+        if self.family == "LDD-1321":
+            return FLASH_SAVE_PARAMETER
+        if self.family == "TEC" and version >= (6, 0):
+            return FLASH_SAVE_PARAMETER
+        if self.family == "LDD-130x" and version >= (2, 0):
+            return FLASH_SAVE_PARAMETER
+        return FLASH_AUTOSAVE
+
+    def as_dict(self):
+        """
+        Returns a dict representation of this object.
+        :return: dict
+        """
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, profile_dict):
+        return cls(**profile_dict)
+
+    def __repr__(self):
+        version = "{}.{:02d}".format(*self.firmware_version) if self.firmware_version else "?"
+        return "DeviceProfile({} {} fw {}, {} channel(s), serial {})".format(
+            self.family, self.device_type, version, self.channels, self.serial_number)
+
+
+class ProfileCache(object):
+    """
+    Profiles stored in a JSON file, keyed by serial number.
+    """
+
+    def __init__(self, path="~/.cache/mecom/profiles.json"):
+        """
+        :param path: str
+        """
+        self.path = os.path.expanduser(path)
+        self._lock = Lock()
+        self._profiles = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path) as f:
+                    self._profiles = json.load(f)
+            except ValueError:
+                # broken file, profiles are detected again
+                self._profiles = {}
+
+    def get(self, serial_number):
+        """
+        :param serial_number: int
+        :return: DeviceProfile or None
+        """
+        with self._lock:
+            profile = self._profiles.get(str(serial_number))
+        return DeviceProfile.from_dict(profile) if profile is not None else None
+
+    def put(self, profile):
+        """
+        Store a profile and write the file.
+        :param profile: DeviceProfile
+        :return:
+        """
+        with self._lock:
+            self._profiles[str(profile.serial_number)] = profile.as_dict()
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = "{}.{}.tmp".format(self.path, os.getpid())
+            with open(tmp, "w") as f:
+                json.dump(self._profiles, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+
+
+def parse_info(info):
+    """
+    Extract model and firmware version from a ?IF response.
+    :param info: str
+    :return: (str or None, int or None, (int, int) or None): family prefix, model number and firmware version
+    """
+    prefix, model, version = None, None, None
+    match = _MODEL.search(info or "")
+    if match:
+        prefix, model = match.group(1), int(match.group(2))
+    match = _VERSION.search(info or "")
+    if match:
+        version = (int(match.group(1)), int(match.group(2)))
+    return prefix, model, version
+
+
+def detect_profile(mc, address, cache=None):
+    """
+    Detect the profile of the device at address. With a cache, known devices cost a single query (the serial
+    number), unknown devices are identified with ?IF and the identification parameters and added to the cache.
+    :param mc: MeComSerial or MeComTcp
+    :param address: int
+    :param cache: ProfileCache
+    :return: DeviceProfile
+    """
+    serial_number = mc.get_parameter_raw(SERIAL_NUMBER_ID, "INT32", address=address)
+    if cache is not None:
+        profile = cache.get(serial_number)
+        if profile is not None:
+            return profile
+
+    def read(parameter_id):
+        try:
+            return mc.get_parameter_raw(parameter_id, "INT32", address=address)
+        except ResponseException:
+            return None
+
+    try:
+        info = mc.info(address=address)
+    except ResponseException:
+        info = None
+    prefix, model, version = parse_info(info)
+
+    device_type = read(DEVICE_TYPE_ID)
+    if device_type is None:
+        device_type = model
+    family = family_of(device_type) if device_type is not None else None
+    if family is None and prefix is not None:
+        family = "TEC" if prefix == "TEC" else None
+
+    firmware = read(FIRMWARE_VERSION_ID)
+    if firmware is not None:
+        # e.g. 510 for v5.10
+        version = (firmware // 100, firmware % 100)
+
+    profile = DeviceProfile(serial_number=serial_number, device_type=device_type, family=family,
+                            firmware_version=version, hardware_version=read(HARDWARE_VERSION_ID),
+                            channels=_CHANNELS.get(device_type, 1), info=info.strip() if info else None)
+    if cache is not None:
+        cache.put(profile)
+    return profile
@@ -0,0 +1,171 @@
+"""
+Token bucket limiting the traffic a connection puts on its bus.
+"""
+
+import time
+from collections import deque
+from threading import Lock
+
+# start bit, 8 data bits, stop bit
+BITS_PER_BYTE = 10
+
+
+class RateLimiter(object):
+    """
+    Token bucket for one bus, either counting transactions or bytes. In byte mode every query costs the length of
+    its composed frame before it is written and the length of the response frame once it is read, so polling
+    many parameters flat out never exceeds the budget. The budget is given directly or as a fraction of the link
+    capacity (baudrate / 10 bytes per second).
+
+    Tokens are reserved before waiting: a query that finds the bucket empty takes its tokens on credit and sleeps
+    until they would have been refilled. Connections sharing a physical bus (e.g. a RS-485 segment behind several
+    gateways) may share one instance.
+    """
+
+    def __init__(self, transactions_per_second=None, bytes_per_second=None, utilization=None, baudrate=None,
+                 burst=None, window=10.):
+        """
+        Give exactly one of transactions_per_second, bytes_per_second or utilization.
+        :param transactions_per_second: float
+        :param bytes_per_second: float
+        :param utilization: float: fraction of the link capacity, e.g. 0.5, needs the baudrate
+        :param baudrate: int: set by MeComSerial if not given
+        :param burst: float: bucket size in transactions or bytes, defaults to 100 ms of budget
+        :param window: float: seconds covered by statistics()
+        """
+        assert [transactions_per_second, bytes_per_second, utilization].count(None) == 2, \
+            "give exactly one of transactions_per_second, bytes_per_second or utilization"
+        self.count_bytes = transactions_per_second is None
+        self._transactions_per_second = transactions_per_second
+        self._bytes_per_second = bytes_per_second
+        self._utilization = utilization
+        self._burst = burst
+        self.window = window
+
+        self._lock = Lock()
+        self.baudrate = None
+        self.rate = None
+        self.burst = None
+        self._tokens = None
+        self._last = time.monotonic()
+        self.set_baudrate(baudrate)
+
+        # (time, bytes) of every transaction within the window
+        self._events = deque()
+        self._window_bytes = 0
+        self.transactions = 0
+        self.bytes = 0
+        self.waited = 0.
+        self._started = time.monotonic()
+
+    def set_baudrate(self, baudrate):
+        """
+        Update the link capacity, e.g. after MeComSerial.set_baudrate().
+        :param baudrate: int
+        :return:
+        """
+        with self._lock:
+            self.baudrate = baudrate
+            if self._transactions_per_second is not None:
+                self.rate = float(self._transactions_per_second)
+                minimum = 1.
+            elif self._bytes_per_second is not None:
+                self.rate = float(self._bytes_per_second)
+                minimum = 64.
+            elif baudrate is not None:
+                self.rate = self._utilization * baudrate / BITS_PER_BYTE
+                minimum = 64.
+            else:
+                # utilization without known baudrate, nothing to limit yet
+                self.rate = None
+                return
+            self.burst = self._burst if self._burst is not None else max(minimum, 0.1 * self.rate)
+            if self._tokens is None:
+                self._tokens = self.burst
+
+    def _take(self, cost):
+        """
+        Take cost tokens, the bucket may go into debt. Returns the seconds until the debt is paid back.
+        """
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        self._tokens -= cost
+        return -self._tokens / self.rate if self._tokens < 0 else 0.
+
+    def _record(self, size):
+        now = time.monotonic()
+        self._events.append((now, size))
+        self._window_bytes += size
+        while self._events and self._events[0][0] < now - self.window:
+            self._window_bytes -= self._events.popleft()[1]
+
+    def acquire(self, frame_length):
+        """
+        Wait until a query of frame_length bytes may be written. Called by the connection with the bus locked.
+        :param frame_length: int
+        :return: float: seconds waited
+        """
+        with self._lock:
+            self.transactions += 1
+            self.bytes += frame_length
+            self._record(frame_length)
+            wait = 0.
+            if self.rate is not None:
+                wait = self._take(frame_length if self.count_bytes else 1)
+            self.waited += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def charge(self, frame_length):
+        """
+        Account the response frame of a query, the cost is paid by the next acquire() in byte mode.
+        :param frame_length: int
+        :return:
+        """
+        with self._lock:
+            self.bytes += frame_length
+            self._window_bytes += frame_length
+            if self._events:
+                t, size = self._events[-1]
+                self._events[-1] = (t, size + frame_length)
+            if self.rate is not None and self.count_bytes:
+                self._take(frame_length)
+
+    def statistics(self):
+        """
+        Returns totals and the load of the last window seconds: transactions and bytes per second, the fraction
+        of the budget used and, if the baudrate is known, the fraction of the link capacity used.
+        :return: dict
+        """
+        with self._lock:
+            now = time.monotonic()
+            while self._events and self._events[0][0] < now - self.window:
+                self._window_bytes -= self._events.popleft()[1]
+            # shorter than the window right after start
+            span = max(min(self.window, now - self._started), 1e-9)
+            transactions_per_second = len(self._events) / span
+            bytes_per_second = self._window_bytes / span
+            statistics = {"transactions": self.transactions,
+                          "bytes": self.bytes,
+                          "waited": self.waited,
+                          "transactions_per_second": transactions_per_second,
+                          "bytes_per_second": bytes_per_second,
+                          "budget_utilization": None,
+                          "link_utilization": None}
+            if self.rate is not None:
+                used = bytes_per_second if self.count_bytes else transactions_per_second
+                statistics["budget_utilization"] = used / self.rate
+            if self.baudrate:
+                statistics["link_utilization"] = bytes_per_second * BITS_PER_BYTE / self.baudrate
+            return statistics
+
+    def reset_statistics(self):
+        with self._lock:
+            self._events.clear()
+            self._window_bytes = 0
+            self.transactions = 0
+            self.bytes = 0
+            self.waited = 0.
+            self._started = time.monotonic()
@@ -0,0 +1,363 @@
+"""
+Serial transport on raw termios file descriptors (POSIX only), selected with MeComSerial(..., backend="termios"),
+and a multiplexer serving many such ports from a single thread:
+
+    buses = [MeComSerial(port, backend="termios") for port in ("/dev/ttyUSB0", "/dev/ttyUSB1")]
+    mux = SerialMultiplexer(buses)
+    values = mux.get_parameters([(bus, 1) for bus in buses], ["Object Temperature", "Actual Output Current"])
+
+RawSerial implements the subset of pySerial's Serial used by MeComSerial. The port is opened non-blocking, reads
+fetch everything available with one system call into a buffer, so reading a frame byte by byte costs no system call
+per byte. SerialMultiplexer keeps one query in flight per port and waits for the responses of all ports with one
+selector (epoll on Linux) instead of one blocking thread per port.
+"""
+
+import os
+import selectors
+import termios
+import time
+
+from .exceptions import DeviceUnresponsive, ResponseException, ResponseTimeout, WrongResponseSequence
+from .mecom import DeviceError, VR
+
+_READ_SIZE = 4096
+
+
+class RawSerial(object):
+    """
+    8N1 serial port without flow control on a termios file descriptor.
+    """
+
+    def __init__(self, port, baudrate=57600, timeout=1, write_timeout=None):
+        """
+        :param port: str: e.g. "/dev/ttyUSB0"
+        :param baudrate: int: a speed supported by termios, e.g. 57600 or 115200
+        :param timeout: float: seconds, read() returns what it got so far after this time, None waits forever
+        :param write_timeout: float: seconds, defaults to timeout
+        """
+        self.port = port
+        self._baudrate = baudrate
+        self.timeout = timeout
+        self.write_timeout = write_timeout if write_timeout is not None else timeout
+        self.fd = None
+        self._buffer = bytearray()
+        self._selector = None
+        self.open()
+
+    def open(self):
+        self.fd = os.open(self.port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            self._configure()
+        except Exception:
+            os.close(self.fd)
+            self.fd = None
+            raise
+        self._buffer.clear()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.fd, selectors.EVENT_READ)
+
+    def _configure(self):
+        speed = getattr(termios, "B{}".format(self._baudrate), None)
+        if speed is None:
+            raise ValueError("baud rate {} is not supported by termios".format(self._baudrate))
+        iflag, oflag, cflag, lflag, _, _, cc = termios.tcgetattr(self.fd)
+        iflag &= ~(termios.IGNBRK | termios.BRKINT | termios.PARMRK | termios.ISTRIP | termios.INLCR |
+                   termios.IGNCR | termios.ICRNL | termios.IXON | termios.IXOFF | termios.IXANY | termios.INPCK)
+        oflag &= ~termios.OPOST
+        lflag &= ~(termios.ECHO | termios.ECHONL | termios.ICANON | termios.ISIG | termios.IEXTEN)
+        cflag &= ~(termios.CSIZE | termios.PARENB | termios.CSTOPB | getattr(termios, "CRTSCTS", 0))
+        cflag |= termios.CS8 | termios.CREAD | termios.CLOCAL
+        # reads never block in the kernel, waiting is done with the selector
+        cc[termios.VMIN] = 0
+        cc[termios.VTIME] = 0
+        termios.tcsetattr(self.fd, termios.TCSANOW, [iflag, oflag, cflag, lflag, speed, speed, cc])
+
+    @property
+    def baudrate(self):
+        return self._baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate):
+        self._baudrate = baudrate
+        if self.fd is not None:
+            self._configure()
+
+    @property
+    def is_open(self):
+        return self.fd is not None
+
+    def fileno(self):
+        return self.fd
+
+    def fill(self):
+        """
+        Move all bytes the kernel has buffered into the read buffer without waiting.
+        :return: int: number of bytes read
+        """
+        total = 0
+        while True:
+            try:
+                data = os.read(self.fd, _READ_SIZE)
+            except BlockingIOError:
+                return total
+            if not data:
+                return total
+            self._buffer += data
+            total += len(data)
+            if len(data) < _READ_SIZE:
+                return total
+
+    def take_frame(self, terminator=b"\r"):
+        """
+        Remove and return the first complete frame of the read buffer without the terminator.
+        :return: bytes or None
+        """
+        end = self._buffer.find(terminator)
+        if end < 0:
+            return None
+        frame = bytes(self._buffer[:end])
+        del self._buffer[:end + 1]
+        return frame
+
+    def read(self, size=1):
+        """
+        Read size bytes, fewer if the timeout expires first.
+        :param size: int
+        :return: bytes
+        """
+        buffer = self._buffer
+        if len(buffer) < size:
+            self.fill()
+            if len(buffer) < size:
+                deadline = None if self.timeout is None else time.monotonic() + self.timeout
+                while len(buffer) < size:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    if self._selector.select(remaining):
+                        self.fill()
+        data = bytes(buffer[:size])
+        del buffer[:size]
+        return data
+
+    def write(self, data):
+        """
+        :param data: bytes
+        :return: int
+        """
+        view = memoryview(data)
+        deadline = None if self.write_timeout is None else time.monotonic() + self.write_timeout
+        while view:
+            try:
+                written = os.write(self.fd, view)
+            except BlockingIOError:
+                written = 0
+            view = view[written:]
+            if view:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise ResponseTimeout("timeout while writing to {}".format(self.port))
+                with selectors.DefaultSelector() as selector:
+                    selector.register(self.fd, selectors.EVENT_WRITE)
+                    selector.select(remaining)
+        return len(data)
+
+    def flush(self):
+        # wait until the output has been transmitted
+        termios.tcdrain(self.fd)
+
+    def reset_input_buffer(self):
+        self._buffer.clear()
+        termios.tcflush(self.fd, termios.TCIFLUSH)
+
+    def reset_output_buffer(self):
+        termios.tcflush(self.fd, termios.TCOFLUSH)
+
+    def close(self):
+        if self.fd is None:
+            return
+        self._selector.close()
+        os.close(self.fd)
+        self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _Port(object):
+    """
+    Progress of the queries of one connection within SerialMultiplexer.execute().
+    """
+
+    def __init__(self, mc, queries):
+        self.mc = mc
+        self.queries = queries
+        self.results = [None] * len(queries)
+        self.next = 0
+        self.query = None
+        self.sent = None
+        self.expires = None
+
+
+class SerialMultiplexer(object):
+    """
+    Runs the queries of many MeComSerial(backend="termios") connections from one thread: every port has one query
+    in flight and the responses of all ports are awaited with one selector. The bus lock of every involved
+    connection is held while its queries run.
+    """
+
+    def __init__(self, connections):
+        """
+        :param connections: [MeComSerial]: opened with backend="termios"
+        """
+        for mc in connections:
+            if not isinstance(mc.ser, RawSerial):
+                raise ValueError("{} does not use the termios backend".format(mc.ser.port))
+        self.connections = list(connections)
+
+    def _start(self, port):
+        """
+        Send the next query of a port.
+        :return: bool: False if the port is done
+        """
+        mc = port.mc
+        while port.next < len(port.queries):
+            index = port.next
+            port.next += 1
+            query = port.queries[index]
+            try:
+                timeout = mc.timing.timeout(query.ADDRESS) if mc.timing is not None else mc._timeout
+            except DeviceUnresponsive as ex:
+                port.results[index] = ex
+                continue
+            query.set_sequence(mc.SEQUENCE_COUNTER)
+            mc._inc()
+            frame = query.compose()
+            if mc.rate_limit is not None:
+                mc.rate_limit.acquire(len(frame))
+            # not MeComSerial._write(), waiting for the transmission would hold up the other ports
+            try:
+                mc.ser.write(frame)
+            except ResponseTimeout as ex:
+                port.results[index] = ex
+                continue
+            port.query = index
+            port.sent = time.perf_counter()
+            port.expires = time.monotonic() + timeout if timeout is not None else None
+            return True
+        port.query = None
+        return False
+
+    def _receive(self, port, frame):
+        """
+        Handle a response frame of a port.
+        :return: bool: True if it answered the query in flight
+        """
+        mc = port.mc
+        query = port.queries[port.query]
+        # late responses to given up queries carry another sequence number
+        if frame[3:7] != "{:04X}".format(query.SEQUENCE).encode():
+            if mc._abandoned:
+                return False
+            port.results[port.query] = WrongResponseSequence()
+            return True
+        mc._abandoned = False
+        if mc.rate_limit is not None:
+            mc.rate_limit.charge(len(frame) + 1)
+        if mc.timing is not None:
+            mc.timing.success(query.ADDRESS, time.perf_counter() - port.sent)
+        try:
+            mc._set_response(query, frame)
+            port.results[port.query] = query
+        except Exception as ex:
+            port.results[port.query] = ex
+        return True
+
+    def execute(self, batches, priority=None):
+        """
+        Run queries on several connections at once, the queries of one connection are sent one after the other.
+        Device errors are not raised, check the type of query.RESPONSE, timeouts and corrupted responses are
+        returned as exception in place of the query.
+        :param batches: [[Query]]: one list per connection in the order passed to the constructor
+        :param priority: int: used for every bus lock of a connection with a priority queue
+        :return: [[Query or Exception]]
+        """
+        ports = [_Port(mc, list(queries)) for mc, queries in zip(self.connections, batches)]
+        # bus locks are taken in the order of id(), the same in every multiplexer, so multiplexers sharing
+        # connections cannot deadlock each other; other code must not hold one bus lock while waiting for another
+        locked = []
+        # registered per call, set_baudrate() reopens a port with another file descriptor
+        selector = selectors.DefaultSelector()
+        try:
+            for port in sorted(ports, key=lambda p: id(p.mc)):
+                if port.queries:
+                    port.mc._acquire(priority)
+                    locked.append(port)
+                    port.mc.ser.reset_input_buffer()
+                    selector.register(port.mc.ser.fd, selectors.EVENT_READ, port.mc)
+            active = {port.mc: port for port in locked if self._start(port)}
+
+            while active:
+                expires = [port.expires for port in active.values() if port.expires is not None]
+                timeout = max(min(expires) - time.monotonic(), 0.) if expires else None
+                for key, _ in selector.select(timeout):
+                    port = active.get(key.data)
+                    if port is None:
+                        continue
+                    port.mc.ser.fill()
+                    while port.query is not None:
+                        frame = port.mc.ser.take_frame()
+                        if frame is None:
+                            break
+                        if self._receive(port, frame) and not self._start(port):
+                            del active[port.mc]
+
+                now = time.monotonic()
+                for port in list(active.values()):
+                    if port.expires is not None and now >= port.expires:
+                        mc = port.mc
+                        port.results[port.query] = ResponseTimeout("timeout while communication via serial")
+                        mc._interrupted()
+                        if mc.timing is not None:
+                            mc.timing.failure(port.queries[port.query].ADDRESS)
+                        if not self._start(port):
+                            del active[mc]
+        finally:
+            selector.close()
+            for port in locked:
+                port.mc.lock.release()
+        return [port.results for port in ports]
+
+    def get_parameters(self, targets, parameters, parameter_instance=1, priority=None):
+        """
+        Read parameters of many devices, devices on the same connection are read one after the other.
+        :param targets: [(MeComSerial, int)]: connection and device address
+        :param parameters: [str]: parameter names
+        :param parameter_instance: int
+        :param priority: int: used for the bus locks of connections with a priority queue
+        :return: [[int or float or Exception]]: one list of values per target
+        """
+        batches = {mc: [] for mc in self.connections}
+        for mc, address in targets:
+            batches[mc].extend(VR(mc._find_parameter(name, None, address), address, parameter_instance)
+                               for name in parameters)
+        results = dict(zip(self.connections, self.execute([batches[mc] for mc in self.connections], priority)))
+
+        values = []
+        offsets = {mc: 0 for mc in self.connections}
+        for mc, address in targets:
+            start = offsets[mc]
+            offsets[mc] += len(parameters)
+            row = []
+            for result in results[mc][start:start + len(parameters)]:
+                if isinstance(result, Exception):
+                    row.append(result)
+                elif type(result.RESPONSE) is DeviceError:
+                    row.append(ResponseException("device {} raised {}".format(address, result.RESPONSE.error()[1])))
+                else:
+                    row.append(result.RESPONSE.PAYLOAD[0])
+            values.append(row)
+        return values
@@ -0,0 +1,229 @@
+"""
+Memory mapped flight recorder: the last N hours of samples of one device in a fixed-size circular file.
+Requires numpy.
+
+Samples live in the page cache instead of Python objects, survive a crash of the recording process and can be read
+by another process at any time, e.g. after a device went into Error status.
+"""
+
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+_MAGIC = b"MCFR"
+_VERSION = 1
+# magic, version, capacity, number of parameters, length of the json encoded parameter names
+_HEADER = struct.Struct("<4sIQII")
+# records start at this offset, the header and the parameter names must fit before
+_DATA_OFFSET = 4096
+
+
+def record_dtype(parameters):
+    """
+    Returns the dtype of a record holding one value per parameter.
+    :param parameters: int: number of parameters
+    :return: np.dtype
+    """
+    return np.dtype([("seq", "<u8"),  # position + 1, written last, 0 marks an empty or torn record
+                     ("time", "<f8"),  # unix time
+                     ("values", "<f8", (parameters,))])  # nan for values which could not be read
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        data = f.read(_DATA_OFFSET)
+    if len(data) < _HEADER.size:
+        raise ValueError("{} is no flight recorder file".format(path))
+    magic, version, capacity, parameters, meta_size = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("{} is no flight recorder file".format(path))
+    names = json.loads(data[_HEADER.size:_HEADER.size + meta_size].decode())
+    return capacity, names
+
+
+def _position(seq):
+    """
+    Returns the number of records written, derived from the records themselves so it is also correct after a
+    crash.
+    """
+    return int(seq.max()) if len(seq) else 0
+
+
+def _advance(seq, hint, chunk=1024):
+    """
+    Returns the number of records written, continuing from a position known before. Only the records written since
+    are compared, unless the writer has lapped the hint.
+    :param seq: np.ndarray: sequence numbers of all slots
+    :param hint: int: a position returned before
+    :param chunk: int: records compared per step
+    """
+    capacity = len(seq)
+    if not capacity:
+        return 0
+    current = int(seq[hint % capacity])
+    if current <= hint:
+        # nothing new, or the next record is being written
+        return hint
+    if current != hint + 1:
+        # lapped or another file, the hint is useless
+        return _position(seq)
+    position = hint
+    while True:
+        n = min(chunk, capacity)
+        slots = np.arange(position, position + n) % capacity
+        mismatch = np.flatnonzero(seq[slots] != np.arange(position + 1, position + n + 1, dtype=np.uint64))
+        if len(mismatch):
+            return position + int(mismatch[0])
+        position += n
+        if position - hint >= capacity:
+            return _position(seq)
+
+
+class FlightRecorder(object):
+    """
+    Writes samples of one device into a circular file of capacity records, each record holds a timestamp and one
+    value per parameter. The file is allocated on creation and reopened if it exists with the same parameters and
+    capacity, so a restarted process continues the recording. Writing a record copies the values into the mapped
+    file, nothing is allocated per sample.
+    """
+
+    def __init__(self, path, parameters, capacity=None, hours=1., rate=10.):
+        """
+        :param path: str: one file per device, e.g. "recorder/ttyUSB0-1.mcfr"
+        :param parameters: [str]: parameter names, one value per name and record
+        :param capacity: int: number of records, defaults to hours * 3600 * rate
+        :param hours: float: length of the recording
+        :param rate: float: records per second
+        """
+        self.path = path
+        self.parameters = list(parameters)
+        self.capacity = int(capacity if capacity is not None else hours * 3600 * rate)
+        self.dtype = record_dtype(len(self.parameters))
+
+        meta = json.dumps(self.parameters).encode()
+        if _HEADER.size + len(meta) > _DATA_OFFSET:
+            raise ValueError("too many parameter names for the file header")
+
+        reopen = False
+        if os.path.isfile(path):
+            try:
+                reopen = _read_header(path) == (self.capacity, self.parameters)
+            except ValueError:
+                reopen = False
+        if not reopen:
+            with open(path, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, self.capacity, len(self.parameters), len(meta)) + meta)
+                f.truncate(_DATA_OFFSET + self.capacity * self.dtype.itemsize)
+
+        self.records = np.memmap(path, dtype=self.dtype, mode="r+", offset=_DATA_OFFSET, shape=(self.capacity,))
+        # plain ndarray field views, writing through them does not create record or memmap objects
+        records = self.records.view(np.ndarray)
+        self._seq = records["seq"]
+        self._time = records["time"]
+        self._values = records["values"]
+        self.position = _position(self._seq)
+
+    def record(self, values, timestamp=None):
+        """
+        Write one record, overwriting the oldest one if the file is full.
+        :param values: sequence or np.ndarray of float, one value per parameter (nan or None if unknown)
+        :param timestamp: float: unix time, defaults to now
+        :return:
+        """
+        slot = self.position % self.capacity
+        self._seq[slot] = 0
+        self._time[slot] = time.time() if timestamp is None else timestamp
+        self._values[slot] = values
+        self._seq[slot] = self.position + 1
+        self.position += 1
+
+    def flush(self):
+        """
+        Write the mapped pages to disk. Not needed for other processes or after a crash of this process, only
+        against power loss.
+        :return:
+        """
+        self.records.flush()
+
+    def close(self):
+        self.records.flush()
+        # the mapping is released with the last view
+        del self._seq, self._time, self._values, self.records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FlightRecorderReader(object):
+    """
+    Reads the file of a FlightRecorder, while it is written by another process or after that process crashed.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: str
+        """
+        self.path = path
+        self.capacity, self.parameters = _read_header(path)
+        self.dtype = record_dtype(len(self.parameters))
+        self.records = np.memmap(path, dtype=self.dtype, mode="r", offset=_DATA_OFFSET, shape=(self.capacity,))
+        self._seq = self.records.view(np.ndarray)["seq"]
+        # number of records written at the last call, the next search starts here
+        self._hint = 0
+
+    def _position(self):
+        self._hint = _advance(self._seq, self._hint)
+        return self._hint
+
+    def _views(self, position):
+        if position <= self.capacity:
+            return self.records[:position], self.records[:0]
+        slot = position % self.capacity
+        return self.records[slot:], self.records[:slot]
+
+    def views(self):
+        """
+        Returns the records as two views into the mapped file without copying, older records first. The views
+        change while a writer is active and may contain a torn record (seq 0) at the write position.
+        :return: (np.ndarray, np.ndarray) of record_dtype()
+        """
+        return self._views(self._position())
+
+    def read(self, start=None, end=None):
+        """
+        Returns a consistent copy of the records within [start, end] in chronological order.
+        :param start: float: unix time, from the oldest record if None
+        :param end: float: unix time, up to the newest record if None
+        :return: (np.ndarray, np.ndarray): unix times and values of shape (records, parameters)
+        """
+        position = self._position()
+        records = np.concatenate(self._views(position))
+        # like a seqlock: the writer zeroes seq before it changes a record, so a record is consistent if seq is the
+        # expected one in the copy and still after copying, records overwritten or torn meanwhile fail either check
+        expected = np.arange(position - len(records) + 1, position + 1, dtype=np.uint64)
+        after = self._seq[(expected - 1) % self.capacity]
+        valid = (records["seq"] == expected) & (after == expected)
+        if start is not None:
+            valid &= records["time"] >= start
+        if end is not None:
+            valid &= records["time"] <= end
+        records = records[valid]
+        return records["time"], records["values"]
+
+    def close(self):
+        # the mapping is released with the last view
+        del self._seq, self.records
+
+    def column(self, parameter):
+        """
+        Returns the index of a parameter in the values returned by read().
+        :param parameter: str
+        :return: int
+        """
+        return self.parameters.index(parameter)
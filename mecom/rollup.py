@@ -0,0 +1,193 @@
+"""
+Incremental min / max / mean / count rollups of polled values at several resolutions. Requires numpy.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from .batches import sample_rounds
+from .shm import SAMPLE_OK
+
+DEFAULT_RESOLUTIONS = ((1., 120), (60., 120), (3600., 48))
+
+ROLLUP_DTYPE = np.dtype([("device", "<u4"), ("parameter", "<u4"), ("start", "<f8"), ("min", "<f8"),
+                         ("max", "<f8"), ("mean", "<f8"), ("count", "<u8")])
+
+
+class _Resolution(object):
+    """
+    Ring of buckets per device and parameter for one resolution, all arrays are allocated up front.
+    """
+
+    def __init__(self, seconds, slots, devices, parameters):
+        shape = (devices, parameters, slots)
+        self.seconds = seconds
+        self.slots = slots
+        self.bucket = np.full(shape, -1, dtype=np.int64)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        self.sum = np.zeros(shape)
+        self.count = np.zeros(shape, dtype=np.uint64)
+        # buckets before this one have been returned by flush()
+        self.flushed = -1
+
+    def update(self, d, p, value, timestamp):
+        bucket = int(timestamp // self.seconds)
+        slot = bucket % self.slots
+        if self.bucket[d, p, slot] != bucket:
+            # reuse the slot of an old bucket
+            self.bucket[d, p, slot] = bucket
+            self.min[d, p, slot] = value
+            self.max[d, p, slot] = value
+            self.sum[d, p, slot] = value
+            self.count[d, p, slot] = 1
+            return
+        if value < self.min[d, p, slot]:
+            self.min[d, p, slot] = value
+        if value > self.max[d, p, slot]:
+            self.max[d, p, slot] = value
+        self.sum[d, p, slot] += value
+        self.count[d, p, slot] += 1
+
+    def update_many(self, d, p, values, timestamps):
+        # cells (d, p) must be unique
+        bucket = (timestamps // self.seconds).astype(np.int64)
+        slot = bucket % self.slots
+        index = (d, p, slot)
+        new = self.bucket[index] != bucket
+        self.bucket[index] = bucket
+        self.min[index] = np.where(new, values, np.minimum(self.min[index], values))
+        self.max[index] = np.where(new, values, np.maximum(self.max[index], values))
+        self.sum[index] = np.where(new, values, self.sum[index] + values)
+        self.count[index] = np.where(new, 1, self.count[index] + 1)
+
+    def select(self, d, p, slot):
+        result = np.empty(len(d), dtype=ROLLUP_DTYPE)
+        result["device"] = d
+        result["parameter"] = p
+        result["start"] = self.bucket[d, p, slot] * self.seconds
+        result["min"] = self.min[d, p, slot]
+        result["max"] = self.max[d, p, slot]
+        result["count"] = self.count[d, p, slot]
+        result["mean"] = self.sum[d, p, slot] / result["count"]
+        return result
+
+
+class RollupAggregator(object):
+    """
+    Keeps min, max, mean and count of every device and parameter per bucket of e.g. 1 s, 1 min and 1 h, so a
+    historian can store rollups instead of raw samples. Each sample updates one bucket per resolution in O(1),
+    memory is allocated once: every resolution keeps the last slots buckets in a ring.
+
+    The polling thread calls update() or feed_samples(), other threads call query() or flush() at any time. The
+    lock is only held for single updates and for vectorized copies of the requested buckets, never for callbacks
+    or I/O, so readers do not hold up polling.
+    """
+
+    def __init__(self, devices, parameters, resolutions=DEFAULT_RESOLUTIONS):
+        """
+        :param devices: int or [str]: number of devices or their labels
+        :param parameters: [str]: parameter names
+        :param resolutions: [(float, int)]: bucket length in seconds and number of buckets kept
+        """
+        self.devices = list(range(devices)) if isinstance(devices, int) else list(devices)
+        self.parameters = list(parameters)
+        self._device_index = {d: i for i, d in enumerate(self.devices)}
+        self._parameter_index = {p: i for i, p in enumerate(self.parameters)}
+        self.resolutions = [_Resolution(seconds, slots, len(self.devices), len(self.parameters))
+                            for seconds, slots in resolutions]
+        self._lock = threading.Lock()
+        # latest sample time, buckets before the current one are complete
+        self.now = -np.inf
+
+    def _index(self, device, parameter):
+        return (self._device_index[device] if isinstance(device, str) else device,
+                self._parameter_index[parameter] if isinstance(parameter, str) else parameter)
+
+    def _resolution(self, seconds):
+        for resolution in self.resolutions:
+            if resolution.seconds == seconds:
+                return resolution
+        raise KeyError("no rollups with a resolution of {} s".format(seconds))
+
+    def update(self, device, parameter, value, timestamp=None):
+        """
+        Add one polled value, values which could not be read (None or nan) are not counted.
+        :param device: int or str: index or label
+        :param parameter: int or str: index or name
+        :param value: int or float
+        :param timestamp: float: unix time, defaults to now
+        :return:
+        """
+        if value is None or value != value:
+            return
+        d, p = self._index(device, parameter)
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            for resolution in self.resolutions:
+                resolution.update(d, p, value, timestamp)
+            if timestamp > self.now:
+                self.now = timestamp
+
+    def feed_samples(self, samples):
+        """
+        Add samples as returned by FleetSupervisor.read(), their device and parameter indices must match the
+        lists passed to the constructor. Samples which are not ok are not counted.
+        :param samples: np.ndarray of SAMPLE_DTYPE
+        :return:
+        """
+        samples = samples[(samples["status"] == SAMPLE_OK) & ~np.isnan(samples["value"])]
+        if len(samples) == 0:
+            return
+        d = samples["device"].astype(np.intp)
+        p = samples["parameter"].astype(np.intp)
+        # computed before locking, several samples of one cell are added in rounds
+        rounds = sample_rounds(d * len(self.parameters) + p)
+        with self._lock:
+            for batch in rounds:
+                for resolution in self.resolutions:
+                    resolution.update_many(d[batch], p[batch], samples["value"][batch], samples["time"][batch])
+            self.now = max(self.now, float(samples["time"].max()))
+
+    def query(self, device, parameter, resolution=1., start=None, end=None):
+        """
+        Returns the buckets of one device and parameter which are still kept, oldest first. The current bucket is
+        included and may still change.
+        :param device: int or str: index or label
+        :param parameter: int or str: index or name
+        :param resolution: float: bucket length in seconds
+        :param start: float: unix time, buckets starting before are skipped
+        :param end: float: unix time, buckets starting after are skipped
+        :return: np.ndarray of ROLLUP_DTYPE
+        """
+        d, p = self._index(device, parameter)
+        r = self._resolution(resolution)
+        with self._lock:
+            buckets = r.bucket[d, p]
+            valid = buckets >= 0
+            if start is not None:
+                valid &= buckets * r.seconds >= start
+            if end is not None:
+                valid &= buckets * r.seconds <= end
+            slot = np.flatnonzero(valid)
+            result = r.select(np.full(len(slot), d), np.full(len(slot), p), slot)
+        return result[np.argsort(result["start"], kind="stable")]
+
+    def flush(self, resolution=1.):
+        """
+        Returns all complete buckets which have not been returned by an earlier call, e.g. to write them to a
+        historian. A bucket is complete once a sample of a later bucket has been added to any cell. Call it at
+        least every slots * resolution seconds, older buckets are overwritten.
+        :param resolution: float: bucket length in seconds
+        :return: np.ndarray of ROLLUP_DTYPE, sorted by start
+        """
+        r = self._resolution(resolution)
+        with self._lock:
+            if self.now == -np.inf:
+                return np.empty(0, dtype=ROLLUP_DTYPE)
+            current = int(self.now // r.seconds)
+            result = r.select(*np.nonzero((r.bucket > r.flushed) & (r.bucket < current)))
+            r.flushed = current - 1
+        return result[np.lexsort((result["parameter"], result["device"], result["start"]))]
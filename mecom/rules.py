@@ -0,0 +1,274 @@
+"""
+Incremental evaluation of stability and alarm conditions over polled values. Requires numpy.
+
+Every rule keeps its state per device in arrays, each sample updates it in O(1) and a whole row of devices is
+evaluated with a few vectorized operations. Callbacks are only called when the state of a rule changes.
+"""
+
+import abc
+import time
+
+import numpy as np
+
+from .batches import sample_rounds
+from .shm import SAMPLE_OK
+
+
+class Rule(abc.ABC):
+    """
+    Base class of rules, a rule watches one parameter and is either active or inactive per device. Subclasses
+    implement evaluate().
+    """
+
+    # parameters besides self.parameter the rule needs the latest value of
+    references = ()
+
+    def __init__(self, name, parameter):
+        """
+        :param name: str: reported to callbacks
+        :param parameter: str: name of the watched parameter
+        """
+        self.name = name
+        self.parameter = parameter
+        self.active = None
+
+    def _bind(self, engine):
+        """
+        Allocate the per device state, called by RuleEngine.add().
+        :param engine: RuleEngine
+        :return:
+        """
+        self.engine = engine
+        self.active = np.zeros(engine.size, dtype=bool)
+
+    @abc.abstractmethod
+    def evaluate(self, devices, values, timestamps):
+        """
+        Update the state of the given devices with one new sample each and return their new state.
+        :param devices: np.ndarray of int: unique device indices
+        :param values: np.ndarray of float: nan for values which could not be read
+        :param timestamps: np.ndarray of float
+        :return: np.ndarray of bool
+        """
+
+
+class WithinBand(Rule):
+    """
+    Active while the value has stayed within target +- tolerance for at least duration seconds,
+    e.g. WithinBand("stable", "Object Temperature", "Target Object Temperature", 0.01, 60.).
+    """
+
+    def __init__(self, name, parameter, target, tolerance, duration=0.):
+        """
+        :param name: str
+        :param parameter: str
+        :param target: float, array of one target per device or str: name of a parameter holding the target
+        :param tolerance: float
+        :param duration: float: seconds
+        """
+        super().__init__(name, parameter)
+        self.target = target
+        self.tolerance = tolerance
+        self.duration = duration
+        if isinstance(target, str):
+            self.references = (target,)
+
+    def _bind(self, engine):
+        super()._bind(engine)
+        # time the value entered the band, nan while outside
+        self.since = np.full(engine.size, np.nan)
+        # one target per device, self.target stays as passed by the caller
+        self._targets = None
+        if not isinstance(self.target, str):
+            self._targets = np.broadcast_to(np.asarray(self.target, dtype=float), (engine.size,))
+
+    def evaluate(self, devices, values, timestamps):
+        target = self.engine.latest[self.target] if self._targets is None else self._targets
+        # comparisons with nan are false, unknown values or targets leave the band
+        inside = np.abs(values - target[devices]) <= self.tolerance
+        since = self.since[devices]
+        since = np.where(inside, np.where(np.isnan(since), timestamps, since), np.nan)
+        self.since[devices] = since
+        return inside & (timestamps - since >= self.duration)
+
+
+class Threshold(Rule):
+    """
+    Active after the value has been above (or below) limit for samples consecutive samples,
+    e.g. Threshold("overcurrent", "Actual Output Current", 2.5, samples=3).
+    """
+
+    def __init__(self, name, parameter, limit, samples=1, above=True):
+        """
+        :param name: str
+        :param parameter: str
+        :param limit: float or array of one limit per device
+        :param samples: int
+        :param above: bool: value > limit if True, value < limit otherwise
+        """
+        super().__init__(name, parameter)
+        self.limit = limit
+        self.samples = samples
+        self.above = above
+
+    def _bind(self, engine):
+        super()._bind(engine)
+        self.count = np.zeros(engine.size, dtype=np.int64)
+        # one limit per device, self.limit stays as passed by the caller
+        self._limits = np.broadcast_to(np.asarray(self.limit, dtype=float), (engine.size,))
+
+    def evaluate(self, devices, values, timestamps):
+        limits = self._limits[devices]
+        exceeded = values > limits if self.above else values < limits
+        count = np.where(exceeded, self.count[devices] + 1, 0)
+        self.count[devices] = count
+        return count >= self.samples
+
+
+class Equals(Rule):
+    """
+    Active after the value has differed from (or equaled) expected for samples consecutive samples,
+    e.g. Equals("error", "Error Number", 0, negate=True) or Equals("unstable", "Temperature is Stable", 2, True).
+    """
+
+    def __init__(self, name, parameter, expected, samples=1, negate=False):
+        """
+        :param name: str
+        :param parameter: str
+        :param expected: int or float
+        :param samples: int
+        :param negate: bool: active while the value is not expected
+        """
+        super().__init__(name, parameter)
+        self.expected = expected
+        self.samples = samples
+        self.negate = negate
+
+    def _bind(self, engine):
+        super()._bind(engine)
+        self.count = np.zeros(engine.size, dtype=np.int64)
+
+    def evaluate(self, devices, values, timestamps):
+        match = (values != self.expected) & ~np.isnan(values) if self.negate else values == self.expected
+        count = np.where(match, self.count[devices] + 1, 0)
+        self.count[devices] = count
+        return count >= self.samples
+
+
+class RuleEngine(object):
+    """
+    Feeds polled values of many devices into rules and reports state changes.
+
+    callback(rule_name, device, active, timestamp) is called for every change, device is the label or index of
+    the device as passed to the constructor.
+    """
+
+    def __init__(self, devices, callback=None):
+        """
+        :param devices: int or [str]: number of devices or their labels
+        :param callback: callable
+        """
+        self.devices = list(range(devices)) if isinstance(devices, int) else list(devices)
+        self.size = len(self.devices)
+        self._device_index = {d: i for i, d in enumerate(self.devices)}
+        self.callback = callback
+        self.rules = {}
+        self._by_parameter = {}
+        # latest value of every parameter referenced by a rule, e.g. a target
+        self.latest = {}
+
+    def add(self, rule):
+        """
+        Add a rule, its state starts inactive for all devices.
+        :param rule: Rule
+        :return: Rule
+        """
+        assert rule.name not in self.rules, "duplicate rule name {}".format(rule.name)
+        for reference in rule.references:
+            self.latest.setdefault(reference, np.full(self.size, np.nan))
+        rule._bind(self)
+        self.rules[rule.name] = rule
+        self._by_parameter.setdefault(rule.parameter, []).append(rule)
+        return rule
+
+    def state(self, rule_name):
+        """
+        Returns the state of a rule for all devices.
+        :param rule_name: str
+        :return: np.ndarray of bool (a copy)
+        """
+        return self.rules[rule_name].active.copy()
+
+    def _index(self, device):
+        return self._device_index[device] if isinstance(device, str) else device
+
+    def _evaluate(self, parameter, devices, values, timestamps):
+        """
+        Feed one sample per device, devices must be unique.
+        """
+        if parameter in self.latest:
+            self.latest[parameter][devices] = values
+        for rule in self._by_parameter.get(parameter, ()):
+            active = rule.evaluate(devices, values, timestamps)
+            changed = active != rule.active[devices]
+            if not changed.any():
+                continue
+            rule.active[devices] = active
+            if self.callback is not None:
+                for i in np.flatnonzero(changed):
+                    self.callback(rule.name, self.devices[devices[i]], bool(active[i]), float(timestamps[i]))
+
+    def update(self, device, parameter, value, timestamp=None):
+        """
+        Feed one polled value.
+        :param device: int or str: index or label
+        :param parameter: str
+        :param value: int or float, None if it could not be read
+        :param timestamp: float: unix time, defaults to now
+        :return:
+        """
+        self._evaluate(parameter, np.array([self._index(device)]),
+                       np.array([np.nan if value is None else value], dtype=float),
+                       np.array([time.time() if timestamp is None else timestamp]))
+
+    def update_row(self, parameter, values, timestamp=None, devices=None):
+        """
+        Feed one value of a parameter for many devices at once.
+        :param parameter: str
+        :param values: array of float, nan for values which could not be read
+        :param timestamp: float or array of float: unix time, defaults to now
+        :param devices: [int or str]: unique devices of the values, all if None
+        :return:
+        """
+        if devices is None:
+            indices = np.arange(self.size)
+        else:
+            indices = np.array([self._index(d) for d in devices], dtype=np.intp)
+            # the state of a device is updated once per call, a second value of it would be lost
+            if len(np.unique(indices)) != len(indices):
+                raise ValueError("devices of a row must be unique, use update() or feed_samples() for more values")
+        values = np.asarray(values, dtype=float)
+        timestamps = np.broadcast_to(np.asarray(time.time() if timestamp is None else timestamp, dtype=float),
+                                     values.shape)
+        self._evaluate(parameter, indices, values, timestamps)
+
+    def feed_samples(self, samples, parameters):
+        """
+        Feed samples as returned by FleetSupervisor.read(), samples which are not ok count as unknown values.
+        :param samples: np.ndarray of SAMPLE_DTYPE
+        :param parameters: [str]: parameter names of the sample parameter indices, e.g. FleetSupervisor.parameters
+        :return:
+        """
+        for p, parameter in enumerate(parameters):
+            if parameter not in self._by_parameter and parameter not in self.latest:
+                continue
+            selected = samples[samples["parameter"] == p]
+            if len(selected) == 0:
+                continue
+            devices = selected["device"].astype(np.intp)
+            values = np.where(selected["status"] == SAMPLE_OK, selected["value"], np.nan)
+            timestamps = selected["time"]
+
+            # several samples of one device are fed in rounds, keeping their order
+            for batch in sample_rounds(devices):
+                self._evaluate(parameter, devices[batch], values[batch], timestamps[batch])
@@ -0,0 +1,259 @@
+"""
+Discovery of parameters which are not listed in commands.py:
+
+    results = scan_parameters(mc, address=1, ids=range(0, 65536))
+    write_catalog(results, "TEC-found.json", metype="TEC")
+
+Every id and instance is read with a raw ?VR query. The queries are sent in batches which lock the bus once and reuse
+pre-encoded frames, answers are classified without building response objects: a value, a device error code
+(e.g. 5, parameter not available) or no answer. The format of a found parameter is guessed from the bit pattern of
+its value. The written catalog can be loaded with catalog.load_catalog().
+"""
+
+import csv
+import json
+import struct
+
+from .exceptions import ResponseTimeout, UnknownParameter
+from .commands import ERRORS
+from .mecom import FrameTemplate, ParameterList, RawQuery, _crc
+
+# classification of an answer
+FOUND = "value"
+DEVICE_ERROR = "error"
+NO_ANSWER = "timeout"
+INVALID = "invalid"
+
+_SYMBOLS = {error["code"]: error["symbol"] for error in ERRORS}
+_FLOAT32 = struct.Struct(">f")
+_INT32 = struct.Struct(">i")
+
+
+def plausible_formats(raw):
+    """
+    Returns the formats a raw 32 bit value is plausible in. Integers of parameters are small (states, counts,
+    serial numbers), floats are physical values between about 1e-9 and 1e12, the two ranges only overlap at 0.
+    :param raw: int: unsigned 32 bit value
+    :return: [str]: "INT32" and / or "FLOAT32", empty if neither fits
+    """
+    formats = []
+    signed = raw - (1 << 32) if raw & 0x80000000 else raw
+    if -(1 << 24) <= signed < (1 << 24):
+        formats.append("INT32")
+    exponent = (raw >> 23) & 0xFF
+    if raw & 0x7FFFFFFF == 0 or 97 <= exponent <= 167:
+        formats.append("FLOAT32")
+    return formats
+
+
+def infer_format(raw):
+    """
+    Returns the more likely format of a raw 32 bit value, INT32 if it is ambiguous or fits neither.
+    :param raw: int: unsigned 32 bit value
+    :return: str
+    """
+    return "FLOAT32" if plausible_formats(raw) == ["FLOAT32"] else "INT32"
+
+
+class ScanResult(object):
+    """
+    The answer to the query of one id and instance.
+    """
+    __slots__ = ("id", "instance", "status", "raw", "error_code")
+
+    def __init__(self, parameter_id, instance, status, raw=None, error_code=None):
+        """
+        :param parameter_id: int
+        :param instance: int
+        :param status: str: FOUND, DEVICE_ERROR, NO_ANSWER or INVALID
+        :param raw: int: unsigned 32 bit value if found
+        :param error_code: int: device error code, see ERRORS in commands.py
+        """
+        self.id = parameter_id
+        self.instance = instance
+        self.status = status
+        self.raw = raw
+        self.error_code = error_code
+
+    @property
+    def found(self):
+        return self.status == FOUND
+
+    @property
+    def error_symbol(self):
+        return _SYMBOLS.get(self.error_code)
+
+    @property
+    def format(self):
+        return infer_format(self.raw) if self.found else None
+
+    def value(self, parameter_format=None):
+        """
+        Returns the value decoded as parameter_format, defaults to the inferred format.
+        :param parameter_format: str
+        :return: int or float
+        """
+        packed = struct.pack(">I", self.raw)
+        if (parameter_format or self.format) == "FLOAT32":
+            return _FLOAT32.unpack(packed)[0]
+        return _INT32.unpack(packed)[0]
+
+    def __repr__(self):
+        if self.found:
+            return "<ScanResult {}:{} {:08X} {}>".format(self.id, self.instance, self.raw, self.format)
+        if self.status == DEVICE_ERROR:
+            return "<ScanResult {}:{} {}>".format(self.id, self.instance, self.error_symbol or self.error_code)
+        return "<ScanResult {}:{} {}>".format(self.id, self.instance, self.status)
+
+
+def _classify(transaction, frame, parameter_id, instance):
+    """
+    Classify a response frame without the carriage return.
+    :return: ScanResult
+    """
+    try:
+        if int(frame[3:7], 16) != transaction.SEQUENCE or _crc(frame[:-4]) != int(frame[-4:], 16):
+            return ScanResult(parameter_id, instance, INVALID)
+        # !AASSSSVVVVVVVVCCCC
+        if len(frame) == 19 and frame[7:8] != b"+":
+            return ScanResult(parameter_id, instance, FOUND, raw=int(frame[7:15], 16))
+        # !AASSSS+EECCCC
+        if len(frame) == 14 and frame[7:8] == b"+":
+            return ScanResult(parameter_id, instance, DEVICE_ERROR, error_code=int(frame[8:10], 16))
+    except ValueError:
+        pass
+    return ScanResult(parameter_id, instance, INVALID)
+
+
+def _query_batch(mc, address, keys, priority=None):
+    """
+    Read (id, instance) pairs with a single bus lock.
+    :return: [ScanResult]
+    """
+    transactions = [RawQuery(FrameTemplate(address, "?VR{:04X}{:02X}".format(i, instance).encode()))
+                    for i, instance in keys]
+    results = []
+    frames = mc._transact_many(transactions, priority, collect_errors=True)
+    for (parameter_id, instance), transaction, frame in zip(keys, transactions, frames):
+        if isinstance(frame, ResponseTimeout):
+            # a device which is marked as down raises DeviceUnresponsive, a subclass, without touching the bus
+            results.append(ScanResult(parameter_id, instance, NO_ANSWER))
+        elif isinstance(frame, Exception):
+            raise frame
+        else:
+            results.append(_classify(transaction, frame, parameter_id, instance))
+    return results
+
+
+def scan_parameters(mc, address=0, ids=range(0, 65536), instances=(1,), max_instance=None, batch=64, retries=1,
+                    progress=None, priority=None):
+    """
+    Query every id in ids at every instance in instances and return the answers.
+
+    With max_instance, every id found at the first of instances is also probed at the following instances up to
+    max_instance until the device answers "instance not available", which takes far less time than sweeping all
+    ids at all instances. Queries without or with a corrupted answer are repeated retries times after the sweep.
+
+    :param mc: MeComSerial or MeComTcp
+    :param address: int
+    :param ids: iterable of int
+    :param instances: [int]
+    :param max_instance: int: highest instance probed for found ids
+    :param batch: int: queries per bus lock, other threads get the bus between batches
+    :param retries: int
+    :param progress: callable(done, total) called after each batch
+    :param priority: int: only used if the connection uses a priority queue
+    :return: [ScanResult] sorted by id and instance
+    """
+    keys = [(i, instance) for i in ids for instance in instances]
+    results = {}
+
+    def run(pending):
+        for start in range(0, len(pending), batch):
+            for result in _query_batch(mc, address, pending[start:start + batch], priority):
+                results[result.id, result.instance] = result
+            if progress is not None:
+                progress(len(results), len(keys))
+
+    run(keys)
+
+    if max_instance is not None:
+        first = min(instances)
+        found = sorted(i for (i, instance), result in results.items() if instance == first and result.found)
+        for instance in range(first + 1, max_instance + 1):
+            probe = [(i, instance) for i in found if (i, instance) not in results]
+            keys.extend(probe)
+            run(probe)
+            # an id stops at its first missing instance
+            found = [i for i in found if results[i, instance].found]
+            if not found:
+                break
+
+    for _ in range(retries):
+        failed = [key for key, result in results.items() if result.status in (NO_ANSWER, INVALID)]
+        if not failed:
+            break
+        run(failed)
+
+    return [results[key] for key in sorted(results)]
+
+
+def catalog_definitions(results, metype="TEC", known=True):
+    """
+    Returns one parameter definition per found id. Parameters of the built-in catalog keep their name and format,
+    others are named "Parameter <id>" and get the inferred format of their first found instance.
+    :param results: [ScanResult]
+    :param metype: str: device family of the built-in catalog
+    :param known: bool: also include found parameters of the built-in catalog
+    :return: [dict]
+    """
+    builtin = ParameterList(metype)
+    by_id = {}
+    for result in results:
+        if result.found:
+            by_id.setdefault(result.id, []).append(result)
+
+    definitions = []
+    for parameter_id in sorted(by_id):
+        found = by_id[parameter_id]
+        try:
+            parameter = builtin.get_by_id(parameter_id)
+        except UnknownParameter:
+            parameter = None
+        if parameter is not None and not known:
+            continue
+        definition = {
+            "id": parameter_id,
+            "name": parameter.name if parameter is not None else "Parameter {}".format(parameter_id),
+            "format": parameter.format if parameter is not None else found[0].format,
+            "known": parameter is not None,
+            "instances": [result.instance for result in found],
+            "plausible": plausible_formats(found[0].raw),
+        }
+        definition["value"] = found[0].value(definition["format"])
+        definitions.append(definition)
+    return definitions
+
+
+def write_catalog(results, path, metype="TEC", known=True):
+    """
+    Write the found parameters to a catalog file, JSON or CSV by the file extension. Both can be loaded with
+    catalog.load_catalog(), the columns besides id, name and format are only informational. Rename the
+    parameters before using the file as a catalog, names are used to access parameters.
+    :param results: [ScanResult]
+    :param path: str: *.json or *.csv
+    :param metype: str
+    :param known: bool: also include found parameters of the built-in catalog
+    :return: [dict]: the written definitions
+    """
+    definitions = catalog_definitions(results, metype, known)
+    with open(path, "w", newline="") as f:
+        if path.lower().endswith(".csv"):
+            writer = csv.writer(f)
+            writer.writerow(("id", "name", "format", "instances", "plausible", "value"))
+            for d in definitions:
+                writer.writerow((d["id"], d["name"], d["format"], " ".join(str(i) for i in d["instances"]),
+                                 " ".join(d["plausible"]), d["value"]))
+        else:
+            json.dump({"metype": metype, "parameters": definitions}, f, indent=1)
+    return definitions
@@ -0,0 +1,386 @@
+"""
+Shared memory structures to pass samples between processes without pickling. Requires numpy.
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+SAMPLE_DTYPE = np.dtype([
+    ("seq", "<u8"),  # position + 1, written last, 0 marks an empty slot
+    ("time", "<f8"),  # unix time
+    ("device", "<u4"),  # index into the device list of the writer
+    ("parameter", "<u4"),  # index into the parameter list of the writer
+    ("value", "<f8"),
+    ("status", "<u4"),  # 0: ok, 1: device error, 2: timeout or communication error
+    ("_pad", "<u4"),
+])
+
+SAMPLE_OK = 0
+SAMPLE_DEVICE_ERROR = 1
+SAMPLE_COMMUNICATION_ERROR = 2
+
+
+# names of the blocks created by this process, see _attach()
+_created = set()
+
+
+def _create(name, size):
+    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    _created.add(shm._name)
+    return shm
+
+
+def _attach(name):
+    """
+    Attach to a shared memory block created by another process. Before Python 3.13 every attaching process
+    registers the block with its resource tracker, which unlinks it when the process exits, so a reader which
+    exits would remove the block for everybody else.
+    :param name: str
+    :return: SharedMemory
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    # blocks of this process stay registered until unlink(), and multiprocessing children share the tracker of
+    # their parent, which may have registered the block itself (e.g. the rings of FleetSupervisor)
+    if os.name == "posix" and shm._name not in _created and multiprocessing.parent_process() is None:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _unlink(shm):
+    """
+    Remove a block created by this process, tolerating that it was removed already.
+    :param shm: SharedMemory
+    :return:
+    """
+    _created.discard(shm._name)
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+# header: write position, capacity
+_HEADER = np.dtype([("written", "<u8"), ("capacity", "<u8")])
+
+
+class SharedSampleRing(object):
+    """
+    Single writer, single reader ring buffer of samples in a multiprocessing.shared_memory block.
+    The writer never waits for the reader, a reader falling behind by more than capacity samples loses the oldest
+    ones (counted in dropped). Every slot carries its position, so the reader detects slots overwritten while it
+    was reading them.
+    """
+
+    def __init__(self, name=None, capacity=65536):
+        """
+        Create a new ring (name=None) or attach to the ring of another process.
+        :param name: str: name of an existing ring, see SharedSampleRing.name
+        :param capacity: int: number of samples, only used when creating
+        """
+        if name is None:
+            size = _HEADER.itemsize + capacity * SAMPLE_DTYPE.itemsize
+            self._shm = _create(None, size)
+            self._owner = True
+        else:
+            self._shm = _attach(name)
+            self._owner = False
+
+        self._header = np.ndarray((), dtype=_HEADER, buffer=self._shm.buf)
+        if self._owner:
+            self._header["written"] = 0
+            self._header["capacity"] = capacity
+        self.capacity = int(self._header["capacity"])
+        self.samples = np.ndarray((self.capacity,), dtype=SAMPLE_DTYPE, buffer=self._shm.buf,
+                                  offset=_HEADER.itemsize)
+        if self._owner:
+            self.samples["seq"] = 0
+
+        self._read = 0
+        self.dropped = 0
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def written(self):
+        return int(self._header["written"])
+
+    def write(self, timestamp, device, parameter, value, status=SAMPLE_OK):
+        """
+        Append one sample, must only be called by a single writer.
+        :param timestamp: float
+        :param device: int
+        :param parameter: int
+        :param value: float
+        :param status: int
+        :return:
+        """
+        position = int(self._header["written"])
+        slot = self.samples[position % self.capacity]
+        slot["seq"] = 0
+        slot["time"] = timestamp
+        slot["device"] = device
+        slot["parameter"] = parameter
+        slot["value"] = value
+        slot["status"] = status
+        slot["seq"] = position + 1
+        self._header["written"] = position + 1
+
+    def read(self):
+        """
+        Returns all samples written since the last call, must only be called by a single reader.
+        :return: np.ndarray of SAMPLE_DTYPE (a copy)
+        """
+        written = int(self._header["written"])
+        if written - self._read > self.capacity:
+            self.dropped += written - self._read - self.capacity
+            self._read = written - self.capacity
+        if written == self._read:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+
+        positions = np.arange(self._read, written, dtype=np.uint64)
+        slots = positions % self.capacity
+        result = self.samples[slots]
+        # seq is copied before the payload, a slot the writer started to overwrite meanwhile may still carry the
+        # expected seq in the copy but not in the ring anymore (the writer zeroes it first)
+        after = self.samples["seq"][slots]
+        valid = (result["seq"] == positions + 1) & (after == positions + 1)
+        self.dropped += int(len(result) - np.count_nonzero(valid))
+        self._read = written
+        return result[valid]
+
+    def close(self):
+        """
+        Detach from the shared memory, the creating process also removes it.
+        :return:
+        """
+        del self._header
+        del self.samples
+        self._shm.close()
+        if self._owner:
+            _unlink(self._shm)
+
+
+# header of a value table, followed by the json encoded labels padded to 8 bytes
+_TABLE_HEADER = np.dtype([("meta_size", "<u8"), ("devices", "<u4"), ("parameters", "<u4")])
+
+
+def _table_arrays(buf, devices, parameters, offset):
+    """
+    Map the arrays of a value table onto a shared memory buffer.
+    :return: (versions, values, times, status)
+    """
+    versions = np.ndarray((devices,), dtype="<u8", buffer=buf, offset=offset)
+    offset += versions.nbytes
+    values = np.ndarray((devices, parameters), dtype="<f8", buffer=buf, offset=offset)
+    offset += values.nbytes
+    times = np.ndarray((devices, parameters), dtype="<f8", buffer=buf, offset=offset)
+    offset += times.nbytes
+    status = np.ndarray((devices, parameters), dtype="<u4", buffer=buf, offset=offset)
+    return versions, values, times, status
+
+
+class ValueTablePublisher(object):
+    """
+    Creates a shared memory table holding the latest value, timestamp and status of every parameter of every
+    device, fed by the polling side. Each device row has a version counter used as seqlock: it is odd while the
+    row is written, so readers never see half updated rows. Rows must only be written from one process.
+    """
+
+    def __init__(self, devices, parameters, name=None):
+        """
+        :param devices: [str]: device labels, e.g. "/dev/ttyUSB0:1"
+        :param parameters: [str]: parameter names
+        :param name: str: name of the shared memory block, random if None
+        """
+        self.devices = [str(d) for d in devices]
+        self.parameters = [str(p) for p in parameters]
+        self._device_index = {d: i for i, d in enumerate(self.devices)}
+        self._parameter_index = {p: i for i, p in enumerate(self.parameters)}
+
+        meta = json.dumps({"devices": self.devices, "parameters": self.parameters}).encode()
+        meta_size = (len(meta) + 7) // 8 * 8
+        n, m = len(self.devices), len(self.parameters)
+        size = _TABLE_HEADER.itemsize + meta_size + 8 * n + (8 + 8 + 4) * n * m
+
+        self._shm = _create(name, size)
+        header = np.ndarray((), dtype=_TABLE_HEADER, buffer=self._shm.buf)
+        header["meta_size"] = meta_size
+        header["devices"] = n
+        header["parameters"] = m
+        del header
+        self._shm.buf[_TABLE_HEADER.itemsize:_TABLE_HEADER.itemsize + len(meta)] = meta
+
+        self.versions, self.values, self.times, self.status = _table_arrays(
+            self._shm.buf, n, m, _TABLE_HEADER.itemsize + meta_size)
+        self.versions[:] = 0
+        self.values[:] = np.nan
+        self.times[:] = 0.
+        self.status[:] = SAMPLE_OK
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def _index(self, device, parameter):
+        return (self._device_index[device] if isinstance(device, str) else device,
+                self._parameter_index[parameter] if isinstance(parameter, str) else parameter)
+
+    def update(self, device, parameter, value, timestamp=None, status=SAMPLE_OK):
+        """
+        Publish one value.
+        :param device: int or str: index or label
+        :param parameter: int or str: index or name
+        :param value: float
+        :param timestamp: float: unix time, defaults to now
+        :param status: int: SAMPLE_OK, SAMPLE_DEVICE_ERROR or SAMPLE_COMMUNICATION_ERROR
+        :return:
+        """
+        d, p = self._index(device, parameter)
+        with self._lock:
+            self.versions[d] += 1
+            self.values[d, p] = value
+            self.times[d, p] = time.time() if timestamp is None else timestamp
+            self.status[d, p] = status
+            self.versions[d] += 1
+
+    def publish_row(self, device, values, timestamp=None, status=SAMPLE_OK):
+        """
+        Publish all parameters of a device at once, e.g. the result of get_parameters().
+        :param device: int or str: index or label
+        :param values: [float]: one value per parameter, None for values which could not be read
+        :param timestamp: float: unix time, defaults to now
+        :param status: int or [int]
+        :return:
+        """
+        d, _ = self._index(device, 0)
+        row = np.array([np.nan if v is None else v for v in values], dtype="<f8")
+        with self._lock:
+            self.versions[d] += 1
+            self.values[d] = row
+            self.times[d] = time.time() if timestamp is None else timestamp
+            self.status[d] = status
+            self.versions[d] += 1
+
+    def publish_samples(self, samples):
+        """
+        Publish samples as returned by SharedSampleRing.read() or FleetSupervisor.read(), device and parameter
+        indices of the samples are used as table indices.
+        :param samples: np.ndarray of SAMPLE_DTYPE
+        :return:
+        """
+        if len(samples) == 0:
+            return
+        rows = np.unique(samples["device"])
+        with self._lock:
+            self.versions[rows] += 1
+            # for duplicate cells the last sample wins, numpy assigns in order
+            self.values[samples["device"], samples["parameter"]] = samples["value"]
+            self.times[samples["device"], samples["parameter"]] = samples["time"]
+            self.status[samples["device"], samples["parameter"]] = samples["status"]
+            self.versions[rows] += 1
+
+    def close(self):
+        """
+        Remove the table, readers which are still attached keep their mapping. A table which was removed already,
+        e.g. by the resource tracker, is no error.
+        :return:
+        """
+        del self.versions, self.values, self.times, self.status
+        self._shm.close()
+        _unlink(self._shm)
+
+
+class ValueTableReader(object):
+    """
+    Attaches to the table of a ValueTablePublisher, possibly in another process, and reads consistent snapshots
+    without touching the bus.
+    """
+
+    def __init__(self, name, timeout=1.):
+        """
+        :param name: str: ValueTablePublisher.name
+        :param timeout: float: seconds to wait for a row which is being written before giving up
+        """
+        self._shm = _attach(name)
+        header = np.ndarray((), dtype=_TABLE_HEADER, buffer=self._shm.buf)
+        meta_size, n, m = int(header["meta_size"]), int(header["devices"]), int(header["parameters"])
+        del header
+        meta = bytes(self._shm.buf[_TABLE_HEADER.itemsize:_TABLE_HEADER.itemsize + meta_size]).rstrip(b"\0")
+        meta = json.loads(meta.decode())
+        self.devices = meta["devices"]
+        self.parameters = meta["parameters"]
+        self._device_index = {d: i for i, d in enumerate(self.devices)}
+        self._parameter_index = {p: i for i, p in enumerate(self.parameters)}
+        self.timeout = timeout
+
+        self._versions, self._values, self._times, self._status = _table_arrays(
+            self._shm.buf, n, m, _TABLE_HEADER.itemsize + meta_size)
+
+    def snapshot(self, devices=None):
+        """
+        Returns a copy of the table. Every row is consistent (written by a single update), rows written while
+        copying are copied again.
+        :param devices: [int or str]: rows to copy, all if None
+        :return: (np.ndarray, np.ndarray, np.ndarray): values, unix times and status of shape (devices, parameters)
+        """
+        rows = np.arange(len(self.devices)) if devices is None else \
+            np.array([self._device_index[d] if isinstance(d, str) else d for d in devices], dtype=np.intp)
+
+        before = self._versions[rows]
+        values = self._values[rows]
+        times = self._times[rows]
+        status = self._status[rows]
+        torn = (before & 1).astype(bool) | (before != self._versions[rows])
+
+        deadline = None
+        while np.any(torn):
+            if deadline is None:
+                deadline = time.monotonic() + self.timeout
+            elif time.monotonic() > deadline:
+                raise TimeoutError("value table row is written for too long to read a consistent snapshot")
+            # let the writer finish, it may be a thread of this process waiting for the GIL
+            time.sleep(0)
+            again = rows[torn]
+            version = self._versions[again]
+            values[torn] = self._values[again]
+            times[torn] = self._times[again]
+            status[torn] = self._status[again]
+            torn[torn] = (version & 1).astype(bool) | (version != self._versions[again])
+        return values, times, status
+
+    def get(self, device, parameter):
+        """
+        Returns the latest value of one parameter.
+        :param device: int or str: index or label
+        :param parameter: int or str: index or name
+        :return: (float, float, int): value, unix time and status
+        """
+        d = self._device_index[device] if isinstance(device, str) else device
+        p = self._parameter_index[parameter] if isinstance(parameter, str) else parameter
+        deadline = None
+        while True:
+            before = int(self._versions[d])
+            value, timestamp, status = float(self._values[d, p]), float(self._times[d, p]), int(self._status[d, p])
+            if not before & 1 and before == int(self._versions[d]):
+                return value, timestamp, status
+            if deadline is None:
+                deadline = time.monotonic() + self.timeout
+            elif time.monotonic() > deadline:
+                raise TimeoutError("value table row is written for too long to read a consistent value")
+            time.sleep(0)
+
+    def close(self):
+        del self._versions, self._values, self._times, self._status
+        self._shm.close()
@@ -0,0 +1,369 @@
+"""
+Simulated MeCom devices for load and fault tests without hardware:
+
+    device = SimulatedDevice(address=1, faults=Faults(latency=lognormal_latency(0.002, 0.5), drop=0.01))
+    with TcpEndpoint(device) as endpoint:
+        mc = MeComTcp("127.0.0.1", endpoint.port, timeout=0.2)
+    with PtyEndpoint([SimulatedDevice(address=a) for a in (1, 2, 3)]) as bus:
+        mc = MeComSerial(bus.port)
+
+A device answers ?VR, VS, ?IF, RS and SP queries for the parameters of its catalog, unknown ids get device error 5.
+Faults are drawn per query from a seeded random generator: latency, dropped responses, corrupted checksums, wrong
+sequence numbers and device error frames. A pty endpoint is a serial bus, a TCP endpoint a device with ethernet or
+a gateway, both may host several devices which answer to their address.
+"""
+
+import math
+import os
+import random
+import socket
+import struct
+import threading
+import time
+
+from .exceptions import UnknownParameter
+from .mecom import ParameterList, _crc
+
+# injected faults, counted per device
+DROP = "drop"
+BAD_CRC = "crc"
+WRONG_SEQUENCE = "sequence"
+DEVICE_BUSY = "busy"
+
+EER_CMD_NOT_AVAILABLE = 1
+EER_DEVICE_BUSY = 2
+EER_PAR_NOT_AVAILABLE = 5
+
+
+def constant_latency(seconds):
+    """
+    :param seconds: float
+    :return: callable(random.Random) -> float
+    """
+    return lambda rng: seconds
+
+
+def uniform_latency(low, high):
+    """
+    :param low: float: seconds
+    :param high: float: seconds
+    :return: callable(random.Random) -> float
+    """
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal_latency(median, sigma=0.5, maximum=None):
+    """
+    Long tailed latency, e.g. of a busy device or gateway.
+    :param median: float: seconds
+    :param sigma: float: standard deviation of the logarithm
+    :param maximum: float: seconds, latencies are capped here
+    :return: callable(random.Random) -> float
+    """
+    mu = math.log(median)
+
+    def latency(rng):
+        value = rng.lognormvariate(mu, sigma)
+        return value if maximum is None else min(value, maximum)
+    return latency
+
+
+class Faults(object):
+    """
+    Probabilities of the faults injected into the responses of a device, each in [0, 1] per query.
+    """
+
+    def __init__(self, latency=None, drop=0., bad_crc=0., wrong_sequence=0., device_busy=0.):
+        """
+        :param latency: float: seconds or callable(random.Random) -> float, e.g. lognormal_latency(0.002)
+        :param drop: float: the query is executed but not answered
+        :param bad_crc: float: the checksum of the response is wrong
+        :param wrong_sequence: float: the response carries another sequence number than the query
+        :param device_busy: float: the query is answered with device error 2 (device busy) and not executed
+        """
+        if latency is not None and not callable(latency):
+            latency = constant_latency(latency)
+        self.latency = latency
+        self.drop = drop
+        self.bad_crc = bad_crc
+        self.wrong_sequence = wrong_sequence
+        self.device_busy = device_busy
+
+
+class SimulatedDevice(object):
+    """
+    Parameter store and protocol logic of one device. handle() is called with every frame seen on its bus and
+    returns the response or None, endpoints do the I/O.
+    """
+
+    def __init__(self, address=0, metype="TEC", values=None, faults=None, seed=None,
+                 identification="TEC-1091-SV 05.00"):
+        """
+        :param address: int: the device also answers to address 0
+        :param metype: str: the parameters of this catalog are available
+        :param values: dict: {parameter id or (id, instance): value}, other parameters start at 0
+        :param faults: Faults
+        :param seed: int: seed of the fault generator, for repeatable runs
+        :param identification: str: answer to ?IF, at most 20 characters
+        """
+        self.address = address
+        self.catalog = ParameterList(metype)
+        self.faults = faults or Faults()
+        self.identification = identification
+        self.values = {}
+        for key, value in (values or {}).items():
+            self.values[key if isinstance(key, tuple) else (key, 1)] = value
+        self._random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.injected = {DROP: 0, BAD_CRC: 0, WRONG_SEQUENCE: 0, DEVICE_BUSY: 0}
+
+    def _format(self, parameter_id):
+        try:
+            return self.catalog.get_by_id(parameter_id).format
+        except UnknownParameter:
+            return None
+
+    def _encode(self, parameter_id, instance):
+        value = self.values.get((parameter_id, instance), 0)
+        if self._format(parameter_id) == "FLOAT32":
+            return struct.pack(">f", value).hex().upper()
+        return "{:08X}".format(int(value) & 0xFFFFFFFF)
+
+    def _store(self, parameter_id, instance, digits):
+        raw = bytes.fromhex(digits)
+        if self._format(parameter_id) == "FLOAT32":
+            self.values[parameter_id, instance] = struct.unpack(">f", raw)[0]
+        else:
+            self.values[parameter_id, instance] = struct.unpack(">i", raw)[0]
+
+    def _execute(self, payload, query_crc):
+        """
+        :param payload: str: payload of the query
+        :param query_crc: str: checksum of the query, repeated by an ACK
+        :return: str: payload of the response or int: device error code
+        """
+        try:
+            if payload.startswith("?VR"):
+                parameter_id, instance = int(payload[3:7], 16), int(payload[7:9], 16)
+                if self._format(parameter_id) is None:
+                    return EER_PAR_NOT_AVAILABLE
+                return self._encode(parameter_id, instance)
+            if payload.startswith("VS"):
+                parameter_id, instance = int(payload[2:6], 16), int(payload[6:8], 16)
+                if self._format(parameter_id) is None:
+                    return EER_PAR_NOT_AVAILABLE
+                self._store(parameter_id, instance, payload[8:16])
+                return query_crc
+            if payload.startswith("?IF"):
+                return "{:<20}".format(self.identification)[:20]
+            if payload in ("RS", "SP"):
+                return query_crc
+        except ValueError:
+            pass
+        return EER_CMD_NOT_AVAILABLE
+
+    def handle(self, frame):
+        """
+        Process a query frame.
+        :param frame: bytes: "#AASSSS...CCCC" without the carriage return
+        :return: (bytes, float): the response including the carriage return or None, and the latency to apply
+        """
+        try:
+            text = frame.decode()
+            address, sequence = int(text[1:3], 16), int(text[3:7], 16)
+        except ValueError:
+            return None, 0.
+        if text[:1] != "#" or address not in (self.address, 0, 255):
+            return None, 0.
+        # frames with a wrong checksum are ignored like on a real device
+        if _crc(frame[:-4]) != int(text[-4:], 16):
+            return None, 0.
+
+        faults = self.faults
+        rng = self._random
+        with self.lock:
+            self.queries += 1
+            latency = faults.latency(rng) if faults.latency is not None else 0.
+            if faults.device_busy and rng.random() < faults.device_busy:
+                self.injected[DEVICE_BUSY] += 1
+                result = EER_DEVICE_BUSY
+            else:
+                result = self._execute(text[7:-4], text[-4:])
+            if address == 255:
+                # broadcasts are executed but never answered
+                return None, 0.
+            if faults.drop and rng.random() < faults.drop:
+                self.injected[DROP] += 1
+                return None, latency
+            if faults.wrong_sequence and rng.random() < faults.wrong_sequence:
+                self.injected[WRONG_SEQUENCE] += 1
+                sequence = (sequence + 1) & 0xFFFF
+            corrupt = faults.bad_crc and rng.random() < faults.bad_crc
+            if corrupt:
+                self.injected[BAD_CRC] += 1
+
+        response = "!{:02X}{:04X}".format(self.address, sequence)
+        response += "+{:02X}".format(result) if isinstance(result, int) else result
+        # an ACK repeats the checksum of the query
+        if len(response) == 11 and result == text[-4:]:
+            crc = int(result, 16)
+            response = response[:7]
+        else:
+            crc = _crc(response.encode())
+        if corrupt:
+            crc ^= 0x0001
+        return (response + "{:04X}\r".format(crc)).encode(), latency
+
+    def statistics(self):
+        """
+        :return: dict: number of queries and of every injected fault
+        """
+        with self.lock:
+            return dict(self.injected, queries=self.queries)
+
+
+class _Bus(object):
+    """
+    Devices sharing a connection, a frame is offered to every device and at most one answers.
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices) if isinstance(devices, (list, tuple)) else [devices]
+
+    def handle(self, frame):
+        for device in self.devices:
+            response, latency = device.handle(frame)
+            if latency:
+                time.sleep(latency)
+            if response is not None:
+                return response
+        return None
+
+
+def _frames(buffer, data):
+    """
+    Append data to buffer and split off complete frames.
+    :return: ([bytes], bytearray)
+    """
+    buffer += data
+    frames = []
+    while True:
+        end = buffer.find(b"\r")
+        if end < 0:
+            return frames, buffer
+        # anything before the start byte is line noise
+        start = buffer.rfind(b"#", 0, end)
+        if start >= 0:
+            frames.append(bytes(buffer[start:end]))
+        del buffer[:end + 1]
+
+
+class TcpEndpoint(object):
+    """
+    Serves devices on a TCP port of the loopback interface, one thread per client connection.
+    """
+
+    def __init__(self, devices, host="127.0.0.1", port=0):
+        """
+        :param devices: SimulatedDevice or [SimulatedDevice]
+        :param host: str
+        :param port: int: 0 picks a free port, see self.port
+        """
+        self.bus = _Bus(devices)
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(16)
+        self.host, self.port = self._server.getsockname()
+        self._closed = False
+        self._connections = []
+        threading.Thread(target=self._accept, name="mecom-sim-tcp-{}".format(self.port), daemon=True).start()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._connections.append(connection)
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection):
+        buffer = bytearray()
+        try:
+            while True:
+                data = connection.recv(4096)
+                if not data:
+                    return
+                frames, buffer = _frames(buffer, data)
+                for frame in frames:
+                    response = self.bus.handle(frame)
+                    if response is not None:
+                        connection.sendall(response)
+        except OSError:
+            pass
+        finally:
+            connection.close()
+
+    def close(self):
+        self._closed = True
+        self._server.close()
+        for connection in self._connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PtyEndpoint(object):
+    """
+    Serves devices on a pseudo terminal, a serial bus whose port name (self.port) can be opened with MeComSerial.
+    POSIX only.
+    """
+
+    def __init__(self, devices):
+        """
+        :param devices: SimulatedDevice or [SimulatedDevice]
+        """
+        import tty
+        self.bus = _Bus(devices)
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._closed = False
+        threading.Thread(target=self._serve, name="mecom-sim-pty", daemon=True).start()
+
+    def _serve(self):
+        buffer = bytearray()
+        while not self._closed:
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            frames, buffer = _frames(buffer, data)
+            for frame in frames:
+                response = self.bus.handle(frame)
+                if response is not None:
+                    os.write(self._master, response)
+
+    def close(self):
+        self._closed = True
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,177 @@
+"""
+Adaptive per-device timeouts learned from observed round trip times.
+"""
+
+import time
+from collections import deque
+from threading import Lock
+
+from .exceptions import DeviceUnresponsive
+
+
+class _AddressTiming(object):
+    """
+    Round trip time statistics of one device address.
+    """
+
+    def __init__(self, window):
+        self.rtts = deque(maxlen=window)
+        self.new_samples = 0
+        self.percentile = None
+        self.timeouts = 0
+        self.consecutive_failures = 0
+        self.backoff = 1.
+        self.down_since = None
+        self.next_probe = None
+
+
+class AdaptiveTimeout(object):
+    """
+    Tracks the round trip time of every device address and derives a read timeout from it:
+    timeout = percentile(rtt) * factor, bounded by minimum and maximum.
+    Until min_samples round trips are observed, the initial timeout is used. Every timeout doubles the deadline of
+    the address (up to maximum) until the next successful round trip.
+
+    After failures_until_down consecutive timeouts an address is marked as down and queries to it fail immediately
+    with DeviceUnresponsive. There is no dedicated probe query: every probe_interval seconds the next regular query
+    to the address is let through with the current timeout, if it is answered the address is marked as up again.
+    Nothing is sent to an address marked as down while nobody queries it.
+    """
+
+    def __init__(self, initial=1., minimum=0.01, maximum=None, factor=3., percentile=0.99, window=256,
+                 min_samples=8, failures_until_down=3, probe_interval=5.):
+        """
+        :param initial: float: timeout in seconds used for addresses without enough samples
+        :param minimum: float: lower bound of the learned timeout in seconds
+        :param maximum: float: upper bound of the learned timeout in seconds, defaults to initial
+        :param factor: float: safety factor applied to the percentile
+        :param percentile: float: 0 < percentile <= 1
+        :param window: int: number of recent round trips kept per address
+        :param min_samples: int
+        :param failures_until_down: int: consecutive timeouts after which an address is marked as down
+        :param probe_interval: float: seconds between probes of an address marked as down
+        """
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial
+        self.factor = factor
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.failures_until_down = failures_until_down
+        self.probe_interval = probe_interval
+
+        self._lock = Lock()
+        self._addresses = {}
+
+    def _get(self, address):
+        if address not in self._addresses:
+            self._addresses[address] = _AddressTiming(self.window)
+        return self._addresses[address]
+
+    def _learned(self, timing):
+        """
+        Returns the timeout learned from the round trips of an address, the lock must be held by the caller.
+        :param timing: _AddressTiming
+        :return: float
+        """
+        if len(timing.rtts) < self.min_samples:
+            return self.initial
+
+        # sorting the window is only worth it every few samples
+        if timing.percentile is None or timing.new_samples >= max(1, len(timing.rtts) // 16):
+            rtts = sorted(timing.rtts)
+            timing.percentile = rtts[min(len(rtts) - 1, int(self.percentile * len(rtts)))]
+            timing.new_samples = 0
+
+        timeout = timing.percentile * self.factor * timing.backoff
+        # round to milliseconds so the transport does not have to be reconfigured for every tiny change
+        return round(min(self.maximum, max(self.minimum, timeout)), 3)
+
+    def timeout(self, address):
+        """
+        Returns the timeout for the next query to address.
+        Raises DeviceUnresponsive if the address is marked as down and no probe is due.
+        :param address: int
+        :return: float: seconds
+        """
+        with self._lock:
+            timing = self._get(address)
+            if timing.down_since is not None:
+                now = time.monotonic()
+                if now < timing.next_probe:
+                    raise DeviceUnresponsive("device {} is marked as unresponsive".format(address))
+                # let the caller's query through as probe, the next one waits for another interval unless it succeeds
+                timing.next_probe = now + self.probe_interval
+            return self._learned(timing)
+
+    def success(self, address, rtt):
+        """
+        Record a successful round trip.
+        :param address: int
+        :param rtt: float: seconds
+        :return:
+        """
+        with self._lock:
+            timing = self._get(address)
+            timing.rtts.append(rtt)
+            timing.new_samples += 1
+            timing.consecutive_failures = 0
+            timing.backoff = 1.
+            timing.down_since = None
+            timing.next_probe = None
+
+    def failure(self, address):
+        """
+        Record a timed out round trip.
+        :param address: int
+        :return:
+        """
+        with self._lock:
+            timing = self._get(address)
+            timing.timeouts += 1
+            timing.consecutive_failures += 1
+            timing.backoff *= 2.
+            if timing.down_since is None and timing.consecutive_failures >= self.failures_until_down:
+                timing.down_since = time.monotonic()
+                timing.next_probe = timing.down_since + self.probe_interval
+
+    def is_down(self, address):
+        """
+        Returns True if the address is currently marked as unresponsive.
+        :param address: int
+        :return: bool
+        """
+        with self._lock:
+            return address in self._addresses and self._addresses[address].down_since is not None
+
+    def reset(self, address=None):
+        """
+        Forget everything learned about one or all addresses.
+        :param address: int or None for all addresses
+        :return:
+        """
+        with self._lock:
+            if address is None:
+                self._addresses = {}
+            else:
+                self._addresses.pop(address, None)
+
+    def statistics(self):
+        """
+        Returns the learned values per address, e.g. for tuning minimum, maximum and factor.
+        :return: {int: dict}
+        """
+        with self._lock:
+            result = {}
+            for address, timing in sorted(self._addresses.items()):
+                rtts = sorted(timing.rtts)
+                result[address] = {
+                    "samples": len(rtts),
+                    "rtt_median": rtts[len(rtts) // 2] if rtts else None,
+                    "rtt_max": rtts[-1] if rtts else None,
+                    "timeout": self._learned(timing),
+                    "timeouts": timing.timeouts,
+                    "down": timing.down_since is not None,
+                }
+            return result
@@ -0,0 +1,156 @@
+"""
+Deterministic streaming of setpoint waveforms, e.g. "Target Object Temperature" ramps on a TEC or "Current CW"
+sequences on a LDD.
+"""
+
+import logging
+import time
+
+from .mecom import VS
+
+logger = logging.getLogger(__name__)
+
+
+class WaveformReport(object):
+    """
+    Timing of every sample sent by WaveformStreamer.stream(). Times are seconds relative to the start of the stream.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.scheduled = []
+        self.sent = []
+        self.acknowledged = []
+        self.values = []
+        self.skipped = []
+
+    def add(self, scheduled, sent, acknowledged, value):
+        self.scheduled.append(scheduled)
+        self.sent.append(sent)
+        self.acknowledged.append(acknowledged)
+        self.values.append(value)
+
+    @property
+    def errors(self):
+        """
+        Returns the timing error (sent - scheduled) of every sent sample.
+        :return: [float]
+        """
+        return [sent - scheduled for scheduled, sent in zip(self.scheduled, self.sent)]
+
+    def summary(self):
+        """
+        Returns timing error and acknowledge latency statistics.
+        :return: dict
+        """
+        errors = sorted(abs(e) for e in self.errors)
+        latencies = sorted(ack - sent for sent, ack in zip(self.sent, self.acknowledged))
+        if not errors:
+            return {"samples": 0, "skipped": len(self.skipped)}
+        return {"samples": len(errors),
+                "skipped": len(self.skipped),
+                "error_mean": sum(errors) / len(errors),
+                "error_p99": errors[min(len(errors) - 1, int(0.99 * len(errors)))],
+                "error_max": errors[-1],
+                "ack_latency_mean": sum(latencies) / len(latencies),
+                "ack_latency_max": latencies[-1]}
+
+
+class WaveformStreamer(object):
+    """
+    Sends a sequence of setpoints as VS queries at fixed intervals. Sample i is scheduled at start + i * interval
+    on the monotonic clock, so delays of single samples do not accumulate into drift.
+
+    lead seconds before a sample is due the bus is reserved (with the given priority), the remaining time is slept
+    coarsely and the last spin seconds are busy waited, so neither other threads on the bus nor sleep granularity
+    delay the write. The acknowledgement is read right after the write, within the slack of the interval.
+    """
+
+    def __init__(self, mc, parameter_name=None, interval=0.1, address=0, parameter_instance=1, parameter_id=None,
+                 priority=None, lead=0.005, spin=0.001, max_lateness=None):
+        """
+        :param mc: MeComSerial or MeComTcp
+        :param parameter_name: str
+        :param interval: float: seconds between samples
+        :param address: int
+        :param parameter_instance: int
+        :param parameter_id: int: alternative to parameter_name
+        :param priority: int: priority of the bus reservation if the connection uses a priority queue
+        :param lead: float: seconds the bus is reserved before a sample is due
+        :param spin: float: seconds busy waited before a sample is due
+        :param max_lateness: float: samples later than this are skipped instead of sent, None sends every sample
+        """
+        self.mc = mc
+        self.parameter = mc._find_parameter(parameter_name, parameter_id, address)
+        self.interval = interval
+        self.address = address
+        self.parameter_instance = parameter_instance
+        self.priority = priority
+        self.lead = lead
+        self.spin = spin
+        self.max_lateness = max_lateness
+
+    def _wait(self, deadline):
+        """
+        Sleep until shortly before deadline, then busy wait.
+        :param deadline: float: time.perf_counter() value
+        :return:
+        """
+        remaining = deadline - time.perf_counter()
+        if remaining > self.spin:
+            time.sleep(remaining - self.spin)
+        while time.perf_counter() < deadline:
+            pass
+
+    def stream(self, setpoints, start=None, final_value=None):
+        """
+        Send all setpoints, blocks until the last one is acknowledged. Device errors and timeouts abort the stream.
+        :param setpoints: iterable of int or float, e.g. a list, numpy array or generator
+        :param start: float: time.perf_counter() value of the first sample, defaults to now + lead
+        :param final_value: int or float: sent once after the last sample, also if the stream is aborted
+        :return: WaveformReport
+        """
+        report = WaveformReport(self.interval)
+        if start is None:
+            start = time.perf_counter() + self.lead
+        mc = self.mc
+
+        aborted = True
+        try:
+            for i, value in enumerate(setpoints):
+                due = start + i * self.interval
+                # build the query before waiting, only composing it remains inside the deadline
+                vs = VS(value=value, parameter=self.parameter, address=self.address,
+                        parameter_instance=self.parameter_instance)
+
+                self._wait(due - self.lead)
+                if self.max_lateness is not None and time.perf_counter() - due > self.max_lateness:
+                    report.skipped.append(i)
+                    continue
+
+                mc._acquire(self.priority)
+                try:
+                    self._wait(due)
+                    sent = time.perf_counter()
+                    response_frame = mc._transact(vs)
+                    acknowledged = time.perf_counter()
+                finally:
+                    mc.lock.release()
+
+                mc._set_response(vs, response_frame)
+                mc._raise(vs)
+                report.add(due - start, sent - start, acknowledged - start, value)
+            aborted = False
+        finally:
+            if final_value is not None:
+                try:
+                    mc.set_parameter(value=final_value, parameter_id=self.parameter.id, address=self.address,
+                                     parameter_instance=self.parameter_instance, priority=self.priority)
+                except Exception:
+                    if not aborted:
+                        raise
+                    # the error which aborted the stream is the one raised
+                    logger.exception("device {}: final value {} not sent after the stream was aborted".format(
+                        self.address, final_value))
+
+        return report
@@ -5,6 +5,8 @@ setup(
     version='1.1',
     packages=['mecom'],
     install_requires = ['pySerial>=3.4'],
+    extras_require={'numpy': ['numpy']},
+    entry_points={'console_scripts': ['mecom=mecom.cli:main']},
     url='https://github.com/meerstetter/pyMeCom',
     license='MIT',
     author='Suthep Pomjaksilp',
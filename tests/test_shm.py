@@ -0,0 +1,48 @@
+"""
+Shared memory tables read from independent processes, run with "python -m pytest tests".
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from mecom.shm import ValueTablePublisher  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READER = """
+import sys
+from mecom.shm import ValueTableReader
+reader = ValueTableReader(sys.argv[1])
+print(reader.get("dev1", "Object Temperature")[0])
+reader.close()
+"""
+
+
+def _read_in_new_process(name):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    return subprocess.run([sys.executable, "-c", READER, name], env=env, capture_output=True, text=True, timeout=60)
+
+
+def test_sequential_reader_processes():
+    publisher = ValueTablePublisher(["dev1", "dev2"], ["Object Temperature", "Device Status"])
+    try:
+        publisher.update("dev1", "Object Temperature", 25.5)
+        # a reader exiting must not remove the table for the next one
+        for _ in range(2):
+            result = _read_in_new_process(publisher.name)
+            assert result.returncode == 0, result.stderr
+            assert float(result.stdout) == 25.5
+            assert "leaked shared_memory" not in result.stderr
+    finally:
+        publisher.close()
+
+
+def test_close_after_unlink():
+    publisher = ValueTablePublisher(["dev1"], ["Object Temperature"])
+    publisher._shm.unlink()
+    publisher.close()